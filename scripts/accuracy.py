@@ -0,0 +1,255 @@
+import json
+import os
+import time
+
+import cv2 as cv
+import numpy as np
+
+from benchmark import make_synthetic_clip
+from src.tracking import StaticObject, Buildings, EventLog, Pawns, RedetectScheduler, ScoreBoard, TrackingExecutor
+from src.utils.buffers import BufferPool
+from src.utils.truth import GroundTruth
+from track import CLIP_DIRS, UPLOAD_DIR, get_clip_name, analyze_frame, build_objects, build_scheduler
+
+# every mode is compared against the baseline, the keys are the keyword arguments of replay
+MODES = {
+    "baseline": {},
+    "staggered": {"stagger": True},
+    "budgeted": {"stagger": True, "budget": 0.02},
+    "rectified": {"rectify_scale": 0.5},
+    "components": {"pawn_method": "components"},
+}
+
+
+def get_state(statics: list[StaticObject]) -> dict:
+    """
+    Returns the state of the game as reported by the analyzers, in the ground truth format
+
+    :param statics: Static objects
+    :type statics: list[StaticObject]
+    :return: Score, building ownership and pawn counts per clearing, None where not reported yet
+    :rtype: dict
+    """
+    score_board = next(obj for obj in statics if isinstance(obj, ScoreBoard))
+    buildings = next(obj for obj in statics if isinstance(obj, Buildings))
+    pawns = next(obj for obj in statics if isinstance(obj, Pawns))
+    clearings = range(len(pawns.static_contours))
+
+    return {
+        "score": list(score_board.current_score) if score_board.current_score is not None else None,
+        "buildings": {"orange": list(buildings.orange_buildings), "blue": list(buildings.blue_buildings)},
+        "pawns": {"orange": [len(pawns.orange_pawns.get(i, [])) for i in clearings],
+                  "blue": [len(pawns.blue_pawns.get(i, [])) for i in clearings]},
+    }
+
+
+def replay(path: str, stagger=False, budget: float | None = None, rectify_scale: float | None = None,
+           pawn_method="contours", workers=0, board_ref: np.ndarray | None = None,
+           card_ref: np.ndarray | None = None) -> tuple[list[dict], list[dict], float]:
+    """
+    Analyzes the clip headlessly and collects the state of the game after every frame
+
+    :param path: Path of the clip
+    :type path: str
+    :param stagger: Whether the re-detections are staggered, defaults to False
+    :type stagger: bool, optional
+    :param budget: Time budget of the re-detections of a frame in seconds, implies staggering, defaults to None
+    :type budget: float | None, optional
+    :param rectify_scale: Scale of the rectified board, defaults to None
+    :type rectify_scale: float | None, optional
+    :param pawn_method: Blob extraction method of the pawns, "contours" or "components", defaults to "contours"
+    :type pawn_method: str, optional
+    :param workers: Number of the tracker threads, defaults to 0
+    :type workers: int, optional
+    :param board_ref: Reference of the board, defaults to the reference of the real clips
+    :type board_ref: np.ndarray | None, optional
+    :param card_ref: Reference of the card, defaults to the reference of the real clips
+    :type card_ref: np.ndarray | None, optional
+    :return: State after every frame, emitted events, analyzed frames per second
+    :rtype: tuple[list[dict], list[dict], float]
+    """
+    reader = cv.VideoCapture(path)
+    tracked, statics = build_objects(rectify_scale, board_ref, card_ref)
+
+    for obj in statics:
+        if isinstance(obj, Pawns):
+            obj.method = pawn_method
+
+    stagger = stagger or budget is not None
+    scheduler = build_scheduler(tracked, statics, budget) if stagger else RedetectScheduler()
+    events = EventLog(reader.get(cv.CAP_PROP_FPS))
+    pool = BufferPool()
+    states = []
+    elapsed = 0.0
+    frame = None
+
+    try:
+        with TrackingExecutor(workers) as executor:
+            while True:
+                start = time.perf_counter()
+                ret, frame = reader.read(frame)
+
+                if not ret:
+                    break
+
+                analyze_frame(frame, len(states), tracked, statics, executor, scheduler, events,
+                              first=not states, headless=True, pool=pool)
+                elapsed += time.perf_counter() - start
+
+                states.append(get_state(statics))
+    finally:
+        reader.release()
+
+    return states, events.records, len(states) / elapsed if elapsed > 0 else 0.0
+
+
+def compare_states(states: list[dict], truth: GroundTruth, settle=30) -> dict:
+    """
+    Compares the states with the ground truth. The frames within the settle period after a change of the ground truth
+    are skipped, as the analyzers smooth their results over the last frames
+
+    :param states: State after every frame
+    :type states: list[dict]
+    :param truth: Ground truth of the clip
+    :type truth: GroundTruth
+    :param settle: Number of frames skipped after every change, defaults to 30
+    :type settle: int, optional
+    :return: Number of compared frames, ratio of frames with the exact score, buildings and pawns,
+        mean absolute error of the pawn counts per clearing
+    :rtype: dict
+    """
+    score, buildings, pawns, pawn_errors = [], [], [], []
+
+    for frame_id, state in enumerate(states):
+        expected = truth.state(frame_id)
+
+        if expected is None or truth.frames_since_change(frame_id) < settle:
+            continue
+
+        score.append(state["score"] == list(expected["score"]))
+        buildings.append(state["buildings"] == expected["buildings"])
+        pawns.append(state["pawns"] == expected["pawns"])
+
+        for faction in ("orange", "blue"):
+            counts = np.array(state["pawns"][faction])
+            pawn_errors.append(np.abs(counts - np.array(expected["pawns"][faction])).mean())
+
+    def ratio(matches: list[bool]) -> float | None:
+        return float(np.mean(matches)) if matches else None
+
+    return {"frames": len(score), "score": ratio(score), "buildings": ratio(buildings), "pawns": ratio(pawns),
+            "pawns_mae": float(np.mean(pawn_errors)) if pawn_errors else None}
+
+
+def compare_events(events: list[dict], truth: GroundTruth, tolerance: int) -> dict:
+    """
+    Compares the detected events with the ground truth events. A detected event is correct if it falls into
+    an event of its object extended by the tolerance, an event is found if at least one detected event falls into it
+
+    :param events: Detected events
+    :type events: list[dict]
+    :param truth: Ground truth of the clip
+    :type truth: GroundTruth
+    :param tolerance: Number of frames the events are extended by on both sides
+    :type tolerance: int
+    :return: Precision and recall of the events
+    :rtype: dict
+    """
+    kinds = {event["object"] for event in truth.events}
+    detected = [event for event in events if any(event["object"].startswith(kind) for kind in kinds)]
+    found = set()
+    correct = 0
+
+    for event in detected:
+        matches = [i for i, expected in enumerate(truth.events)
+                   if event["object"].startswith(expected["object"])
+                   and expected["start"] - tolerance <= event["frame"] < expected["stop"] + tolerance]
+
+        correct += bool(matches)
+        found.update(matches)
+
+    return {"detected": len(detected), "expected": len(truth.events),
+            "precision": correct / len(detected) if detected else 1.0,
+            "recall": len(found) / len(truth.events) if truth.events else 1.0}
+
+
+def evaluate(path: str, truth: GroundTruth, modes: dict[str, dict] | None = None, settle=30,
+             tolerance: int | None = None, board_ref: np.ndarray | None = None,
+             card_ref: np.ndarray | None = None) -> dict[str, dict]:
+    """
+    Replays the clip in every mode and reports the accuracy next to the throughput
+
+    :param path: Path of the clip
+    :type path: str
+    :param truth: Ground truth of the clip
+    :type truth: GroundTruth
+    :param modes: Keyword arguments of replay by the name of the mode, defaults to MODES
+    :type modes: dict[str, dict] | None, optional
+    :param settle: Number of frames skipped after every change of the state, defaults to 30
+    :type settle: int, optional
+    :param tolerance: Number of frames the events are extended by, defaults to one second
+    :type tolerance: int | None, optional
+    :param board_ref: Reference of the board, defaults to the reference of the real clips
+    :type board_ref: np.ndarray | None, optional
+    :param card_ref: Reference of the card, defaults to the reference of the real clips
+    :type card_ref: np.ndarray | None, optional
+    :return: Frames per second, state and event accuracy of every mode
+    :rtype: dict[str, dict]
+    """
+    modes = modes if modes is not None else MODES
+    tolerance = tolerance if tolerance is not None else int(round(truth.fps or 24))
+    results = {}
+
+    for name, options in modes.items():
+        print(f"Replaying {path} in the {name} mode")
+        states, events, fps = replay(path, board_ref=board_ref, card_ref=card_ref, **options)
+        results[name] = {"fps": fps, "states": compare_states(states, truth, settle),
+                         "events": compare_events(events, truth, tolerance)}
+
+    print(f"\n{'mode':<12} {'fps':>7} {'score':>7} {'build':>7} {'pawns':>7} {'mae':>7} {'prec':>7} {'recall':>7}")
+    for name, result in results.items():
+        states, events = result["states"], result["events"]
+        values = [states["score"], states["buildings"], states["pawns"], states["pawns_mae"],
+                  events["precision"], events["recall"]]
+        print(f"{name:<12} {result['fps']:>7.1f} " + " ".join("      -" if value is None else f"{value:>7.3f}"
+                                                            for value in values))
+
+    return results
+
+
+def run_accuracy(diff: str | None = None, idx=0, modes: dict[str, dict] | None = None, frames=240,
+                 report_path: str | None = f"{UPLOAD_DIR}/accuracy.json") -> dict[str, dict]:
+    """
+    Evaluates a real clip against its ground truth file next to it ({clip}.truth.json),
+    or a synthetic clip if no difficulty is given
+
+    :param diff: Difficulty of the real clip, defaults to None
+    :type diff: str | None, optional
+    :param idx: Index of the real clip, defaults to 0
+    :type idx: int, optional
+    :param modes: Keyword arguments of replay by the name of the mode, defaults to MODES
+    :type modes: dict[str, dict] | None, optional
+    :param frames: Number of frames of the synthetic clip, defaults to 240
+    :type frames: int, optional
+    :param report_path: Path of the JSON report, None to not save it, defaults to results/accuracy.json
+    :type report_path: str | None, optional
+    :return: Frames per second, state and event accuracy of every mode
+    :rtype: dict[str, dict]
+    """
+    if diff is None:
+        path, clip = make_synthetic_clip((1280, 960), frames)
+        results = evaluate(path, clip.ground_truth(), modes, board_ref=clip.ref, card_ref=clip.card)
+    else:
+        path = f"{CLIP_DIRS[diff]}/{get_clip_name(idx)}.mp4"
+        results = evaluate(path, GroundTruth.load(f"{CLIP_DIRS[diff]}/{get_clip_name(idx)}.truth.json"), modes)
+
+    if report_path is not None:
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return results
+
+
+if __name__ == "__main__":
+    run_accuracy()
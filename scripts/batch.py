@@ -0,0 +1,125 @@
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2 as cv
+
+from track import DIFFICULTIES, UPLOAD_DIR, get_clip_name, make_clip, convert_to_mp4
+
+MANIFEST_PATH = f"{UPLOAD_DIR}/manifest.json"
+
+
+def get_outputs(diff: str, idx: int, headless: bool) -> list[str]:
+    clip_name = f"{diff}_{get_clip_name(idx)}"
+    outputs = [f"{UPLOAD_DIR}/{clip_name}.events.jsonl", f"{UPLOAD_DIR}/{clip_name}.states.jsonl",
+               f"{UPLOAD_DIR}/{clip_name}.timeline"]
+
+    if not headless:
+        outputs.append(f"{UPLOAD_DIR}/{clip_name}.mp4")
+
+    return outputs
+
+
+def load_manifest(path: str) -> dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict[str, dict], path: str) -> None:
+    # the manifest is replaced atomically, so an interrupted run never leaves it half written
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def init_worker(cv_threads: int) -> None:
+    # every worker gets its share of the cores, otherwise the OpenCV thread pools oversubscribe them
+    cv.setNumThreads(cv_threads)
+
+
+def process_clip(diff: str, idx: int, headless: bool, encoder: str) -> dict:
+    start = time.time()
+
+    try:
+        ok = make_clip(diff, idx, headless=headless, encoder=encoder)
+
+        if ok and not headless and encoder != "ffmpeg":
+            convert_to_mp4(diff, idx)
+
+        missing = [path for path in get_outputs(diff, idx, headless) if not os.path.exists(path)]
+
+        if not ok:
+            status, error = "failed", "Failed to load the clip"
+        elif missing:
+            status, error = "failed", f"Missing outputs: {missing}"
+        else:
+            status, error = "done", None
+    except Exception:
+        status, error = "failed", traceback.format_exc()
+
+    return {"status": status, "seconds": round(time.time() - start, 2), "outputs": get_outputs(diff, idx, headless),
+            "error": error}
+
+
+def run_batch(clips: list[tuple[str, int]], workers: int | None = None, headless=False, encoder="ffmpeg",
+              manifest_path=MANIFEST_PATH) -> dict[str, dict]:
+    """
+    Processes the clips on a pool of processes, the manifest records the status of every clip,
+    so that an interrupted run only processes the clips that are not done yet
+
+    :param clips: Clips to be processed (difficulty, index)
+    :type clips: list[tuple[str, int]]
+    :param workers: Number of worker processes, defaults to the number of cores
+    :type workers: int | None, optional
+    :param headless: Whether to only produce the event streams, defaults to False
+    :type headless: bool, optional
+    :param encoder: Encoder of the videos, "ffmpeg" or "opencv", defaults to "ffmpeg"
+    :type encoder: str, optional
+    :param manifest_path: Path of the manifest, defaults to MANIFEST_PATH
+    :type manifest_path: str, optional
+    :return: Manifest of the clips
+    :rtype: dict[str, dict]
+    """
+    manifest = load_manifest(manifest_path)
+    pending = [(diff, idx) for diff, idx in clips
+               if manifest.get(f"{diff}_{get_clip_name(idx)}", {}).get("status") != "done"
+               or not all(os.path.exists(path) for path in get_outputs(diff, idx, headless))]
+
+    if not pending:
+        print("All clips are done")
+        return manifest
+
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, len(pending))
+    cv_threads = max(1, cores // workers)
+
+    print(f"Processing {len(pending)} clips on {workers} workers with {cv_threads} OpenCV threads each")
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cv_threads,)) as pool:
+        futures = {}
+
+        for diff, idx in pending:
+            clip_name = f"{diff}_{get_clip_name(idx)}"
+            futures[pool.submit(process_clip, diff, idx, headless, encoder)] = clip_name
+            manifest[clip_name] = {"status": "pending"}
+
+        save_manifest(manifest, manifest_path)
+
+        for future in as_completed(futures):
+            clip_name = futures[future]
+            manifest[clip_name] = future.result()
+            save_manifest(manifest, manifest_path)
+
+            print(f"{clip_name}: {manifest[clip_name]['status']} in {manifest[clip_name]['seconds']}s")
+
+    return manifest
+
+
+if __name__ == "__main__":
+    run_batch([(difficulty, i) for difficulty in DIFFICULTIES for i in range(3)])
@@ -0,0 +1,217 @@
+import json
+import os
+import statistics
+import time
+
+import cv2 as cv
+
+from src.detection.elements import detect_clearings_and_buildings, detect_dice_tray, detect_dice_tray_in_roi, \
+    detect_pawns, detect_pawns_labeled, detect_score_board
+from src.detection.game import calculate_current_buildings_control, calculate_current_score
+from src.tracking import TrackedObject, StaticObject, EventLog, RedetectScheduler, TrackingExecutor
+from src.utils.context import FrameContext
+from src.utils.profiling import Profiler
+from src.utils.synthetic import SyntheticClip, make_card_back, make_reference_board
+from track import DATA_DIR, UPLOAD_DIR, analyze_frame, build_objects, make_writer, record
+
+SYNTHETIC_DIR = f"{DATA_DIR}/synthetic"
+RESOLUTIONS = {"960p": (1280, 960), "1440p": (1920, 1440), "2880p": (3840, 2880)}
+
+
+def make_synthetic_clip(size: tuple[int, int], frames=240, seed=0) -> tuple[str, SyntheticClip]:
+    """
+    Lays out the synthetic clip and renders it, unless a clip with the same parameters was already rendered
+
+    :param size: Size of the frames (width, height)
+    :type size: tuple[int, int]
+    :param frames: Number of frames, defaults to 240
+    :type frames: int, optional
+    :param seed: Seed of the clip, defaults to 0
+    :type seed: int, optional
+    :return: Path of the clip, the clip
+    :rtype: tuple[str, SyntheticClip]
+    """
+    mask = cv.imread(f"{DATA_DIR}/game_data/board_mask.png")
+    ref = make_reference_board(cv.imread(f"{DATA_DIR}/game_data/board.jpg"), mask)
+    clip = SyntheticClip(ref, mask, make_card_back(seed=seed), size, frames, seed=seed)
+    path = f"{SYNTHETIC_DIR}/clip_{size[0]}x{size[1]}_{frames}_{seed}.mp4"
+
+    if not os.path.exists(path):
+        print(f"Rendering {path}")
+        os.makedirs(SYNTHETIC_DIR, exist_ok=True)
+        clip.write(path)
+
+    return path, clip
+
+
+def time_call(fn, repeat=20, warm_up=2) -> float:
+    """
+    Measures the median duration of the call
+
+    :param fn: Function called without arguments
+    :type fn: Callable
+    :param repeat: Number of measured calls, defaults to 20
+    :type repeat: int, optional
+    :param warm_up: Number of calls before the measurement, defaults to 2
+    :type warm_up: int, optional
+    :return: Median duration in µs
+    :rtype: float
+    """
+    for _ in range(warm_up):
+        fn()
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+
+    return statistics.median(durations) * 1e6
+
+
+def benchmark_functions(clip: SyntheticClip, frame_id: int, tracked: list[TrackedObject],
+                        statics: list[StaticObject], repeat=20) -> dict[str, float]:
+    """
+    Measures the detection functions on a single frame of the clip, with the arguments the analyzers pass them.
+    Every call gets a fresh frame context, so the times include the color conversions the function needs,
+    which the analyzers share within a frame and which are measured on their own
+
+    :param clip: Synthetic clip
+    :type clip: SyntheticClip
+    :param frame_id: Index of the measured frame
+    :type frame_id: int
+    :param tracked: Tracked objects
+    :type tracked: list[TrackedObject]
+    :param statics: Static objects
+    :type statics: list[StaticObject]
+    :param repeat: Number of measured calls of each function, defaults to 20
+    :type repeat: int, optional
+    :return: Median duration of each function in µs
+    :rtype: dict[str, float]
+    """
+    frame = clip.render(frame_id)
+    card, dice_1, _ = tracked
+    board, dice_tray, card_pile, score_board, buildings, pawns = statics
+
+    # the objects are initialized on the measured frame the same way as at the start of a clip
+    with TrackingExecutor() as executor:
+        analyze_frame(frame, frame_id, tracked, statics, executor, RedetectScheduler(), EventLog(clip.fps),
+                      first=True, headless=True)
+
+    orange = (StaticObject.LOWER_ORANGE, StaticObject.UPPER_ORANGE)
+    blue = (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE)
+    clearings = pawns.geometry.group("clearings")
+    clearings_mask = clearings.mask(frame.shape)
+    tray_roi = dice_tray._get_roi(frame.shape)
+    mask = pawns.static_mask
+
+    functions = {
+        "cvtColor (gray)": lambda: cv.cvtColor(frame, cv.COLOR_BGR2GRAY),
+        "cvtColor (hsv)": lambda: cv.cvtColor(frame, cv.COLOR_BGR2HSV),
+        "ReferenceMatcher.match (board)": lambda: board.matcher.match(frame, board.distance),
+        "ReferenceMatcher.match (card)": lambda: card_pile.matcher.match(frame, card_pile.distance),
+        "Board.update (optical flow)": lambda: board.update(frame, FrameContext(frame)),
+        "detect_dice_tray": lambda: detect_dice_tray(frame, dice_tray.threshold),
+        "detect_dice_tray_in_roi": lambda: detect_dice_tray_in_roi(frame, tray_roi, dice_tray.threshold),
+        "detect_score_board": lambda: detect_score_board(board.ref, score_board.mask),
+        "detect_clearings_and_buildings": lambda: detect_clearings_and_buildings(mask),
+        "detect_pawns": lambda: detect_pawns(frame, clearings_mask, pawns.contours, orange, blue,
+                                             pawns.diff_sensitivity, pawns.area_sensitivity, FrameContext(frame)),
+        "detect_pawns_labeled (contours)": lambda: detect_pawns_labeled(
+            frame, clearings, pawns.contours, orange, blue, pawns.diff_sensitivity, pawns.area_sensitivity,
+            FrameContext(frame), "contours"),
+        "detect_pawns_labeled (components)": lambda: detect_pawns_labeled(
+            frame, clearings, pawns.contours, orange, blue, pawns.diff_sensitivity, pawns.area_sensitivity,
+            FrameContext(frame), "components"),
+        "calculate_current_score": lambda: calculate_current_score(
+            frame, score_board.cell_contours, orange, blue, FrameContext(frame), score_board.cell_labels),
+        "calculate_current_buildings_control": lambda: calculate_current_buildings_control(
+            frame, buildings.building_contours, orange, blue, ctx=FrameContext(frame),
+            labels=buildings.building_labels),
+        "tracker update (CSRT)": lambda: dice_1.tracker.update(frame),
+    }
+
+    return {name: time_call(fn, repeat) for name, fn in functions.items()}
+
+
+def benchmark_record(path: str, clip: SyntheticClip, headless=True, encoder="ffmpeg") -> dict:
+    """
+    Measures the whole record loop over the clip
+
+    :param path: Path of the clip
+    :type path: str
+    :param clip: Synthetic clip
+    :type clip: SyntheticClip
+    :param headless: Whether only the analysis is measured, without drawing and encoding, defaults to True
+    :type headless: bool, optional
+    :param encoder: Encoder of the annotated video, "ffmpeg" or "opencv", defaults to "ffmpeg"
+    :type encoder: str, optional
+    :return: Number of frames, frames per second and the profile of the stages
+    :rtype: dict
+    """
+    reader = cv.VideoCapture(path)
+    writer = None if headless else make_writer(f"synthetic_{clip.size[0]}x{clip.size[1]}", clip.fps, clip.size,
+                                               encoder)
+    tracked, statics = build_objects(board_ref=clip.ref, card_ref=clip.card)
+    profiler = Profiler()
+
+    start = time.perf_counter()
+    try:
+        record(reader, writer, tracked, statics, profiler=profiler)
+    finally:
+        reader.release()
+        if writer is not None:
+            writer.release()
+    elapsed = time.perf_counter() - start
+
+    frames = len(profiler.durations.get("frame", {}).get("total", []))
+    return {"frames": frames, "seconds": elapsed, "fps": frames / elapsed, "profile": profiler.report()}
+
+
+def run_benchmark(resolutions: dict[str, tuple[int, int]] | None = None, frames=240, repeat=20, headless=True,
+                  encoder="ffmpeg", seed=0, report_path: str | None = f"{UPLOAD_DIR}/benchmark.json") -> dict:
+    """
+    Benchmarks the detection functions and the record loop on synthetic clips of every resolution
+
+    :param resolutions: Frame sizes (width, height) by name, defaults to RESOLUTIONS
+    :type resolutions: dict[str, tuple[int, int]] | None, optional
+    :param frames: Number of frames of each clip, defaults to 240
+    :type frames: int, optional
+    :param repeat: Number of measured calls of each function, defaults to 20
+    :type repeat: int, optional
+    :param headless: Whether the record loop skips drawing and encoding, defaults to True
+    :type headless: bool, optional
+    :param encoder: Encoder of the annotated videos, defaults to "ffmpeg"
+    :type encoder: str, optional
+    :param seed: Seed of the clips, defaults to 0
+    :type seed: int, optional
+    :param report_path: Path of the JSON report, None to not save it, defaults to results/benchmark.json
+    :type report_path: str | None, optional
+    :return: Function durations in µs and record results of each resolution
+    :rtype: dict
+    """
+    resolutions = resolutions if resolutions is not None else RESOLUTIONS
+    report = {"opencv_threads": cv.getNumThreads(), "cpu_count": os.cpu_count(), "resolutions": {}}
+
+    for name, size in resolutions.items():
+        path, clip = make_synthetic_clip(size, frames, seed)
+
+        functions = benchmark_functions(clip, clip.frames // 2, *build_objects(board_ref=clip.ref,
+                                                                              card_ref=clip.card), repeat=repeat)
+        loop = benchmark_record(path, clip, headless, encoder)
+        report["resolutions"][name] = {"size": size, "functions": functions, "record": loop}
+
+        print(f"\n{name} ({size[0]}x{size[1]}): {loop['fps']:.1f} frames/sec over {loop['frames']} frames")
+        for function, us in functions.items():
+            print(f"  {function:<40} {us:>12.0f} µs")
+
+    if report_path is not None:
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,120 @@
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.tracking import TrackedObject, StaticObject, EventLog, TrackingExecutor
+from src.utils.buffers import BufferPool
+from src.utils.profiling import Profiler
+from src.utils.video import LiveSource
+from track import CLIP_DIRS, NULL_PROFILER, get_clip_name, analyze_frame, build_objects, build_scheduler
+
+
+def run_live(source: LiveSource, tracked: list[TrackedObject], statics: list[StaticObject], latency_target=0.25,
+             max_cadence=8, writer: cv.VideoWriter | None = None, show=False, report_every=1.0,
+             profiler: Profiler | None = None) -> dict:
+    """
+    Analyzes the live source in real time. The source only keeps the freshest frame, so the frames the analysis
+    has no time for are dropped. Whenever the lag behind the source exceeds the latency target, the static analyzers
+    detect their events only on every n-th analyzed frame, while the trackers keep being fed every frame
+
+    :param source: Live source
+    :type source: LiveSource
+    :param tracked: Tracked objects
+    :type tracked: list[TrackedObject]
+    :param statics: Static objects
+    :type statics: list[StaticObject]
+    :param latency_target: Target lag between capturing and finishing a frame in seconds, defaults to 0.25
+    :type latency_target: float, optional
+    :param max_cadence: Maximum number of analyzed frames per static analysis, defaults to 8
+    :type max_cadence: int, optional
+    :param writer: Writer of the annotated frames, defaults to None
+    :type writer: cv.VideoWriter | None, optional
+    :param show: Whether to show the annotated frames in a window, "q" stops the analysis, defaults to False
+    :type show: bool, optional
+    :param report_every: Seconds between the printed summaries, 0 to disable them, defaults to 1.0
+    :type report_every: float, optional
+    :param profiler: Profiler of the analysis, also counting the dropped frames, defaults to None
+    :type profiler: Profiler | None, optional
+    :return: Number of analyzed and dropped frames, achieved frame rate and lag percentiles in seconds
+    :rtype: dict
+    """
+    headless = writer is None and not show
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    executor = TrackingExecutor(workers=len(tracked))
+    scheduler = build_scheduler(tracked, statics)
+    events = EventLog(source.fps)
+    # an overlay is only reused once the writer encoded it, a threaded writer holds up to its depth of them
+    pool = BufferPool({"overlay": getattr(writer, "depth", 0) + 2})
+
+    lags = []
+    cadence = 1
+    started = last_report = time.perf_counter()
+
+    try:
+        while True:
+            ret, frame, frame_id, captured = source.read()
+
+            if not ret:
+                break
+
+            # the wait for the next frame of the source is not part of the frame time
+            frame_start = time.perf_counter()
+            tick = len(lags)
+            frame = analyze_frame(frame, frame_id, tracked, statics, executor, scheduler, events, first=tick == 0,
+                                  headless=headless, static_events=tick % cadence == 0, tick=tick,
+                                  profiler=profiler, pool=pool)
+
+            if writer is not None:
+                with profiler.time("encode", "writer"):
+                    writer.write(frame)
+
+            if show:
+                cv.imshow("live", frame)
+                if cv.waitKey(1) & 0xFF == ord("q"):
+                    break
+
+            now = time.perf_counter()
+            lags.append(now - captured)
+
+            profiler.add("frame", "total", now - frame_start)
+            profiler.frame_done()
+
+            # the static analysis backs off while behind and recovers once the lag is well within the target
+            if lags[-1] > latency_target:
+                cadence = min(cadence * 2, max_cadence)
+            elif lags[-1] < latency_target / 2 and cadence > 1:
+                cadence //= 2
+
+            if report_every and now - last_report >= report_every:
+                print(f"fps: {len(lags) / (now - started):.1f} | lag: {lags[-1] * 1000:.0f} ms | "
+                      f"dropped: {source.dropped} | static cadence: {cadence}")
+                last_report = now
+    finally:
+        executor.shutdown()
+
+        profiler.count("frames_dropped", source.dropped)
+
+        if show:
+            cv.destroyAllWindows()
+
+    elapsed = time.perf_counter() - started
+    percentiles = np.percentile(lags, [50, 95, 99]) if lags else [0.0, 0.0, 0.0]
+
+    return {"analyzed": len(lags), "dropped": source.dropped, "source_fps": source.fps,
+            "fps": len(lags) / elapsed if elapsed > 0 else 0.0,
+            "lag_p50": float(percentiles[0]), "lag_p95": float(percentiles[1]), "lag_p99": float(percentiles[2]),
+            "lag_max": max(lags, default=0.0), "events": events.records}
+
+
+if __name__ == "__main__":
+    # a clip replayed at its native frame rate stands in for a camera, a camera index works the same way
+    live_source = LiveSource(cv.VideoCapture(f"{CLIP_DIRS['easy']}/{get_clip_name(0)}.mp4"))
+    objects = build_objects()
+
+    try:
+        stats = run_live(live_source, *objects, show=True)
+    finally:
+        live_source.release()
+
+    print({key: value for key, value in stats.items() if key != "events"})
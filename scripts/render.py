@@ -0,0 +1,149 @@
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2 as cv
+from tqdm import tqdm
+
+from batch import init_worker
+from segments import split_segments
+from src.tracking import StateLog
+from track import UPLOAD_DIR, get_clip_name, build_objects, draw_frame, make_writer, convert_to_mp4
+
+
+def render_segment(log_path: str, start: int, stop: int, name: str, encoder="ffmpeg",
+                   output_scale: float | None = None) -> str:
+    """
+    Draws the overlays of a segment of the clip from its state log. Nothing is analyzed, the objects are restored
+    from the log frame by frame and draw themselves, so the segments do not depend on each other
+
+    :param log_path: Path of the state log
+    :type log_path: str
+    :param start: First frame of the segment
+    :type start: int
+    :param stop: Frame after the last frame of the segment
+    :type stop: int
+    :param name: Name of the output video in the results
+    :type name: str
+    :param encoder: Encoder of the output, "ffmpeg" for an MP4 or "opencv" for an AVI, defaults to "ffmpeg"
+    :type encoder: str, optional
+    :param output_scale: Scale of the output frames, ffmpeg only, defaults to None
+    :type output_scale: float | None, optional
+    :return: Path of the output video
+    :rtype: str
+    """
+    header = StateLog.read_header(log_path)
+    reader = cv.VideoCapture(header["source"])
+    writer = make_writer(name, header["fps"], tuple(header["size"]), encoder, output_scale)
+    tracked, statics = build_objects(header.get("rectify_scale"))
+    states = StateLog()
+
+    changes = StateLog.read(log_path)
+    delta = next(changes, None)
+
+    # the changes before the segment are only merged, they are restored with its first frame
+    while delta is not None and delta["frame"] < start:
+        states.skip(delta)
+        delta = next(changes, None)
+
+    reader.set(cv.CAP_PROP_POS_FRAMES, start)
+    frame = None
+
+    try:
+        for frame_id in tqdm(range(start, stop), desc=name):
+            ret, frame = reader.read(frame)
+
+            if not ret:
+                print("Failed to read frame")
+                break
+
+            # the frames where nothing changed have no line in the log
+            current = None
+            if delta is not None and delta["frame"] == frame_id:
+                current, delta = delta, next(changes, None)
+
+            found_all = states.restore(frame, current, tracked, statics)
+            writer.write(draw_frame(frame, tracked, statics, found_all))
+    finally:
+        reader.release()
+        writer.release()
+
+    return f"{UPLOAD_DIR}/{name}.{'mp4' if encoder == 'ffmpeg' else 'avi'}"
+
+
+def concat_segments(parts: list[str], path: str) -> None:
+    """
+    Joins the videos of the segments without re-encoding them and removes them
+
+    :param parts: Paths of the segment videos in order
+    :type parts: list[str]
+    :param path: Path of the joined video
+    :type path: str
+    """
+    list_path = f"{path}.parts.txt"
+    with open(list_path, "w") as f:
+        for part in parts:
+            f.write(f"file '{os.path.abspath(part)}'\n")
+
+    ffmpeg_command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                      "-i", list_path, "-c", "copy", "-y", path]
+    print(f"Running: {' '.join(ffmpeg_command)}")
+    subprocess.run(ffmpeg_command, check=True)
+
+    for part in parts + [list_path]:
+        os.remove(part)
+
+
+def render_clip(diff: str, idx: int, segments: int | None = None, encoder="ffmpeg",
+                output_scale: float | None = None) -> str:
+    """
+    Draws the overlays of a clip analyzed before from its state log ({clip}.states.jsonl in the results),
+    split into segments rendered in parallel. A new overlay style only needs the clip to be rendered again
+
+    :param diff: Difficulty of the clip
+    :type diff: str
+    :param idx: Index of the clip
+    :type idx: int
+    :param segments: Number of segments, defaults to the number of cores
+    :type segments: int | None, optional
+    :param encoder: Encoder of the output, "ffmpeg" or "opencv", defaults to "ffmpeg"
+    :type encoder: str, optional
+    :param output_scale: Scale of the output frames, ffmpeg only, defaults to None
+    :type output_scale: float | None, optional
+    :return: Path of the output video
+    :rtype: str
+    """
+    clip_name = f"{diff}_{get_clip_name(idx)}"
+    log_path = f"{UPLOAD_DIR}/{clip_name}.states.jsonl"
+
+    reader = cv.VideoCapture(StateLog.read_header(log_path)["source"])
+    frame_count = int(reader.get(cv.CAP_PROP_FRAME_COUNT))
+    reader.release()
+
+    cores = os.cpu_count() or 1
+    bounds = split_segments(frame_count, segments or cores)
+
+    # a single segment is written directly
+    if len(bounds) == 1:
+        path = render_segment(log_path, 0, frame_count, clip_name, encoder, output_scale)
+    else:
+        workers = min(len(bounds), cores)
+        print(f"Rendering {clip_name} in {len(bounds)} segments on {workers} workers")
+
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(max(1, cores // workers),)) as pool:
+            futures = [pool.submit(render_segment, log_path, start, stop, f"{clip_name}.part{i:03d}", encoder,
+                                   output_scale) for i, (start, stop) in enumerate(bounds)]
+            parts = [future.result() for future in futures]
+
+        path = f"{UPLOAD_DIR}/{clip_name}.{'mp4' if encoder == 'ffmpeg' else 'avi'}"
+        concat_segments(parts, path)
+
+    if encoder != "ffmpeg":
+        convert_to_mp4(diff, idx)
+        path = f"{UPLOAD_DIR}/{clip_name}.mp4"
+
+    return path
+
+
+if __name__ == "__main__":
+    render_clip("easy", 0)
@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+from batch import init_worker
+from src.tracking import TrackedObject, StaticObject, Board, RedetectScheduler, StateLog
+from src.utils.context import FrameContext
+from src.utils.timeline import Timeline, TimelineWriter
+from track import CLIP_DIRS, UPLOAD_DIR, get_clip_name, build_objects, build_scheduler, make_timeline, record
+
+
+def split_segments(frame_count: int, segments: int) -> list[tuple[int, int]]:
+    """
+    Splits the frames into consecutive segments of (almost) equal length
+
+    :param frame_count: Number of frames of the clip
+    :type frame_count: int
+    :param segments: Number of segments
+    :type segments: int
+    :return: Segments as (first frame, frame after the last)
+    :rtype: list[tuple[int, int]]
+    """
+    bounds = [frame_count * i // segments for i in range(segments + 1)]
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def warm_up_statics(reader: cv.VideoCapture, statics: list[StaticObject], first: int,
+                    scheduler: RedetectScheduler) -> None:
+    """
+    Re-detects every static object on the frame where a run from the start of the clip would have last refreshed it
+
+    :param reader: Reader of the clip
+    :type reader: cv.VideoCapture
+    :param statics: Static objects in the order they are updated
+    :type statics: list[StaticObject]
+    :param first: First frame of the analysis, the objects refreshed on it are left to the analysis
+    :type first: int
+    :param scheduler: Scheduler of the analysis, with every object registered
+    :type scheduler: RedetectScheduler
+    """
+    anchors: dict[int, list[StaticObject]] = {}
+
+    for obj in statics:
+        anchor = scheduler.last_due(obj, first)
+        if anchor < first:
+            anchors.setdefault(anchor, []).append(obj)
+
+    for anchor in sorted(anchors):
+        reader.set(cv.CAP_PROP_POS_FRAMES, anchor)
+        ret, frame = reader.read()
+
+        if not ret:
+            continue
+
+        ctx = FrameContext(frame, anchor)
+        for obj in anchors[anchor]:
+            obj.re_detect(frame, ctx)
+
+    # the board would track its homography from the anchor across the whole gap, so it is re-detected
+    # on the first frame as well and tracked from there
+    boards = [obj for objs in anchors.values() for obj in objs if isinstance(obj, Board) and obj.track]
+    if boards:
+        reader.set(cv.CAP_PROP_POS_FRAMES, first)
+        ret, frame = reader.read()
+
+        if ret:
+            ctx = FrameContext(frame, first)
+            for board in boards:
+                board.re_detect(frame, ctx)
+
+
+def get_first_frame(start: int, warm_up: int, tracked: list[TrackedObject], scheduler: RedetectScheduler) -> int:
+    # the analysis starts on the earliest of the last refreshes of the trackers before the warm-up, so every tracker
+    # is initialized by a refresh of its own schedule, the same way as in a full run
+    first = max(0, start - warm_up)
+    return min((scheduler.last_due(obj, first) for obj in tracked), default=first)
+
+
+def process_segment(path: str, start: int, stop: int, warm_up: int, rectify_scale: float | None = None,
+                    states_path: str | None = None, timeline_path: str | None = None) -> list[dict]:
+    """
+    Analyzes a single segment of the clip headlessly. The analysis starts at least warm_up frames before the segment,
+    so that the board homography, the trackers and the smoothing buffers settle before the segment begins.
+    The static objects refreshed rarely are first re-detected on the frames of their last refresh in a full run.
+    The state log and the timeline of the segment also hold the warm-up frames, the stitching drops them
+
+    :param path: Path of the clip
+    :type path: str
+    :param start: First frame of the segment
+    :type start: int
+    :param stop: Frame after the last frame of the segment
+    :type stop: int
+    :param warm_up: Number of frames analyzed before the segment
+    :type warm_up: int
+    :param rectify_scale: Scale of the rectified board, defaults to None
+    :type rectify_scale: float | None, optional
+    :param states_path: Path of the state log of the segment, defaults to None
+    :type states_path: str | None, optional
+    :param timeline_path: Directory of the timeline of the segment, defaults to None
+    :type timeline_path: str | None, optional
+    :return: Events emitted inside the segment
+    :rtype: list[dict]
+    """
+    reader = cv.VideoCapture(path)
+    fps = reader.get(cv.CAP_PROP_FPS)
+
+    # the re-detections are staggered the same way as in a full run of make_clip
+    tracked, statics = build_objects(rectify_scale)
+    scheduler = build_scheduler(tracked, statics)
+    first = get_first_frame(start, warm_up, tracked, scheduler)
+    warm_up_statics(reader, statics, first, scheduler)
+
+    stream = open(states_path, "w") if states_path is not None else None
+    timeline = make_timeline(timeline_path, tracked, statics, fps) if timeline_path is not None else None
+
+    try:
+        events = record(reader, None, tracked, statics, start=first, sec=(stop - first) / fps,
+                        re_detect_first=first == 0, scheduler=scheduler,
+                        states=StateLog(stream) if stream is not None else None, timeline=timeline)
+    finally:
+        reader.release()
+        if stream is not None:
+            stream.close()
+        if timeline is not None:
+            timeline.close()
+
+    return [event for event in events.records if start <= event["frame"] < stop]
+
+
+def stitch_events(segments: list[tuple[int, int]], events: list[list[dict]], margin: int) -> list[dict]:
+    """
+    Stitches the events of consecutive segments into a single timeline. An event repeating the last message
+    of its object within the margin after a segment start is a state carried over the boundary and is dropped
+
+    :param segments: Segments as (first frame, frame after the last)
+    :type segments: list[tuple[int, int]]
+    :param events: Events emitted inside each segment
+    :type events: list[list[dict]]
+    :param margin: Number of frames after a segment start where the repeated events are dropped
+    :type margin: int
+    :return: Events of the whole clip
+    :rtype: list[dict]
+    """
+    timeline = []
+    last_msg: dict[str, str] = {}
+
+    for (start, _), segment_events in zip(segments, events):
+        for event in sorted(segment_events, key=lambda e: e["frame"]):
+            if event["frame"] - start < margin and last_msg.get(event["object"]) == event["msg"] and start > 0:
+                continue
+
+            timeline.append(event)
+            last_msg[event["object"]] = event["msg"]
+
+    return timeline
+
+
+def stitch_states(segments: list[tuple[int, int]], parts: list[str], path: str, header: dict) -> None:
+    """
+    Stitches the state logs of consecutive segments into the state log of the whole clip and removes them.
+    The changes of the warm-up frames are combined into the full state of the first frame of each segment,
+    so every segment of the stitched log starts from the state its own analysis reached
+
+    :param segments: Segments as (first frame, frame after the last)
+    :type segments: list[tuple[int, int]]
+    :param parts: Paths of the state logs of the segments
+    :type parts: list[str]
+    :param path: Path of the stitched state log
+    :type path: str
+    :param header: Description of the analysis
+    :type header: dict
+    """
+    with open(path, "w") as stream:
+        StateLog(stream, header)
+
+        for (start, stop), part in zip(segments, parts):
+            changes = StateLog.read(part)
+            delta = next(changes, None)
+            warm_up = []
+
+            # the first frame of the segment gets the full state, even if nothing changed on it
+            while delta is not None and delta["frame"] <= start:
+                warm_up.append(delta)
+                delta = next(changes, None)
+
+            stream.write(json.dumps(StateLog.combine(warm_up, start)) + "\n")
+
+            while delta is not None and delta["frame"] < stop:
+                stream.write(json.dumps(delta) + "\n")
+                delta = next(changes, None)
+
+            changes.close()
+
+    for part in parts:
+        os.remove(part)
+
+
+def stitch_timelines(segments: list[tuple[int, int]], parts: list[str], path: str) -> None:
+    """
+    Stitches the timelines of consecutive segments into the timeline of the whole clip and removes them,
+    the rows of the warm-up frames are dropped
+
+    :param segments: Segments as (first frame, frame after the last)
+    :type segments: list[tuple[int, int]]
+    :param parts: Directories of the timelines of the segments
+    :type parts: list[str]
+    :param path: Directory of the stitched timeline
+    :type path: str
+    """
+    timelines = [Timeline(part) for part in parts]
+    columns = {name: (column.dtype.name, timelines[0].labels[name]) for name, column in timelines[0].columns.items()}
+
+    with TimelineWriter(path, columns, timelines[0].fps) as writer:
+        for (start, stop), timeline in zip(segments, timelines):
+            for i in range(*np.searchsorted(timeline.frames, [start, stop])):
+                writer.append(int(timeline.frames[i]), {name: column[i] for name, column in timeline.columns.items()})
+
+    # the mapped files are closed before their directories are removed
+    del timelines
+    for part in parts:
+        shutil.rmtree(part)
+
+
+def make_clip_segments(diff: str, idx: int, segments: int | None = None, warm_up_sec=3.0,
+                       rectify_scale: float | None = None) -> list[dict]:
+    """
+    Analyzes a single clip split into segments processed in parallel and writes the stitched event stream,
+    state log and timeline
+
+    :param diff: Difficulty of the clip
+    :type diff: str
+    :param idx: Index of the clip
+    :type idx: int
+    :param segments: Number of segments, defaults to the number of cores
+    :type segments: int | None, optional
+    :param warm_up_sec: Seconds analyzed before each segment, must cover the 30 frame smoothing, defaults to 3.0
+    :type warm_up_sec: float, optional
+    :param rectify_scale: Scale of the rectified board, defaults to None
+    :type rectify_scale: float | None, optional
+    :return: Events of the whole clip
+    :rtype: list[dict]
+    """
+    clip_name = f"{diff}_{get_clip_name(idx)}"
+    path = f"{CLIP_DIRS[diff]}/{get_clip_name(idx)}.mp4"
+
+    reader = cv.VideoCapture(path)
+    fps = reader.get(cv.CAP_PROP_FPS)
+    frame_count = int(reader.get(cv.CAP_PROP_FRAME_COUNT))
+    size = (int(reader.get(cv.CAP_PROP_FRAME_WIDTH)), int(reader.get(cv.CAP_PROP_FRAME_HEIGHT)))
+    reader.release()
+
+    cores = os.cpu_count() or 1
+    bounds = split_segments(frame_count, segments or cores)
+    warm_up = int(round(warm_up_sec * fps))
+    workers = min(len(bounds), cores)
+
+    print(f"Processing {clip_name} in {len(bounds)} segments on {workers} workers")
+
+    # the state log lets render.py draw the overlays of the segmented analysis as well
+    states_path = f"{UPLOAD_DIR}/{clip_name}.states.jsonl"
+    timeline_path = f"{UPLOAD_DIR}/{clip_name}.timeline"
+    parts = [(f"{states_path}.part{i:03d}", f"{timeline_path}.part{i:03d}") for i in range(len(bounds))]
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(max(1, cores // workers),)) as pool:
+        futures = [pool.submit(process_segment, path, start, stop, warm_up, rectify_scale, *part)
+                   for (start, stop), part in zip(bounds, parts)]
+        timeline = stitch_events(bounds, [future.result() for future in futures], warm_up)
+
+    header = {"source": path, "fps": fps, "size": size, "rectify_scale": rectify_scale}
+    stitch_states(bounds, [part[0] for part in parts], states_path, header)
+    stitch_timelines(bounds, [part[1] for part in parts], timeline_path)
+
+    with open(f"{UPLOAD_DIR}/{clip_name}.events.jsonl", "w") as f:
+        for event in timeline:
+            f.write(json.dumps(event) + "\n")
+
+    return timeline
+
+
+if __name__ == "__main__":
+    make_clip_segments("easy", 0)
@@ -3,10 +3,17 @@ import numpy as np
 from tqdm import tqdm
 import subprocess
 import os
-
-from src.utils.data import get_pdf_page
-from src.tracking import TrackedObject, StaticObject, Board, Buildings, Card, CardPile, Dice, DiceTray, ScoreBoard, \
-    Pawns
+import time
+
+from src.utils.assets import load_assets
+from src.utils.buffers import BufferPool
+from src.detection.reference import ReferenceMatcher
+from src.utils.context import FrameContext
+from src.utils.profiling import Profiler
+from src.utils.timeline import TimelineWriter
+from src.utils.video import FFmpegWriter, ThreadedReader, ThreadedWriter
+from src.tracking import TrackedObject, StaticObject, Board, BoardGeometry, BoardRectifier, Buildings, Card, CardPile, \
+    Dice, DiceTray, EventLog, RedetectScheduler, ScoreBoard, Pawns, StateLog, TrackingExecutor
 from src.viz.images import display_events
 
 DATA_DIR = "../data"
@@ -14,17 +21,121 @@ UPLOAD_DIR = "../results"
 DIFFICULTIES = ["easy", "medium", "hard"]
 CLIP_DIRS = dict([(diff, f"{DATA_DIR}/{diff}") for diff in DIFFICULTIES])
 
-BOARD_MASK = cv.imread(f"{DATA_DIR}/game_data/board_mask.png")
-BOARD_REF = get_pdf_page(f"{DATA_DIR}/game_data/board.pdf")
-CARD_REF = get_pdf_page(f"{DATA_DIR}/game_data/card_reverse.pdf")
+# x264 settings of the output videos
+PRESET = "fast"
+CRF = 23
+
+# the static geometry and the reference features are compiled once and loaded by every run and worker
+ASSETS = load_assets(f"{DATA_DIR}/game_data/board.pdf", f"{DATA_DIR}/game_data/card_reverse.pdf",
+                     f"{DATA_DIR}/game_data/board_mask.png", f"{DATA_DIR}/game_data")
+BOARD_MASK = ASSETS.mask
+BOARD_REF = ASSETS.board_ref
+CARD_REF = ASSETS.card_ref
+
+# instrumentation is disabled unless a profiler is given
+NULL_PROFILER = Profiler(enabled=False)
+
+# reference features are extracted once and shared by every clip
+BOARD_MATCHER = ASSETS.matcher("board")
+CARD_MATCHER = ASSETS.matcher("card")
 
 
 def get_clip_name(video_idx: int) -> str:
     return f"clip_{video_idx}"
 
 
-def record(reader: cv.VideoCapture, writer: cv.VideoWriter, tracked: list[TrackedObject], statics: list[StaticObject],
-           start=0, sec=None):
+def analyze_frame(frame: np.ndarray, frame_id: int, tracked: list[TrackedObject], statics: list[StaticObject],
+                  executor: TrackingExecutor, scheduler: RedetectScheduler, events: EventLog, first=False,
+                  headless=False, static_events=True, tick: int | None = None, profiler: Profiler | None = None,
+                  pool: BufferPool | None = None, states: StateLog | None = None,
+                  timeline: TimelineWriter | None = None) -> np.ndarray | None:
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    frame_start = time.perf_counter()
+
+    # the raw frame is analyzed, the overlays are drawn over a copy, kept in the "overlay" buffer of the pool
+    raw_frame = frame
+    if headless:
+        frame = None
+    else:
+        frame = np.copy(raw_frame) if pool is None else pool.copy("overlay", raw_frame)
+
+    ctx = FrameContext(raw_frame, frame_id, pool)
+
+    # the re-detections are scheduled by the analyzed frames, which differ from the video frames if some are dropped
+    due = scheduler.plan(tick if tick is not None else frame_id, statics + tracked, first)
+
+    for obj in statics:
+        name = type(obj).__name__
+
+        if id(obj) in due:
+            re_detect_start = time.perf_counter()
+            obj.re_detect(raw_frame, ctx)
+            re_detect_time = time.perf_counter() - re_detect_start
+
+            scheduler.report(obj, re_detect_time)
+            profiler.add("re_detect", name, re_detect_time)
+            profiler.count("re_detections")
+
+        with profiler.time("update", name):
+            obj.update(raw_frame, ctx)
+
+        # the previous state is kept when the static analysis is skipped
+        if static_events:
+            with profiler.time("detect_events", name):
+                obj.detect_events(raw_frame, ctx)
+
+    # the trackers only depend on the statics, so they are all updated before their events are detected
+    found_all = executor.update(tracked, raw_frame, [id(obj) in due for obj in tracked], profiler, scheduler)
+
+    for obj, found in zip(tracked, found_all):
+        if not found:
+            profiler.count("tracker_failures")
+            continue
+
+        with profiler.time("detect_events", type(obj).__name__):
+            obj.detect_events(raw_frame, ctx)
+
+    events.collect(frame_id, tracked + statics)
+
+    if states is not None:
+        states.collect(frame_id, tracked, statics, found_all)
+
+    if timeline is not None:
+        timeline.append(frame_id, get_timeline_row(tracked, statics, found_all))
+
+    if not headless:
+        frame = draw_frame(frame, tracked, statics, found_all, profiler)
+
+    profiler.add("frame", "analysis", time.perf_counter() - frame_start)
+    return frame
+
+
+def draw_frame(frame: np.ndarray, tracked: list[TrackedObject], statics: list[StaticObject], found_all: list[bool],
+               profiler: Profiler | None = None) -> np.ndarray:
+    # the overlays only depend on the state of the objects, which may also be restored from a state log
+    profiler = profiler if profiler is not None else NULL_PROFILER
+
+    for obj in statics:
+        with profiler.time("draw", type(obj).__name__):
+            frame = obj.draw(frame)
+
+    for obj, found in zip(tracked, found_all):
+        with profiler.time("draw", type(obj).__name__):
+            frame = obj.draw_bbox(frame) if found else obj.detection_fail_msg(frame)
+
+    with profiler.time("draw", "events"):
+        display_events(frame, [obj.event for obj in tracked + statics])
+
+    return frame
+
+
+def record(reader: cv.VideoCapture, writer: cv.VideoWriter | None, tracked: list[TrackedObject],
+           statics: list[StaticObject], start=0, sec=None, executor: TrackingExecutor | None = None,
+           events: EventLog | None = None, re_detect_first=True, scheduler: RedetectScheduler | None = None,
+           profiler: Profiler | None = None, pool: BufferPool | None = None, states: StateLog | None = None,
+           timeline: TimelineWriter | None = None) -> EventLog:
+    # without a writer the frames are only analyzed, nothing is drawn or encoded
+    headless = writer is None
     fps = reader.get(cv.CAP_PROP_FPS)
 
     if sec is None:
@@ -35,75 +146,215 @@ def record(reader: cv.VideoCapture, writer: cv.VideoWriter, tracked: list[Tracke
     print(f"Recording {sec} seconds of video from {start//fps} at {fps} fps")
     print("Recording...")
 
-    for frame_id in tqdm(range(start, start + int(sec * fps))):
-        ret, frame = reader.read()
+    # the trackers are updated serially unless an executor with workers is given
+    executor = executor if executor is not None else TrackingExecutor()
+    events = events if events is not None else EventLog(fps)
+    # the objects are re-detected on the multiples of their refresh rates unless a scheduler is given
+    scheduler = scheduler if scheduler is not None else RedetectScheduler()
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    # an overlay is only reused once the writer encoded it, a threaded writer holds up to its depth of them
+    pool = pool if pool is not None else BufferPool({"overlay": getattr(writer, "depth", 0) + 2})
+
+    # a plain capture decodes every frame into the buffer of the previous one, a threaded reader has a ring of its own
+    reuse = isinstance(reader, cv.VideoCapture)
+    frame = None
+
+    for frame_id in tqdm(range(start, start + int(round(sec * fps)))):
+        frame_start = time.perf_counter()
+
+        with profiler.time("decode", "reader"):
+            ret, frame = reader.read(frame) if reuse else reader.read()
 
         if not ret:
             print("Failed to read frame")
             break
 
-        raw_frame = np.copy(frame)
-
-        for obj in statics:
-            if frame_id % obj.refresh_rate == 0:
-                obj.re_detect(raw_frame)
-            obj.detect_events(raw_frame)
-            frame = obj.draw(frame)
+        # everything is detected on the first frame, the recording may start anywhere in the clip
+        first = re_detect_first and frame_id == start
+        overlay = analyze_frame(frame, frame_id, tracked, statics, executor, scheduler, events, first, headless,
+                                profiler=profiler, pool=pool, states=states, timeline=timeline)
 
-        for obj in tracked:
-            if frame_id % obj.refresh_rate == 0:
-                obj.re_detect(raw_frame)
+        if not headless:
+            with profiler.time("encode", "writer"):
+                writer.write(overlay)
 
-            found = obj.update(raw_frame)
+        profiler.add("frame", "total", time.perf_counter() - frame_start)
+        profiler.frame_done()
 
-            if not found:
-                frame = obj.detection_fail_msg(frame)
-                continue
+    return events
 
-            obj.detect_events(raw_frame)
-            frame = obj.draw_bbox(frame)
 
-        events = [obj.event for obj in tracked + statics]
-        display_events(frame, events)
+def build_objects(rectify_scale: float | None = None, board_ref: np.ndarray | None = None,
+                  card_ref: np.ndarray | None = None) -> tuple[list[TrackedObject], list[StaticObject]]:
+    # other references, e.g. of the synthetic clips, have their features extracted here
+    board_matcher = BOARD_MATCHER if board_ref is None else ReferenceMatcher(board_ref)
+    card_matcher = CARD_MATCHER if card_ref is None else ReferenceMatcher(card_ref)
+    board_ref = BOARD_REF if board_ref is None else board_ref
+    card_ref = CARD_REF if card_ref is None else card_ref
 
-        writer.write(frame)
+    board = Board("board", board_ref, matcher=board_matcher, track=True)
+    card_pile = CardPile("pile of cards", card_ref, matcher=card_matcher)
+    card = Card("card", "CSRT", card_pile)
+    dice_tray = DiceTray("dice tray")
+    dice_1 = Dice("dice 1", "CSRT", dice_tray, 1)
+    dice_2 = Dice("dice 2", "CSRT", dice_tray, 2)
+    # with a rectify scale the board objects analyze the board warped into the reference geometry
+    rectifier = BoardRectifier(board, rectify_scale) if rectify_scale is not None else None
+    geometry = BoardGeometry(board, rectifier)
+    # the score board of another reference is detected anew, the clearings only depend on the mask
+    score_board = ScoreBoard("score", board, BOARD_MASK[:, :, 2], exact=True, geometry=geometry,
+                             precomputed=ASSETS.score_board if board_ref is BOARD_REF else None)
+    buildings = Buildings("buildings", board, BOARD_MASK[:, :, 0], exact=True, geometry=geometry,
+                          precomputed=ASSETS.clearings)
+    pawns = Pawns("pawns", board, BOARD_MASK[:, :, 0], geometry=geometry, precomputed=ASSETS.clearings)
+
+    return [card, dice_1, dice_2], [board, dice_tray, card_pile, score_board, buildings, pawns]
+
+
+def make_timeline(path: str, tracked: list[TrackedObject], statics: list[StaticObject], fps: float | None = None,
+                  chunk_size=1024) -> TimelineWriter:
+    # the game state of every frame in columns of fixed shape, filled by get_timeline_row
+    buildings = next(obj for obj in statics if isinstance(obj, Buildings))
+    pawns = next(obj for obj in statics if isinstance(obj, Pawns))
+    factions = ["orange", "blue"]
+    names = [obj.name for obj in tracked]
+    axis = ["0", "1", "2"]
+
+    columns = {"score": ("int16", [factions]),
+               "pawns": ("int16", [factions, [str(i) for i in range(len(pawns.static_contours))]]),
+               # the bit i is set if the faction owns the building i, the sign bit is left for the -1
+               "buildings": ("int32" if len(buildings.static_contours) <= 31 else "int64", [factions]),
+               "bboxes": ("float32", [names, ["x", "y", "w", "h"]]),
+               "found": ("bool", [names]),
+               "homography": ("float64", [axis, axis])}
+
+    return TimelineWriter(path, columns, fps, chunk_size)
+
+
+def get_timeline_row(tracked: list[TrackedObject], statics: list[StaticObject], found_all: list[bool]) -> dict:
+    # the values not reported yet are -1, or NaN for the boxes and the homography
+    board = next(obj for obj in statics if isinstance(obj, Board))
+    score_board = next(obj for obj in statics if isinstance(obj, ScoreBoard))
+    buildings = next(obj for obj in statics if isinstance(obj, Buildings))
+    pawns = next(obj for obj in statics if isinstance(obj, Pawns))
+    clearings = range(len(pawns.static_contours))
+
+    return {
+        "score": score_board.current_score if score_board.current_score is not None else -1,
+        "pawns": [[len(faction.get(i, [])) for i in clearings] for faction in (pawns.orange_pawns, pawns.blue_pawns)]
+        if pawns.current_count is not None else -1,
+        "buildings": [sum(1 << i for i, owned in enumerate(faction) if owned)
+                      for faction in (buildings.orange_buildings, buildings.blue_buildings)]
+        if buildings.current_score is not None else -1,
+        "bboxes": [obj.last_bbox if obj.last_bbox is not None else [np.nan] * 4 for obj in tracked],
+        "found": found_all,
+        "homography": board.m if board.m is not None else np.nan,
+    }
+
+
+def build_scheduler(tracked: list[TrackedObject], statics: list[StaticObject], budget: float | None = None) \
+        -> RedetectScheduler:
+    scheduler = RedetectScheduler(stagger=True, budget=budget)
+
+    # the board objects need the homography, the dice and the card are initialized from their static counterparts
+    for obj in statics + tracked:
+        dependencies = [getattr(obj, attr) for attr in ("board", "dice_tray", "card_pile") if hasattr(obj, attr)]
+        scheduler.register(obj, dependencies)
+
+    return scheduler
+
+
+def make_writer(clip_name: str, fps: float, size: tuple[int, int], encoder="ffmpeg",
+                output_scale: float | None = None) -> cv.VideoWriter | FFmpegWriter:
+    # ffmpeg encodes the final MP4 directly, the OpenCV writer needs a second pass through convert_to_mp4
+    if encoder == "ffmpeg":
+        return FFmpegWriter(f"{UPLOAD_DIR}/{clip_name}.mp4", fps, size, PRESET, CRF, output_scale)
+
+    return cv.VideoWriter(f"{UPLOAD_DIR}/{clip_name}.avi", cv.VideoWriter_fourcc(*"DIVX"), fps, size)
+
+
+def discard_writer(writer: cv.VideoWriter | FFmpegWriter | ThreadedWriter) -> None:
+    # ffmpeg removes its partial video, the AVI of the OpenCV writer is only converted once the clip is done
+    if hasattr(writer, "discard"):
+        writer.discard()
+    else:
+        writer.release()
 
 
-def make_clip(diff: str, idx: int) -> None:
+def make_clip(diff: str, idx: int, rectify_scale: float | None = None, headless=False, pipeline_depth=8,
+              encoder="ffmpeg", output_scale: float | None = None, re_detect_budget: float | None = None,
+              profile=False) -> bool:
     clip_name = f"{diff}_{get_clip_name(idx)}"
 
     print(f"Processing... Difficulty: {diff} | File: {get_clip_name(idx)}.mp4")
 
-    reader = cv.VideoCapture(f"{CLIP_DIRS[diff]}/{get_clip_name(idx)}.mp4")
-    writer = cv.VideoWriter(
-        f"{UPLOAD_DIR}/{clip_name}.avi",
-        cv.VideoWriter_fourcc(*"DIVX"),
-        reader.get(cv.CAP_PROP_FPS),
-        (int(reader.get(cv.CAP_PROP_FRAME_WIDTH)), int(reader.get(cv.CAP_PROP_FRAME_HEIGHT))),
-    )
+    path = f"{CLIP_DIRS[diff]}/{get_clip_name(idx)}.mp4"
+    reader = cv.VideoCapture(path)
+    size = (int(reader.get(cv.CAP_PROP_FRAME_WIDTH)), int(reader.get(cv.CAP_PROP_FRAME_HEIGHT)))
+    writer = None if headless else make_writer(clip_name, reader.get(cv.CAP_PROP_FPS), size, encoder, output_scale)
 
-    if reader.isOpened() and writer.isOpened():
+    if reader.isOpened() and (headless or writer.isOpened()):
         print("Loaded")
     else:
         print("Failed to load")
-        return
-
-    board = Board("board", BOARD_REF)
-    card_pile = CardPile("pile of cards", CARD_REF)
-    card = Card("card", "CSRT", card_pile)
-    dice_tray = DiceTray("dice tray")
-    dice_1 = Dice("dice 1", "CSRT", dice_tray, 1)
-    dice_2 = Dice("dice 2", "CSRT", dice_tray, 2)
-    score_board = ScoreBoard("score", board, BOARD_MASK[:, :, 2])
-    buildings = Buildings("buildings", board, BOARD_MASK[:, :, 0])
-    pawns = Pawns("pawns", board, BOARD_MASK[:, :, 0])
-
-    record(reader, writer, [card, dice_1, dice_2], [board, dice_tray, card_pile, score_board, buildings, pawns])
+        reader.release()
+
+        # the started encoder is stopped and its empty output removed
+        if writer is not None:
+            discard_writer(writer)
+
+            if encoder != "ffmpeg" and os.path.exists(f"{UPLOAD_DIR}/{clip_name}.avi"):
+                os.remove(f"{UPLOAD_DIR}/{clip_name}.avi")
+
+        return False
+
+    # decoding and encoding run on their own threads, overlapping with the analysis
+    if pipeline_depth > 0:
+        reader = ThreadedReader(reader, pipeline_depth)
+        writer = ThreadedWriter(writer, pipeline_depth) if writer is not None else None
+
+    tracked, statics = build_objects(rectify_scale)
+    profiler = Profiler(enabled=profile)
+
+    # the state log lets render.py draw the overlays again without analyzing the clip
+    header = {"source": path, "fps": reader.get(cv.CAP_PROP_FPS), "size": size, "rectify_scale": rectify_scale}
+
+    # the event stream is written under a temporary name and renamed once the clip is done,
+    # so a crashed run does not leave a partial stream that the next run takes for a finished clip
+    events_path = f"{UPLOAD_DIR}/{clip_name}.events.jsonl"
+    done = False
+
+    try:
+        with open(f"{events_path}.part", "w") as stream, \
+                open(f"{UPLOAD_DIR}/{clip_name}.states.jsonl", "w") as states_stream, \
+                make_timeline(f"{UPLOAD_DIR}/{clip_name}.timeline", tracked, statics, header["fps"]) as timeline, \
+                TrackingExecutor(workers=len(tracked)) as executor:
+            record(reader, writer, tracked, statics, executor=executor,
+                   events=EventLog(reader.get(cv.CAP_PROP_FPS), stream), states=StateLog(states_stream, header),
+                   timeline=timeline, scheduler=build_scheduler(tracked, statics, re_detect_budget),
+                   profiler=profiler)
+        done = True
+    finally:
+        # the pipeline threads are stopped even if the analysis fails, the video is only moved to the results
+        # after a completed analysis, otherwise it is discarded without raising the errors of the encoder,
+        # so they do not hide the error of the analysis
+        reader.release()
+        if writer is not None and done:
+            writer.release()
+        elif writer is not None:
+            discard_writer(writer)
+
+        if not done and os.path.exists(f"{events_path}.part"):
+            os.remove(f"{events_path}.part")
+
+    os.replace(f"{events_path}.part", events_path)
+
+    if profile:
+        profiler.save(f"{UPLOAD_DIR}/{clip_name}.profile.json")
+        print(profiler.summary())
 
     print("Done")
-
-    reader.release()
-    writer.release()
+    return True
 
 
 def convert_to_mp4(diff: str, idx: int) -> None:
@@ -115,10 +366,17 @@ def convert_to_mp4(diff: str, idx: int) -> None:
 
 
 if __name__ == "__main__":
+    # only the event streams and the state logs are produced in the headless mode, render.py draws them later
+    headless = False
+    encoder = "ffmpeg"
+
     for difficulty in DIFFICULTIES:
         for i in range(3):
-            if os.path.exists(f"{UPLOAD_DIR}/{difficulty}_{get_clip_name(i)}.mp4"):
+            output = "events.jsonl" if headless else "mp4"
+            if os.path.exists(f"{UPLOAD_DIR}/{difficulty}_{get_clip_name(i)}.{output}"):
                 continue
 
-            make_clip(difficulty, i)
-            convert_to_mp4(difficulty, i)
+            make_clip(difficulty, i, headless=headless, encoder=encoder)
+
+            if not headless and encoder != "ffmpeg":
+                convert_to_mp4(difficulty, i)
@@ -2,11 +2,14 @@ import cv2 as cv
 import numpy as np
 
 from src.utils.images import crop_image
-from src.utils.helpers import get_highest_hierarchy, get_children, safe_division
+from src.utils.helpers import HierarchyIndex, safe_division
 from src.utils.contours import reorder_contours
+from src.detection.reference import ReferenceMatcher
+from src.utils.context import FrameContext
+from src.utils.coverage import LabelGroup
 
 
-def detect_dice_tray(img: np.ndarray, thresh=50, draw_contours=False) \
+def detect_dice_tray(img: np.ndarray, thresh=50, draw_contours=False, gray: np.ndarray | None = None) \
         -> tuple[np.ndarray, np.ndarray | None, np.ndarray | None, np.ndarray | None]:
     """
     Detects the dice tray and the dice inside it
@@ -17,12 +20,15 @@ def detect_dice_tray(img: np.ndarray, thresh=50, draw_contours=False) \
     :param thresh: Threshold for the dice tray detection
     :type thresh: int
     :param draw_contours: Whether to draw the contours over the image, defaults to False
+    :param gray: Grayscale version of the image if already computed, defaults to None
+    :type gray: np.ndarray | None, optional
     :return: Dice tray contour, dice 1 contour, dice 2 contour, image with contours drawn (if draw_contours is True).
         Dice contours are None if not found
     :rtype: tuple[np.ndarray, np.ndarray | None, np.ndarray | None, np.ndarray | None]
     """
     # convert to grayscale
-    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    if gray is None:
+        gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
     filtered = cv.bilateralFilter(gray, 9, 250, 250)
 
     # define thresholds
@@ -36,7 +42,7 @@ def detect_dice_tray(img: np.ndarray, thresh=50, draw_contours=False) \
     tray_idx, tray = max(enumerate(contours), key=lambda i_c: cv.contourArea(i_c[1]))
 
     # detect dice, take the two smallest contours
-    tray_children = get_children(tray_idx, hierarchy)
+    tray_children = HierarchyIndex(hierarchy).children(tray_idx)
     tray_children_mapped = map(lambda i: cv.boundingRect(contours[i]), tray_children)
     tray_children_sorted = sorted(zip(tray_children, tray_children_mapped),
                                   key=lambda bound: -bound[1][2] * bound[1][3])
@@ -57,6 +63,38 @@ def detect_dice_tray(img: np.ndarray, thresh=50, draw_contours=False) \
         return tray, dice1, dice2, None
 
 
+def detect_dice_tray_in_roi(img: np.ndarray, roi: tuple[int, int, int, int], thresh=50,
+                            gray: np.ndarray | None = None) \
+        -> tuple[np.ndarray, np.ndarray | None, np.ndarray | None] | None:
+    """
+    Detects the dice tray and the dice inside the region of interest only, the filtering and thresholding
+    are limited to the region, the contours are returned in the coordinates of the whole image
+
+    :param img: Image to detect the dice tray and dice in
+    :type img: np.ndarray
+    :param roi: Region of interest (x, y, w, h), must lie inside the image
+    :type roi: tuple[int, int, int, int]
+    :param thresh: Threshold for the dice tray detection
+    :type thresh: int
+    :param gray: Grayscale version of the image if already computed, defaults to None
+    :type gray: np.ndarray | None, optional
+    :return: Dice tray contour, dice 1 contour, dice 2 contour, None if the region holds no contour at all,
+        e.g. when the tray is covered. Dice contours are None if not found
+    :rtype: tuple[np.ndarray, np.ndarray | None, np.ndarray | None] | None
+    """
+    x, y, w, h = roi
+    gray_roi = gray[y:y + h, x:x + w] if gray is not None else None
+
+    try:
+        tray, dice1, dice2, _ = detect_dice_tray(img[y:y + h, x:x + w], thresh, False, gray_roi)
+    except ValueError:
+        # the largest contour of an empty region does not exist
+        return None
+
+    offset = np.array([x, y], dtype=np.int32)
+    return tray + offset, *(dice + offset if dice is not None else None for dice in (dice1, dice2))
+
+
 def detect_from_reference(img: np.ndarray, ref: np.ndarray, distance=0.25, draw_matches=False) \
         -> tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None]:
     """
@@ -74,47 +112,8 @@ def detect_from_reference(img: np.ndarray, ref: np.ndarray, distance=0.25, draw_
         Matrix and contour are None if not found
     :rtype: tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None]
     """
-    # convert to grayscale
-    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
-    ref_gray = cv.cvtColor(ref, cv.COLOR_BGR2GRAY)
-
-    # detect key points and descriptors
-    sift = cv.SIFT_create()
-    kp, desc = sift.detectAndCompute(gray, None)
-    kp2, desc2 = sift.detectAndCompute(ref_gray, None)
-
-    # match descriptors and filter them by distance
-    matcher = cv.FlannBasedMatcher()
-    matches = matcher.match(desc2, desc)
-    max_distance = max(matches, key=lambda x: x.distance).distance
-    matches = list(filter(lambda x: x.distance < distance * max_distance, matches))
-
-    # if no matches found, return
-    if len(matches) == 0:
-        return None, None, None
-
-    # find homography matrix
-    src_pts = np.float32([kp2[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
-    m, mask = cv.findHomography(src_pts, dst_pts, cv.RANSAC, 5.0)
-
-    # find contour of the reference object
-    ref_gray = cv.warpPerspective(ref_gray, m, (img.shape[1], img.shape[0]))
-    _, ref_gray = cv.threshold(ref_gray, 50, 255, cv.THRESH_BINARY)
-    ref_gray = cv.morphologyEx(ref_gray, cv.MORPH_CLOSE, kernel=np.ones((7, 7)))
-    contours, _ = cv.findContours(ref_gray, cv.RETR_TREE, 2)
-    obj_contour = contours[0]
-
-    if draw_matches:
-        draw_params = dict(matchColor=(255, 0, 0),  # draw matches in green color
-                           singlePointColor=None,
-                           matchesMask=mask.ravel().tolist(),  # draw only inliers
-                           flags=2 | 4,
-                           )
-        img_matches = cv.drawMatches(ref, kp2, img, kp, matches, None, **draw_params)
-        return m, obj_contour, img_matches
-    else:
-        return m, obj_contour, None
+    # the reference features are extracted on every call, use a ReferenceMatcher to reuse them across frames
+    return ReferenceMatcher(ref).detect(img, distance, draw_matches)
 
 
 def detect_score_board(img: np.ndarray, mask: np.ndarray, thresh_args=(55, 15), hor_ker=np.ones((1, 40)),
@@ -159,7 +158,7 @@ def detect_score_board(img: np.ndarray, mask: np.ndarray, thresh_args=(55, 15),
     # Find contours of the cells and the score board
     contours, hierarchy = cv.findContours(hor_ver, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
     score_board_idx, _ = max(enumerate(contours), key=lambda i_c: cv.contourArea(i_c[1]))
-    cells = get_children(score_board_idx, hierarchy)
+    cells = HierarchyIndex(hierarchy).children(score_board_idx)
 
     return [contours[i] for i in cells[::-1]], mask_cont
 
@@ -176,13 +175,14 @@ def detect_clearings_and_buildings(mask: np.ndarray) \
     """
     # Find contours of the clearings and buildings
     contours, hierarchy = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+    index = HierarchyIndex(hierarchy)
 
     # Get the highest hierarchy contours (parentless) as clearings and reorganize them
-    clearings = [(cont_idx, contours[cont_idx]) for cont_idx in get_highest_hierarchy(hierarchy)]
+    clearings = [(cont_idx, contours[cont_idx]) for cont_idx in index.roots]
     clearings = reorder_contours(clearings, [(0, 3), (0, 2), (1, 3), (5, 6)])
 
     # Get the lowest hierarchy contours (childless) for each clearing as buildings
-    buildings = {i: [contours[j] for j in get_children(c_idx, hierarchy)]
+    buildings = {i: [contours[j] for j in index.children(c_idx)]
                  for i, (c_idx, _) in enumerate(clearings)}
     clearings = [cont for _, cont in clearings]
 
@@ -191,7 +191,7 @@ def detect_clearings_and_buildings(mask: np.ndarray) \
 
 def detect_pawns(img: np.ndarray, mask: np.ndarray, clearings: list[np.ndarray],
                  orange: tuple[np.ndarray, np.ndarray], blue: tuple[np.ndarray, np.ndarray],
-                 diff_sensitivity=0.5, area_sensitivity=0.3) \
+                 diff_sensitivity=0.5, area_sensitivity=0.3, ctx: FrameContext | None = None) \
         -> tuple[dict[int, list[np.ndarray]], dict[int, list[np.ndarray]]]:
     """
     Detects the pawns from the clearing mask
@@ -210,16 +210,18 @@ def detect_pawns(img: np.ndarray, mask: np.ndarray, clearings: list[np.ndarray],
     :type diff_sensitivity: float, optional
     :param area_sensitivity: Sensitivity of the area of the contour to the biggest contour, defaults to 0.3
     :type area_sensitivity: float, optional
+    :param ctx: Context of the image holding the shared color masks, defaults to None
+    :type ctx: FrameContext | None, optional
     :return: Dictionary of orange pawns for each clearing, dictionary of blue pawns for each clearing
     :rtype: tuple[dict[int, list[np.ndarray]], dict[int, list[np.ndarray]]]
     """
-    hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
-    hsv = cv.bitwise_and(hsv, hsv, mask=mask)
+    ctx = ctx if ctx is not None else FrameContext(img)
     pawns: list[dict[int, list[np.ndarray]]] = []
 
     for color_range in (orange, blue):
         pawns.append({})
-        color_mask = cv.inRange(hsv, *color_range)
+        # same as masking the HSV image first, as its black background lies outside both color ranges
+        color_mask = cv.bitwise_and(ctx.in_range(*color_range), mask)
         color_mask = cv.erode(color_mask, np.ones((5, 5)))
         contours, _ = cv.findContours(color_mask, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
         biggest_area = np.max(tuple(map(lambda c: cv.contourArea(c), contours)))
@@ -242,3 +244,117 @@ def detect_pawns(img: np.ndarray, mask: np.ndarray, clearings: list[np.ndarray],
                     break
 
     return pawns[0], pawns[1]
+
+
+def detect_pawns_labeled(img: np.ndarray, labels: LabelGroup, clearings: list[np.ndarray],
+                         orange: tuple[np.ndarray, np.ndarray], blue: tuple[np.ndarray, np.ndarray],
+                         diff_sensitivity=0.5, area_sensitivity=0.3, ctx: FrameContext | None = None,
+                         method="contours") \
+        -> tuple[dict[int, list[np.ndarray]], dict[int, list[np.ndarray]]]:
+    """
+    Detects the pawns with a single pass per color over the window of the rasterized clearings.
+    The blobs are assigned to the clearings through the label map and ranked by area the same way as in detect_pawns,
+    the pawns are returned relative to the bounding rectangles of the clearings.
+
+    The "contours" method extracts the outer contours of the blobs, the "components" method labels them with
+    connected components and returns their bounding boxes. Labeling touches every pixel of the window,
+    so it only pays off with a multithreaded OpenCV build and very noisy masks
+
+    :param img: Image to detect the pawns in
+    :type img: np.ndarray
+    :param labels: Rasterized clearings
+    :type labels: LabelGroup
+    :param clearings: Clearing contours
+    :type clearings: list[np.ndarray]
+    :param orange: Color range of the orange team
+    :type orange: tuple[np.ndarray, np.ndarray]
+    :param blue: Color range of the blue team
+    :type blue: tuple[np.ndarray, np.ndarray]
+    :param diff_sensitivity: Sensitivity of the difference between areas of the next sorted pawns, defaults to 0.5
+    :type diff_sensitivity: float, optional
+    :param area_sensitivity: Sensitivity of the area of the pawn to the biggest pawn, defaults to 0.3
+    :type area_sensitivity: float, optional
+    :param ctx: Context of the image holding the shared color masks, defaults to None
+    :type ctx: FrameContext | None, optional
+    :param method: Blob extraction method, "contours" or "components", defaults to "contours"
+    :type method: str, optional
+    :return: Dictionary of orange pawns for each clearing, dictionary of blue pawns for each clearing
+    :rtype: tuple[dict[int, list[np.ndarray]], dict[int, list[np.ndarray]]]
+    """
+    ctx = ctx if ctx is not None else FrameContext(img)
+    x0, y0, _, _ = labels.label_map.window
+    n_clearings = labels.stop - labels.start
+    clearing_idx = labels.indices()
+
+    # shift from the window to the bounding rectangles of the clearings
+    offsets = np.array([cv.boundingRect(c)[:2] for c in clearings]).reshape(-1, 2) - [x0, y0]
+    pawns: list[dict[int, list[np.ndarray]]] = []
+
+    for color_range in (orange, blue):
+        pawns.append({c_idx: [] for c_idx in range(n_clearings)})
+        window = labels.window_mask()
+        # both colors are extracted from the same scratch buffers, the blobs are copied out of them
+        color_mask = cv.bitwise_and(labels.label_map.crop(ctx.in_range(*color_range)), window,
+                                    dst=ctx.scratch("pawns_color", window.shape))
+        color_mask = cv.erode(color_mask, np.ones((5, 5)), dst=ctx.scratch("pawns_eroded", window.shape))
+
+        if method == "components":
+            blobs, area, rows, cols = _components_blobs(color_mask)
+        else:
+            blobs, area, rows, cols = _contour_blobs(color_mask)
+
+        if len(blobs) == 0:
+            continue
+
+        # the blobs lie entirely inside a single clearing, so any of their pixels gives the clearing
+        clearing = clearing_idx[rows, cols]
+        biggest_area = area.max()
+
+        # sort by clearing, then by descending area
+        order = np.lexsort((-area, clearing))
+        order = order[clearing[order] >= 0]
+        blob, clearing, area = order, clearing[order], area[order]
+
+        counts = np.bincount(clearing, minlength=n_clearings)
+        starts = np.cumsum(counts) - counts
+        size = counts[clearing]
+        rank = np.arange(len(blob)) - starts[clearing]
+
+        next_area = np.append(area[1:], 0)
+        diffs = np.where(rank < size - 1, np.divide(area - next_area, area, out=np.zeros_like(area), where=area != 0),
+                         1)
+        breaks = (diffs > diff_sensitivity).astype(np.int64)
+        breaks_before = np.cumsum(breaks) - breaks
+        breaks_before -= breaks_before[starts[clearing]] if len(blob) else 0
+
+        # same rules as detect_pawns: the smallest pawn of a clearing is only kept if it is alone
+        keep = (((rank < size - 1) | (size == 1)) &
+                (np.divide(area, biggest_area) >= area_sensitivity if biggest_area != 0 else False) &
+                (breaks_before == 0))
+
+        for b_idx, c_idx in zip(blob[keep], clearing[keep]):
+            pawns[-1][int(c_idx)].append(blobs[b_idx] - offsets[c_idx].astype(np.int32))
+
+    return pawns[0], pawns[1]
+
+
+def _contour_blobs(mask: np.ndarray) -> tuple[list[np.ndarray], np.ndarray, np.ndarray, np.ndarray]:
+    contours, _ = cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    area = np.array([cv.contourArea(c) for c in contours], dtype=np.float64)
+
+    # the first point of a contour is a pixel of its blob
+    first = np.array([c[0, 0] for c in contours], dtype=np.int64).reshape(-1, 2)
+    return list(contours), area, first[:, 1], first[:, 0]
+
+
+def _components_blobs(mask: np.ndarray) -> tuple[list[np.ndarray], np.ndarray, np.ndarray, np.ndarray]:
+    n, components, stats, _ = cv.connectedComponentsWithStats(mask, connectivity=8)
+    left, top = stats[1:, cv.CC_STAT_LEFT], stats[1:, cv.CC_STAT_TOP]
+    width, height = stats[1:, cv.CC_STAT_WIDTH], stats[1:, cv.CC_STAT_HEIGHT]
+
+    # the leftmost column of the bounding box always holds a pixel of the component
+    rows = np.array([t + int(np.argmax(components[t:t + h, x] == i))
+                     for i, (x, t, h) in enumerate(zip(left, top, height), 1)], dtype=np.int64)
+    boxes = [np.array([[x, y], [x + w - 1, y], [x + w - 1, y + h - 1], [x, y + h - 1]], dtype=np.int32).reshape(-1, 1, 2)
+             for x, y, w, h in zip(left, top, width, height)]
+    return boxes, stats[1:, cv.CC_STAT_AREA].astype(np.float64), rows, left.astype(np.int64)
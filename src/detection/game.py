@@ -1,12 +1,15 @@
 import cv2 as cv
 import numpy as np
 
+from src.utils.context import FrameContext
+from src.utils.coverage import LabelMap, LabelGroup, contour_rects, rect_coverage
 from src.utils.images import calculate_color_coverage, crop_image
 
 
 def calculate_current_score(img: np.ndarray, cell_contours: list[np.ndarray],
                             orange: tuple[np.ndarray, np.ndarray],
-                            blue: tuple[np.ndarray, np.ndarray]) \
+                            blue: tuple[np.ndarray, np.ndarray], ctx: FrameContext | None = None,
+                            labels: LabelMap | LabelGroup | None = None) \
         -> tuple[int, int]:
     """
     Calculates the current score of the game
@@ -19,21 +22,29 @@ def calculate_current_score(img: np.ndarray, cell_contours: list[np.ndarray],
     :type orange: tuple[np.ndarray, np.ndarray]
     :param blue: Color range of the blue team
     :type blue: tuple[np.ndarray, np.ndarray]
+    :param ctx: Context of the image holding the shared color masks, defaults to None
+    :type ctx: FrameContext | None, optional
+    :param labels: Rasterized cell contours, if given the exact cell areas are used instead of the bounding rectangles,
+        defaults to None
+    :type labels: LabelMap | LabelGroup | None, optional
     :return: Current score of the game (Orange score, Blue score)
     :rtype: tuple[int, int]
     """
-    orange_coverage = list(map(lambda cont: get_contour_coverage(img, cont, orange[0], orange[1]), cell_contours))
-    blue_coverage = list(map(lambda cont: get_contour_coverage(img, cont, blue[0], blue[1]), cell_contours))
+    ctx = ctx if ctx is not None else FrameContext(img)
 
-    orange_score = orange_coverage.index(max(orange_coverage))
-    blue_score = blue_coverage.index(max(blue_coverage))
+    orange_coverage = get_contours_coverage(ctx, cell_contours, orange, labels)
+    blue_coverage = get_contours_coverage(ctx, cell_contours, blue, labels)
+
+    orange_score = int(np.argmax(orange_coverage))
+    blue_score = int(np.argmax(blue_coverage))
 
     return orange_score, blue_score
 
 
 def calculate_current_buildings_control(img: np.ndarray, cell_contours: list[np.ndarray],
                                         orange: tuple[np.ndarray, np.ndarray],
-                                        blue: tuple[np.ndarray, np.ndarray], color_sensitivity=0.33) \
+                                        blue: tuple[np.ndarray, np.ndarray], color_sensitivity=0.33,
+                                        ctx: FrameContext | None = None, labels: LabelMap | LabelGroup | None = None) \
         -> tuple[list[bool], list[bool]]:
     """
     Calculates the current buildings of the game by color
@@ -48,14 +59,21 @@ def calculate_current_buildings_control(img: np.ndarray, cell_contours: list[np.
     :type blue: tuple[np.ndarray, np.ndarray]
     :param color_sensitivity: Sensitivity of the color detection, defaults to 0.33
     :type color_sensitivity: float, optional
+    :param ctx: Context of the image holding the shared color masks, defaults to None
+    :type ctx: FrameContext | None, optional
+    :param labels: Rasterized cell contours, if given the exact cell areas are used instead of the bounding rectangles,
+        defaults to None
+    :type labels: LabelMap | LabelGroup | None, optional
     :return: Current buildings of the game (Orange buildings, Blue buildings)
     :rtype: tuple[list[bool], list[bool]]
     """
-    orange_coverage = list(map(lambda cont: get_contour_coverage(img, cont, orange[0], orange[1]), cell_contours))
-    blue_coverage = list(map(lambda cont: get_contour_coverage(img, cont, blue[0], blue[1]), cell_contours))
+    ctx = ctx if ctx is not None else FrameContext(img)
+
+    orange_coverage = get_contours_coverage(ctx, cell_contours, orange, labels)
+    blue_coverage = get_contours_coverage(ctx, cell_contours, blue, labels)
 
-    orange_buildings = [i > color_sensitivity for i in orange_coverage]
-    blue_buildings = [i > color_sensitivity for i in blue_coverage]
+    orange_buildings = (orange_coverage > color_sensitivity).tolist()
+    blue_buildings = (blue_coverage > color_sensitivity).tolist()
 
     return orange_buildings, blue_buildings
 
@@ -101,3 +119,27 @@ def get_contour_coverage(img: np.ndarray, contour: np.ndarray, lower_color: np.n
     """
     cell = crop_image(img, contour)
     return calculate_color_coverage(cell, lower_color, upper_color)
+
+
+def get_contours_coverage(ctx: FrameContext, contours: list[np.ndarray], color: tuple[np.ndarray, np.ndarray],
+                          labels: LabelMap | LabelGroup | None = None) -> np.ndarray:
+    """
+    Calculates the specified color coverage of all contours at once.
+    The bounding rectangles are looked up in the summed-area table of the color mask, the exact contour areas are
+    counted with a single pass over the rasterized contours
+
+    :param ctx: Context of the game image
+    :type ctx: FrameContext
+    :param contours: Contours of the cells
+    :type contours: list[np.ndarray]
+    :param color: Color range (lower bound, upper bound)
+    :type color: tuple[np.ndarray, np.ndarray]
+    :param labels: Rasterized contours, if given the exact contour areas are used, defaults to None
+    :type labels: LabelMap | LabelGroup | None, optional
+    :return: Color coverage of each contour
+    :rtype: np.ndarray
+    """
+    if labels is not None:
+        return labels.coverage(ctx.in_range(*color), ctx.frame_id)
+
+    return rect_coverage(ctx.integral(*color), contour_rects(contours))
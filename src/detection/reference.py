@@ -0,0 +1,180 @@
+from typing import Sequence
+
+import cv2 as cv
+import numpy as np
+
+
+class ReferenceMatcher:
+    """
+    Detects a reference object in frames using SIFT descriptors.
+    The reference key points and descriptors are computed once on creation, or loaded precomputed,
+    so every detection only pays for the frame features and the matching
+
+    :var ref: Reference object image
+    :type ref: np.ndarray
+    :var ref_gray: Grayscale reference object image
+    :type ref_gray: np.ndarray
+    :var sift: SIFT feature extractor
+    :type sift: cv.SIFT
+    :var keypoints: Key points of the reference image packed by pack_keypoints
+    :type keypoints: np.ndarray
+    :var desc: Descriptors of the reference image
+    :type desc: np.ndarray
+    """
+    INDEX_PARAMS = dict(algorithm=1, trees=4)
+    SEARCH_PARAMS = dict(checks=32)
+
+    def __init__(self, ref: np.ndarray, features: tuple[np.ndarray, np.ndarray] | None = None):
+        """
+        Initializes the matcher, the reference features are extracted unless they are given
+
+        :param ref: Reference object image
+        :type ref: np.ndarray
+        :param features: Precomputed key points packed by pack_keypoints and descriptors of the reference,
+            defaults to None
+        :type features: tuple[np.ndarray, np.ndarray] | None, optional
+        """
+        self.ref = ref
+        self.ref_gray = cv.cvtColor(ref, cv.COLOR_BGR2GRAY)
+        self.sift = cv.SIFT_create()
+
+        if features is None:
+            kp, desc = self.sift.detectAndCompute(self.ref_gray, None)
+            features = pack_keypoints(kp), desc
+
+        self.keypoints, self.desc = features
+        self._points = np.float32(self.keypoints[:, :2])
+        self._kp = None
+
+    @property
+    def kp(self) -> list[cv.KeyPoint]:
+        """
+        Key points of the reference image, only unpacked when needed for drawing
+
+        :rtype: list[cv.KeyPoint]
+        """
+        if self._kp is None:
+            self._kp = unpack_keypoints(self.keypoints)
+
+        return self._kp
+
+    def match(self, img: np.ndarray, distance=0.25, gray: np.ndarray | None = None) \
+            -> tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None, list[cv.DMatch], list, np.ndarray | None]:
+        """
+        Matches the reference features against the frame and finds the homography between them
+
+        :param img: Image to detect the reference object in
+        :type img: np.ndarray
+        :param distance: Distance threshold for the matches, defaults to 0.25
+        :type distance: float, optional
+        :param gray: Grayscale version of the image if already computed, defaults to None
+        :type gray: np.ndarray | None, optional
+        :return: Homography matrix, reference points, image points, matches, image key points, inlier mask.
+            Everything but the matches and key points is None if not found
+        :rtype: tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None, list[cv.DMatch], list,
+            np.ndarray | None]
+        """
+        if gray is None:
+            gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+
+        kp, desc = self.sift.detectAndCompute(gray, None)
+
+        if desc is None or len(desc) == 0:
+            return None, None, None, [], kp, None
+
+        # match the reference descriptors against the frame and filter them by distance
+        matcher = cv.FlannBasedMatcher(self.INDEX_PARAMS, self.SEARCH_PARAMS)
+        matches = matcher.match(self.desc, desc)
+        max_distance = max(matches, key=lambda x: x.distance).distance
+        matches = [match for match in matches if match.distance < distance * max_distance]
+
+        # at least 4 point pairs are needed for the homography
+        if len(matches) < 4:
+            return None, None, None, matches, kp, None
+
+        src_pts = self._points[[match.queryIdx for match in matches]].reshape(-1, 1, 2)
+        dst_pts = np.float32([kp[match.trainIdx].pt for match in matches]).reshape(-1, 1, 2)
+        m, mask = cv.findHomography(src_pts, dst_pts, cv.RANSAC, 5.0)
+
+        if m is None:
+            return None, None, None, matches, kp, None
+
+        return m, src_pts, dst_pts, matches, kp, mask
+
+    def contour(self, m: np.ndarray, shape: tuple[int, ...]) -> np.ndarray:
+        """
+        Finds the contour of the reference object warped by the homography matrix
+
+        :param m: Homography matrix from the reference to the image
+        :type m: np.ndarray
+        :param shape: Shape of the image
+        :type shape: tuple[int, ...]
+        :return: Contour of the reference object
+        :rtype: np.ndarray
+        """
+        ref_gray = cv.warpPerspective(self.ref_gray, m, (shape[1], shape[0]))
+        _, ref_gray = cv.threshold(ref_gray, 50, 255, cv.THRESH_BINARY)
+        ref_gray = cv.morphologyEx(ref_gray, cv.MORPH_CLOSE, kernel=np.ones((7, 7)))
+        contours, _ = cv.findContours(ref_gray, cv.RETR_TREE, 2)
+        return contours[0]
+
+    def detect(self, img: np.ndarray, distance=0.25, draw_matches=False, gray: np.ndarray | None = None) \
+            -> tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None]:
+        """
+        Detects the reference object in the image
+
+        :param img: Image to detect the reference object in
+        :type img: np.ndarray
+        :param distance: Distance threshold for the matches, defaults to 0.25
+        :type distance: float, optional
+        :param draw_matches: Whether to draw the matches over the image, defaults to False
+        :type draw_matches: bool, optional
+        :param gray: Grayscale version of the image if already computed, defaults to None
+        :type gray: np.ndarray | None, optional
+        :return: Homography matrix, contour of the reference object, image with matches drawn (if draw_matches is True).
+            Matrix and contour are None if not found
+        :rtype: tuple[np.ndarray | None, np.ndarray | None, np.ndarray | None]
+        """
+        m, _, _, matches, kp, mask = self.match(img, distance, gray)
+
+        if m is None:
+            return None, None, None
+
+        obj_contour = self.contour(m, img.shape)
+
+        if draw_matches:
+            draw_params = dict(matchColor=(255, 0, 0),  # draw matches in green color
+                               singlePointColor=None,
+                               matchesMask=mask.ravel().tolist(),  # draw only inliers
+                               flags=2 | 4,
+                               )
+            img_matches = cv.drawMatches(self.ref, self.kp, img, kp, matches, None, **draw_params)
+            return m, obj_contour, img_matches
+        else:
+            return m, obj_contour, None
+
+
+def pack_keypoints(kp: Sequence[cv.KeyPoint]) -> np.ndarray:
+    """
+    Packs the key points into a single array
+
+    :param kp: Key points
+    :type kp: Sequence[cv.KeyPoint]
+    :return: Array of (x, y, size, angle, response, octave, class id) rows
+    :rtype: np.ndarray
+    """
+    return np.array([(*k.pt, k.size, k.angle, k.response, k.octave, k.class_id) for k in kp],
+                    np.float64).reshape(-1, 7)
+
+
+def unpack_keypoints(keypoints: np.ndarray) -> list[cv.KeyPoint]:
+    """
+    Unpacks the key points packed by pack_keypoints
+
+    :param keypoints: Array of (x, y, size, angle, response, octave, class id) rows
+    :type keypoints: np.ndarray
+    :return: Key points
+    :rtype: list[cv.KeyPoint]
+    """
+    return [cv.KeyPoint(x, y, size, angle, response, int(octave), int(class_id))
+            for x, y, size, angle, response, octave, class_id in keypoints.tolist()]
@@ -2,7 +2,8 @@ import numpy as np
 import cv2 as cv
 
 from src.tracking.StaticObject import StaticObject
-from src.detection.elements import detect_from_reference
+from src.detection.reference import ReferenceMatcher
+from src.utils.contours import warp_contour
 
 
 class Board(StaticObject):
@@ -15,30 +16,135 @@ class Board(StaticObject):
     :type ref: np.ndarray
     :var distance: Distance threshold for the matching algorithm, defaults to 0.25
     :type distance: float, optional
+    :var matcher: Matcher holding the precomputed reference features
+    :type matcher: ReferenceMatcher
+    :var m: Homography matrix from the reference to the frame
+    :type m: np.ndarray | None
+    :var version: Counter increased every time the homography matrix changes
+    :type version: int
     :var contour: Contour of the board
     :type contour: np.ndarray | None
+    :var track: Whether the homography is propagated between re-detections with optical flow
+    :type track: bool
+    :var min_inliers: Minimal number of tracked inliers before falling back to the full re-detection
+    :type min_inliers: int
+    :var max_error: Maximal mean reprojection error in pixels before falling back to the full re-detection
+    :type max_error: float
+    :var min_shift: Minimal shift of the board corners in pixels for the new homography to be accepted
+    :type min_shift: float
+    :var max_points: Maximal number of tracked key points
+    :type max_points: int
     """
-    def __init__(self, name, ref, distance=0.25):
+    def __init__(self, name, ref, distance=0.25, matcher: ReferenceMatcher | None = None, track=False,
+                 min_inliers=30, max_error=3.0, min_shift=1.0, max_points=300):
         """
-        Initializes the board object
+        Initializes the board object, the reference features are extracted here unless a matcher is given
         """
         super().__init__(name)
         self.ref = ref
         self.distance = distance
+        self.matcher = matcher if matcher is not None else ReferenceMatcher(ref)
         self.m = None
+        self.version = 0
         self.contour = None
 
-    def re_detect(self, frame):
-        m, contour, _ = detect_from_reference(frame, self.ref, distance=self.distance)
+        self.track = track
+        self.min_inliers = min_inliers
+        self.max_error = max_error
+        self.min_shift = min_shift
+        self.max_points = max_points
 
-        if m is None or contour is None:
+        self._ref_contour = None
+        self._ref_corners = np.float32([[0, 0], [ref.shape[1], 0], [ref.shape[1], ref.shape[0]],
+                                        [0, ref.shape[0]]]).reshape(-1, 1, 2)
+        self._ref_pts = None
+        self._pts = None
+        self._prev_gray = None
+        self._fresh = False
+
+    def re_detect(self, frame, ctx=None):
+        gray = ctx.gray if ctx is not None else cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        m, src_pts, dst_pts, _, _, mask = self.matcher.match(frame, self.distance, gray)
+
+        if m is None:
+            # the tracked points are dropped, so an occluded board waits for the next scheduled re-detection
+            # instead of falling back to the full re-detection on every frame
+            self._pts = None
+            self._prev_gray = None
             return
 
-        self.m = m
-        self.contour = contour
+        self._set_homography(m, self.matcher.contour(m, frame.shape))
+
+        if self.track:
+            # keep a sparse set of the RANSAC inliers to track until the next re-detection
+            inliers = mask.ravel() == 1
+            step = max(1, int(np.count_nonzero(inliers)) // self.max_points)
+            self._ref_pts = np.ascontiguousarray(src_pts[inliers][::step])
+            self._pts = np.ascontiguousarray(dst_pts[inliers][::step])
+            self._prev_gray = gray
+            self._fresh = True
+
+    def update(self, frame, ctx=None):
+        if not self.track or self._pts is None:
+            return
+
+        # the frame was just re-detected, there is nothing to propagate
+        if self._fresh:
+            self._fresh = False
+            return
+
+        gray = ctx.gray if ctx is not None else cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        pts, status, _ = cv.calcOpticalFlowPyrLK(self._prev_gray, gray, self._pts, None,
+                                                 winSize=(21, 21), maxLevel=3)
+        found = status.ravel() == 1
+
+        if np.count_nonzero(found) < self.min_inliers:
+            self.re_detect(frame, ctx)
+            return
+
+        ref_pts, pts = self._ref_pts[found], pts[found]
+        m, mask = cv.findHomography(ref_pts, pts, cv.RANSAC, self.max_error)
+
+        if m is None:
+            self.re_detect(frame, ctx)
+            return
+
+        inliers = mask.ravel() == 1
+        ref_pts, pts = ref_pts[inliers], pts[inliers]
+        error = np.mean(np.linalg.norm(cv.perspectiveTransform(ref_pts, m) - pts, axis=2)) if len(pts) else np.inf
+
+        if len(pts) < self.min_inliers or error > self.max_error:
+            self.re_detect(frame, ctx)
+            return
+
+        self._ref_pts, self._pts, self._prev_gray = ref_pts, pts, gray
+
+        # sub-pixel jitter is ignored so that the objects depending on the board are not refreshed needlessly
+        shift = np.max(np.linalg.norm(cv.perspectiveTransform(self._ref_corners, m) -
+                                      cv.perspectiveTransform(self._ref_corners, self.m), axis=2))
+        if shift < self.min_shift:
+            return
+
+        if self._ref_contour is None:
+            self._ref_contour = self.matcher.contour(np.eye(3), self.ref.shape)
+
+        self._set_homography(m, warp_contour(self._ref_contour, m))
 
     def draw(self, frame, color=(0, 122, 0)) -> np.ndarray:
         if self.contour is None:
             return frame
 
         return cv.drawContours(frame, [self.contour], -1, color, 2)
+
+    def snapshot(self) -> dict:
+        return {"m": self.m.tolist() if self.m is not None else None,
+                "contour": self.contour.tolist() if self.contour is not None else None}
+
+    def restore(self, frame, snapshot):
+        if snapshot is not None and snapshot["m"] is not None:
+            self._set_homography(np.array(snapshot["m"]), np.array(snapshot["contour"], np.int32))
+
+    def _set_homography(self, m: np.ndarray, contour: np.ndarray):
+        self.m = m
+        self.contour = contour
+        self.version += 1
@@ -0,0 +1,184 @@
+import numpy as np
+
+from src.tracking.Board import Board
+from src.tracking.BoardRectifier import BoardRectifier
+from src.utils.context import FrameContext
+from src.utils.contours import warp_contour
+from src.utils.coverage import LabelMap, LabelGroup, contour_rects
+
+
+class BoardGeometry:
+    """
+    Cache of the static board contours warped into the analysis space.
+    Whenever the analysis space changes, all registered contours are warped once and rasterized into a single label
+    image shared by every object analyzing the board.
+
+    The analysis space is the frame itself, or the fixed rectified board image if a rectifier is given,
+    in which case the contours are warped and rasterized only once
+
+    :var board: Board the contours are attached to
+    :type board: Board
+    :var rectifier: Rectifier of the board, None to analyze the frame directly
+    :type rectifier: BoardRectifier | None
+    :var contours: Warped contours of each group in the analysis space
+    :type contours: dict[str, list[np.ndarray]]
+    :var rects: Bounding rectangles of the warped contours of each group in the analysis space
+    :type rects: dict[str, np.ndarray]
+    :var labels: Label map of all warped contours in the analysis space
+    :type labels: LabelMap | None
+    :var version: Version of the analysis space the cache was built for
+    :type version: int | None
+    :var shape: Shape of the analysis space (height, width)
+    :type shape: tuple[int, int] | None
+    """
+    def __init__(self, board: Board, rectifier: BoardRectifier | None = None):
+        """
+        Initializes the empty geometry of the board
+
+        :param board: Board the contours are attached to
+        :type board: Board
+        :param rectifier: Rectifier of the board, defaults to None
+        :type rectifier: BoardRectifier | None, optional
+        """
+        self.board = board
+        self.rectifier = rectifier
+        self.contours: dict[str, list[np.ndarray]] = {}
+        self.rects: dict[str, np.ndarray] = {}
+        self.labels: LabelMap | None = None
+        self.version = None
+        self.shape = None
+
+        self._static: dict[str, tuple[list[np.ndarray], int]] = {}
+        self._groups: dict[str, LabelGroup] = {}
+        self._frame_contours: dict[str, list[np.ndarray]] = {}
+        self._frame_version = None
+
+    def register(self, name: str, contours: list[np.ndarray], layer=0) -> None:
+        """
+        Registers a group of static contours in the reference space of the board
+
+        :param name: Name of the group
+        :type name: str
+        :param contours: Contours in the reference space
+        :type contours: list[np.ndarray]
+        :param layer: Groups on higher layers are rasterized over the lower ones, defaults to 0
+        :type layer: int, optional
+        """
+        self._static[name] = (contours, layer)
+        self.version = None
+        self._frame_version = None
+
+    def context(self, ctx: FrameContext) -> FrameContext:
+        """
+        Returns the context of the analysis space for the frame
+
+        :param ctx: Context of the frame
+        :type ctx: FrameContext
+        :return: Context of the analysis space
+        :rtype: FrameContext
+        """
+        return ctx if self.rectifier is None else ctx.rectified(self.rectifier)
+
+    def refresh(self, shape: tuple[int, ...]) -> bool:
+        """
+        Rebuilds the cache if the analysis space or the frame shape changed
+
+        :param shape: Shape of the frame
+        :type shape: tuple[int, ...]
+        :return: Whether the cache was rebuilt
+        :rtype: bool
+        """
+        if self.rectifier is not None:
+            m, version, shape = self.rectifier.m, self.rectifier.version, self.rectifier.shape
+        else:
+            m, version = self.board.m, self.board.version
+
+        if m is None or (self.version == version and self.shape == shape[:2]):
+            return False
+
+        self.contours = {name: [warp_contour(c, m) for c in contours] for name, (contours, _) in self._static.items()}
+        self.rects = {name: contour_rects(contours) for name, contours in self.contours.items()}
+
+        # the labels follow the painting order, lower layers first
+        names = sorted(self._static, key=lambda n: self._static[n][1])
+        self.labels = LabelMap([c for name in names for c in self.contours[name]], shape)
+
+        self._groups = {}
+        start = 0
+        for name in names:
+            stop = start + len(self.contours[name])
+            self._groups[name] = self.labels.group(start, stop)
+            start = stop
+
+        self.version = version
+        self.shape = shape[:2]
+        return True
+
+    def group(self, name: str) -> LabelGroup:
+        """
+        Returns the rasterized contours of the group
+
+        :param name: Name of the group
+        :type name: str
+        :return: View of the group in the shared label map
+        :rtype: LabelGroup
+        """
+        return self._groups[name]
+
+    def pixel_counts(self, name: str) -> np.ndarray:
+        """
+        Returns the number of pixels of each rasterized contour of the group
+
+        :param name: Name of the group
+        :type name: str
+        :return: Number of pixels of each contour
+        :rtype: np.ndarray
+        """
+        group = self._groups[name]
+        return self.labels.counts[group.start + 1:group.stop + 1]
+
+    def frame_contours(self, name: str) -> list[np.ndarray]:
+        """
+        Returns the contours of the group in the frame, used for drawing
+
+        :param name: Name of the group
+        :type name: str
+        :return: Contours of the group in the frame
+        :rtype: list[np.ndarray]
+        """
+        if self.rectifier is None:
+            return self.contours[name]
+
+        # the contours are only warped into the frame when they are drawn
+        if self._frame_version != self.board.version:
+            self._frame_contours = {}
+            self._frame_version = self.board.version
+
+        if name not in self._frame_contours:
+            self._frame_contours[name] = [warp_contour(c, self.board.m) for c in self._static[name][0]]
+
+        return self._frame_contours[name]
+
+    @property
+    def frame_version(self) -> int | None:
+        """
+        Version of the contours in the frame, changes whenever frame_contours and to_frame do
+
+        :return: Version of the analysis space or of the board homography if the board is rectified
+        :rtype: int | None
+        """
+        return self.version if self.rectifier is None else self.board.version
+
+    def to_frame(self, contour: np.ndarray) -> np.ndarray:
+        """
+        Warps the contour from the analysis space into the frame
+
+        :param contour: Contour in the analysis space
+        :type contour: np.ndarray
+        :return: Contour in the frame
+        :rtype: np.ndarray
+        """
+        if self.rectifier is None:
+            return contour
+
+        return warp_contour(contour, self.rectifier.to_frame())
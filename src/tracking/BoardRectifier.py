@@ -0,0 +1,81 @@
+import cv2 as cv
+import numpy as np
+
+from src.tracking.Board import Board
+
+
+class BoardRectifier:
+    """
+    Warps the board region of the frames into the fixed geometry of the board reference.
+    The remap lookup table is cached and only rebuilt when the board homography changes
+
+    :var board: Board providing the homography
+    :type board: Board
+    :var scale: Scale of the rectified image relative to the reference
+    :type scale: float
+    :var m: Transformation matrix from the reference to the rectified image
+    :type m: np.ndarray
+    :var version: Version of the rectified space, constant as the rectified geometry never changes
+    :type version: int
+    :var shape: Shape of the rectified image (height, width)
+    :type shape: tuple[int, int]
+    """
+    def __init__(self, board: Board, scale=0.5):
+        """
+        Initializes the rectifier, the scale should keep the pawns several pixels wide
+
+        :param board: Board providing the homography
+        :type board: Board
+        :param scale: Scale of the rectified image relative to the reference, defaults to 0.5
+        :type scale: float, optional
+        """
+        self.board = board
+        self.scale = scale
+        self.m = np.diag([scale, scale, 1.0])
+        self.version = 0
+        self.shape = (int(round(board.ref.shape[0] * scale)), int(round(board.ref.shape[1] * scale)))
+
+        self._map1 = None
+        self._map2 = None
+        self._board_version = None
+
+    def to_frame(self) -> np.ndarray | None:
+        """
+        Returns the transformation matrix from the rectified image to the frame
+
+        :return: Transformation matrix, None if the board was not detected yet
+        :rtype: np.ndarray | None
+        """
+        if self.board.m is None:
+            return None
+
+        return self.board.m @ np.linalg.inv(self.m)
+
+    def rectify(self, frame: np.ndarray, dst: np.ndarray | None = None) -> np.ndarray:
+        """
+        Warps the board region of the frame into the rectified geometry
+
+        :param frame: Frame to be rectified
+        :type frame: np.ndarray
+        :param dst: Buffer of the rectified shape to write the rectified board into, defaults to None
+        :type dst: np.ndarray | None, optional
+        :return: Rectified board image, black if the board was not detected yet
+        :rtype: np.ndarray
+        """
+        if self.board.m is None:
+            return np.zeros(self.shape + frame.shape[2:], dtype=frame.dtype)
+
+        if self._board_version != self.board.version:
+            self._build_maps()
+
+        return cv.remap(frame, self._map1, self._map2, cv.INTER_LINEAR, dst=dst)
+
+    def _build_maps(self):
+        height, width = self.shape
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        points = np.stack([xs, ys], axis=-1).reshape(-1, 1, 2)
+
+        # fixed point maps are noticeably faster to remap with than the float ones
+        mapped = cv.perspectiveTransform(points, self.to_frame()).reshape(height, width, 2).astype(np.float32)
+        self._map1, self._map2 = cv.convertMaps(mapped, None, cv.CV_16SC2)
+        self._board_version = self.board.version
@@ -5,31 +5,54 @@ from src.detection.game import calculate_current_buildings_control
 from src.detection.elements import detect_clearings_and_buildings
 from src.tracking.Board import Board
 from src.tracking.StaticObject import StaticObject
-from src.utils.contours import warp_contour
+from src.tracking.BoardGeometry import BoardGeometry
+from src.utils.context import FrameContext
+from src.viz.overlay import OverlayLayer, opaque
 
 
 class Buildings(StaticObject):
-    def __init__(self, name, board: Board, mask: np.ndarray):
+    def __init__(self, name, board: Board, mask: np.ndarray, exact=False, geometry: BoardGeometry | None = None,
+                 precomputed: tuple[list[np.ndarray], dict[int, list[np.ndarray]]] | None = None):
         super().__init__(name)
         self.board = board
+        self.board_version = None
 
-        _, buildings_by_clearing = detect_clearings_and_buildings(mask)
+        # the clearings of the mask may come precomputed from the asset bundle
+        _, buildings_by_clearing = precomputed if precomputed is not None else detect_clearings_and_buildings(mask)
         self.static_contours = [building for clearing in buildings_by_clearing.values() for building in clearing]
         self.building_contours = None
+        self.exact = exact
+        self.building_labels = None
+
+        self.geometry = geometry if geometry is not None else BoardGeometry(board)
+        self.geometry.register("buildings", self.static_contours, layer=1)
 
         self.orange_buildings, self.blue_buildings = [], []
         self.current_score = None
         self.scores = []
+        self.overlay = OverlayLayer()
+
+    def re_detect(self, frame, ctx=None):
+        self.board_version = self.board.version
+        self.geometry.refresh(frame.shape)
+        self.building_contours = self.geometry.contours["buildings"]
 
-    def re_detect(self, frame):
-        self.building_contours = list(map(lambda c: warp_contour(c, self.board.m), self.static_contours))
+        if self.exact:
+            self.building_labels = self.geometry.group("buildings")
 
-    def detect_events(self, frame: np.ndarray):
+    def detect_events(self, frame: np.ndarray, ctx=None):
         self.event.update()
 
-        ob, bb = calculate_current_buildings_control(frame, self.building_contours,
+        # the board homography was updated in between re-detections
+        if self.board_version != self.board.version:
+            self.re_detect(frame, ctx)
+
+        ctx = ctx if ctx is not None else FrameContext(frame)
+        board_ctx = self.geometry.context(ctx)
+        ob, bb = calculate_current_buildings_control(board_ctx.frame, self.building_contours,
                                                      (StaticObject.LOWER_ORANGE, StaticObject.UPPER_ORANGE),
-                                                     (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE))
+                                                     (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE),
+                                                     ctx=board_ctx, labels=self.building_labels)
         new_score = self._calculate_score(ob, bb)
 
         self.scores.append(new_score)
@@ -47,14 +70,30 @@ class Buildings(StaticObject):
             self.event.reset()
 
     def draw(self, frame, msg=None, color=(0, 122, 0)):
-        orange_buildings = [self.building_contours[i] for i in range(len(self.building_contours)) if
+        # the buildings are only drawn again when the board moves or their ownership changes
+        key = self.geometry.frame_version, color, tuple(self.orange_buildings), tuple(self.blue_buildings)
+        return self.overlay.draw(frame, key, lambda layer: self._draw_layer(layer, color))
+
+    def _draw_layer(self, layer: np.ndarray, color: tuple[int, int, int]) -> None:
+        building_contours = self.geometry.frame_contours("buildings")
+        orange_buildings = [building_contours[i] for i in range(len(building_contours)) if
                             self.orange_buildings[i]]
-        blue_buildings = [self.building_contours[i] for i in range(len(self.building_contours)) if
+        blue_buildings = [building_contours[i] for i in range(len(building_contours)) if
                           self.blue_buildings[i]]
-        frame = cv.drawContours(frame, self.building_contours, -1, color, 2)
-        frame = cv.drawContours(frame, orange_buildings, -1, StaticObject.ORANGE_COLOR, 3)
-        frame = cv.drawContours(frame, blue_buildings, -1, StaticObject.BLUE_COLOR, 3)
-        return frame
+        cv.drawContours(layer, building_contours, -1, opaque(color), 2)
+        cv.drawContours(layer, orange_buildings, -1, opaque(StaticObject.ORANGE_COLOR), 3)
+        cv.drawContours(layer, blue_buildings, -1, opaque(StaticObject.BLUE_COLOR), 3)
+
+    def snapshot(self) -> dict:
+        return {"orange": [bool(b) for b in self.orange_buildings], "blue": [bool(b) for b in self.blue_buildings]}
+
+    def restore(self, frame, snapshot):
+        # the buildings follow the restored board
+        if self.board_version != self.board.version and self.board.m is not None:
+            self.re_detect(frame)
+
+        if snapshot is not None:
+            self.orange_buildings, self.blue_buildings = snapshot["orange"], snapshot["blue"]
 
     def _get_average_score(self) -> tuple[int, int]:
         return (np.mean([score[0] for score in self.scores], axis=0, dtype=int),
@@ -3,7 +3,7 @@ import cv2 as cv
 
 from src.tracking.StaticObject import StaticObject
 from src.tracking.TrackedObject import TrackedObject
-from src.detection.elements import detect_from_reference
+from src.detection.reference import ReferenceMatcher
 from src.viz.images import draw_bbox
 
 
@@ -14,7 +14,7 @@ class Card(TrackedObject):
         self.distance = distance
         self.card_pile = card_pile
 
-    def detect_events(self, frame: np.ndarray):
+    def detect_events(self, frame: np.ndarray, ctx=None):
         self.event.update()
 
         if self.is_moving():
@@ -38,14 +38,16 @@ class Card(TrackedObject):
 
 
 class CardPile(StaticObject):
-    def __init__(self, name, ref, distance=0.5):
+    def __init__(self, name, ref, distance=0.5, matcher: ReferenceMatcher | None = None):
         super().__init__(name)
         self.ref = ref
         self.distance = distance
+        self.matcher = matcher if matcher is not None else ReferenceMatcher(ref)
         self.contour = None
 
-    def re_detect(self, frame):
-        _, contour, _ = detect_from_reference(frame, self.ref, distance=self.distance, draw_matches=False)
+    def re_detect(self, frame, ctx=None):
+        gray = ctx.gray if ctx is not None else None
+        _, contour, _ = self.matcher.detect(frame, distance=self.distance, draw_matches=False, gray=gray)
 
         if contour is None:
             return
@@ -54,3 +56,10 @@ class CardPile(StaticObject):
 
     def draw(self, frame, msg=None, color=(0, 255, 0)):
         return cv.drawContours(frame, [self.contour], -1, color, 2)
+
+    def snapshot(self) -> dict:
+        return {"contour": self.contour.tolist() if self.contour is not None else None}
+
+    def restore(self, frame, snapshot):
+        if snapshot is not None:
+            self.contour = np.array(snapshot["contour"], np.int32) if snapshot["contour"] is not None else None
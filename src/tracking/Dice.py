@@ -1,7 +1,7 @@
 import cv2 as cv
 import numpy as np
 
-from src.detection.elements import detect_dice_tray
+from src.detection.elements import detect_dice_tray_in_roi
 from src.tracking.StaticObject import StaticObject
 from src.tracking.TrackedObject import TrackedObject
 
@@ -22,7 +22,7 @@ class Dice(TrackedObject):
             self.is_init = False
             self.init_tracker(frame, dice)
 
-    def detect_events(self, frame: np.ndarray):
+    def detect_events(self, frame: np.ndarray, ctx=None):
         self.event.update()
 
         if self.is_moving():
@@ -40,15 +40,65 @@ class Dice(TrackedObject):
 
 
 class DiceTray(StaticObject):
-    def __init__(self, name, threshold=30):
+    def __init__(self, name, threshold=30, roi_margin: float | None = 0.5, area_tolerance=1.5):
         super().__init__(name, refresh_rate=120)  # match tracked object refresh rate
         self.dice_1 = None
         self.dice_2 = None
         self.tray = None
         self.threshold = threshold
 
-    def re_detect(self, frame):
-        self.tray, self.dice_1, self.dice_2, _ = detect_dice_tray(frame, self.threshold, False)
+        # the tray is searched around its last position first, None to always search the whole frame
+        self.roi_margin = roi_margin
+        self.area_tolerance = area_tolerance
+
+    def re_detect(self, frame, ctx=None):
+        gray = ctx.gray if ctx is not None else None
+
+        if self.tray is not None and self.roi_margin is not None:
+            roi = self._get_roi(frame.shape)
+            found = detect_dice_tray_in_roi(frame, roi, self.threshold, gray)
+
+            # the whole frame is searched if the region is empty or the tray found in it is not trusted
+            if found is not None and self._is_valid(found[0], roi, frame.shape):
+                self.tray, self.dice_1, self.dice_2 = found
+                return
+
+        found = detect_dice_tray_in_roi(frame, (0, 0, frame.shape[1], frame.shape[0]), self.threshold, gray)
+
+        # a tray covered in the whole frame keeps its last position, the dice under the cover are not known
+        if found is None:
+            self.dice_1, self.dice_2 = None, None
+            return
+
+        self.tray, self.dice_1, self.dice_2 = found
+
+    def _get_roi(self, shape) -> tuple[int, int, int, int]:
+        x, y, w, h = cv.boundingRect(self.tray)
+        dx, dy = int(w * self.roi_margin), int(h * self.roi_margin)
+        x0, y0 = max(x - dx, 0), max(y - dy, 0)
+        x1, y1 = min(x + w + dx, shape[1]), min(y + h + dy, shape[0])
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _is_valid(self, tray, roi, shape) -> bool:
+        # the tray found in the region is only trusted if it kept its size and is not cut off by the region
+        area, last_area = cv.contourArea(tray), cv.contourArea(self.tray)
+        if last_area == 0 or not 1 / self.area_tolerance <= area / last_area <= self.area_tolerance:
+            return False
+
+        x, y, w, h = cv.boundingRect(tray)
+        rx, ry, rw, rh = roi
+        return ((x > rx or rx == 0) and (y > ry or ry == 0) and
+                (x + w < rx + rw or rx + rw == shape[1]) and (y + h < ry + rh or ry + rh == shape[0]))
 
     def draw(self, frame, msg=None, color=(0, 122, 0)):
+        if self.tray is None:
+            return frame
+
         return cv.drawContours(frame, [self.tray], -1, color, 2)
+
+    def snapshot(self) -> dict:
+        return {"tray": self.tray.tolist() if self.tray is not None else None}
+
+    def restore(self, frame, snapshot):
+        if snapshot is not None:
+            self.tray = np.array(snapshot["tray"], np.int32) if snapshot["tray"] is not None else None
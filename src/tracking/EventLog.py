@@ -0,0 +1,74 @@
+import json
+from typing import TextIO
+
+from src.tracking.Event import Event
+
+
+class EventLog:
+    """
+    Structured stream of the events raised by the objects, an event is emitted once when it is raised
+    and again only if its message changes or it expired in the meantime
+
+    :var records: Emitted events, each with the frame index, time in seconds, object name and message
+    :type records: list[dict]
+    :var fps: Frame rate of the video used to timestamp the events
+    :type fps: float | None
+    :var stream: Stream the events are written to as JSON lines when emitted
+    :type stream: TextIO | None
+    """
+    def __init__(self, fps: float | None = None, stream: TextIO | None = None):
+        """
+        Initializes the empty event log
+
+        :param fps: Frame rate of the video, defaults to None
+        :type fps: float | None, optional
+        :param stream: Stream to write the events to as JSON lines, defaults to None
+        :type stream: TextIO | None, optional
+        """
+        self.records: list[dict] = []
+        self.fps = fps
+        self.stream = stream
+        self._last: dict[str, tuple[str, bool]] = {}
+
+    def collect(self, frame_id: int, objects: list) -> list[dict]:
+        """
+        Emits the events raised by the objects in the frame, must be called after the events of the frame are detected
+
+        :param frame_id: Index of the frame in the video
+        :type frame_id: int
+        :param objects: Objects with an event attribute
+        :type objects: list[TrackedObject | StaticObject]
+        :return: Events emitted in the frame
+        :rtype: list[dict]
+        """
+        emitted = []
+
+        for obj in objects:
+            event: Event = obj.event
+            last_msg, expired = self._last.get(obj.name, ("", True))
+
+            if event.timer == 0 and event.msg and (event.msg != last_msg or expired):
+                emitted.append(self._make_record(frame_id, obj.name, event.msg))
+
+            self._last[obj.name] = (event.msg, event.over_limit())
+
+        for record in emitted:
+            self.emit(record)
+
+        return emitted
+
+    def emit(self, record: dict) -> None:
+        """
+        Appends the event to the log and writes it to the stream
+
+        :param record: Event with the frame index, time in seconds, object name and message
+        :type record: dict
+        """
+        self.records.append(record)
+
+        if self.stream is not None:
+            self.stream.write(json.dumps(record) + "\n")
+
+    def _make_record(self, frame_id: int, name: str, msg: str) -> dict:
+        time = round(frame_id / self.fps, 3) if self.fps else None
+        return {"frame": frame_id, "time": time, "object": name, "msg": msg}
@@ -3,40 +3,64 @@ import numpy as np
 
 from src.tracking.StaticObject import StaticObject
 from src.tracking.Board import Board
-from src.detection.elements import detect_pawns, detect_clearings_and_buildings
+from src.detection.elements import detect_pawns_labeled, detect_clearings_and_buildings
 from src.detection.game import calculate_current_clearing_control
-from src.utils.contours import warp_contour
+from src.tracking.BoardGeometry import BoardGeometry
+from src.utils.context import FrameContext
 from src.viz.images import draw_bbox
+from src.viz.overlay import OverlayLayer, opaque
 
 
 class Pawns(StaticObject):
-    def __init__(self, name, board: Board, mask: np.ndarray, diff_sensitivity=0.4, area_sensitivity=0.3):
+    def __init__(self, name, board: Board, mask: np.ndarray, diff_sensitivity=0.4, area_sensitivity=0.3,
+                 geometry: BoardGeometry | None = None, method="contours",
+                 precomputed: tuple[list[np.ndarray], dict[int, list[np.ndarray]]] | None = None):
         super().__init__(name)
         self.board = board
+        self.board_version = None
         self.static_mask = mask
-        self.static_contours, _ = detect_clearings_and_buildings(mask)
+        # the clearings of the mask may come precomputed from the asset bundle
+        self.static_contours, buildings_by_clearing = precomputed if precomputed is not None else \
+            detect_clearings_and_buildings(mask)
+
+        # the buildings are holes in the clearing mask, so they are painted over the clearings
+        self.geometry = geometry if geometry is not None else BoardGeometry(board)
+        self.geometry.register("clearings", self.static_contours, layer=0)
+        self.geometry.register("buildings", [building for clearing in buildings_by_clearing.values()
+                                             for building in clearing], layer=1)
 
-        self.mask = None
         self.contours = None
 
         self.diff_sensitivity = diff_sensitivity
         self.area_sensitivity = area_sensitivity
+        self.method = method
 
         self.orange_pawns, self.blue_pawns = {}, {}
         self.orange_clearings, self.blue_clearings = [], []
         self.current_count = None
         self.counts = []
+        # increased every time the reported pawns change, the overlay is only drawn again then
+        self.state_version = 0
+        self.overlay = OverlayLayer()
 
-    def re_detect(self, frame):
-        self.contours = [warp_contour(cont, self.board.m) for cont in self.static_contours]
-        self.mask = cv.warpPerspective(self.static_mask, self.board.m, (frame.shape[1], frame.shape[0]))
+    def re_detect(self, frame, ctx=None):
+        self.board_version = self.board.version
+        self.geometry.refresh(frame.shape)
+        self.contours = self.geometry.contours["clearings"]
 
-    def detect_events(self, frame: np.ndarray):
+    def detect_events(self, frame: np.ndarray, ctx=None):
         self.event.update()
 
-        op, bp = detect_pawns(frame, self.mask, self.contours, (StaticObject.LOWER_ORANGE, StaticObject.UPPER_ORANGE),
-                              (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE), self.diff_sensitivity,
-                              self.area_sensitivity)
+        # the board homography was updated in between re-detections
+        if self.board_version != self.board.version:
+            self.re_detect(frame, ctx)
+
+        ctx = ctx if ctx is not None else FrameContext(frame)
+        board_ctx = self.geometry.context(ctx)
+        op, bp = detect_pawns_labeled(board_ctx.frame, self.geometry.group("clearings"), self.contours,
+                                      (StaticObject.LOWER_ORANGE, StaticObject.UPPER_ORANGE),
+                                      (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE),
+                                      self.diff_sensitivity, self.area_sensitivity, board_ctx, self.method)
 
         count = sum([self._count_pawns(clearing) for clearing in op.values()]), \
             sum([self._count_pawns(clearing) for clearing in bp.values()])
@@ -52,48 +76,72 @@ class Pawns(StaticObject):
             self.orange_pawns, self.blue_pawns = op, bp
             self.orange_clearings, self.blue_clearings = calculate_current_clearing_control(op, bp)
             self.current_count = average_count
+            self.state_version += 1
 
             self.event.msg = f"Pawn Placed - Orange: {average_count[0]} Blue: {average_count[1]}"
             self.event.reset()
 
     def draw(self, frame, color=(0, 122, 0)):
-        orange_clearings = [cont for i, cont in enumerate(self.contours) if self.orange_clearings[i]]
-        blue_clearings = [cont for i, cont in enumerate(self.contours) if self.blue_clearings[i]]
-        not_controlled = [cont for i, cont in enumerate(self.contours) if
+        key = self.geometry.frame_version, self.state_version
+        return self.overlay.draw(frame, key, self._draw_layer)
+
+    def _draw_layer(self, layer: np.ndarray) -> None:
+        contours = self.geometry.frame_contours("clearings")
+        orange_clearings = [cont for i, cont in enumerate(contours) if self.orange_clearings[i]]
+        blue_clearings = [cont for i, cont in enumerate(contours) if self.blue_clearings[i]]
+        not_controlled = [cont for i, cont in enumerate(contours) if
                           not self.orange_clearings[i] and not self.blue_clearings[i]]
 
-        rects = [cv.boundingRect(cont) for cont in self.contours]
+        rects = [cv.boundingRect(cont) for cont in contours]
         orange_pawns = [self._count_pawns(clearing) for clearing in self.orange_pawns.values()]
         blue_pawns = [self._count_pawns(clearing) for clearing in self.blue_pawns.values()]
 
-        for i, cont in enumerate(self.contours):
+        for i, cont in enumerate(contours):
             x, y, w, h = rects[i]
 
-            frame = cv.putText(frame, str(orange_pawns[i]), (x + w//2 - 30, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
-                               StaticObject.ORANGE_COLOR, 2)
-            frame = cv.putText(frame, ":", (x + w//2 - 7, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
-                               (0, 0, 0), 5)
-            frame = cv.putText(frame, ":", (x + w//2 - 7, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
-                               (255, 255, 255), 2)
-            frame = cv.putText(frame, str(blue_pawns[i]), (x + w//2 + 10, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
-                               StaticObject.BLUE_COLOR, 2)
-
-        frame = cv.drawContours(frame, blue_clearings, -1, (255, 0, 0), 3)
-        frame = cv.drawContours(frame, orange_clearings, -1, (0, 122, 255), 3)
-        frame = cv.drawContours(frame, not_controlled, -1, (0, 122, 0), 3)
-
-        op = [cv.boundingRect(pawn + [rects[c_idx][0], rects[c_idx][1]])
+            cv.putText(layer, str(orange_pawns[i]), (x + w//2 - 30, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
+                       opaque(StaticObject.ORANGE_COLOR), 2)
+            cv.putText(layer, ":", (x + w//2 - 7, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
+                       opaque((0, 0, 0)), 5)
+            cv.putText(layer, ":", (x + w//2 - 7, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
+                       opaque((255, 255, 255)), 2)
+            cv.putText(layer, str(blue_pawns[i]), (x + w//2 + 10, y - 10), cv.FONT_HERSHEY_COMPLEX, 1,
+                       opaque(StaticObject.BLUE_COLOR), 2)
+
+        cv.drawContours(layer, blue_clearings, -1, opaque((255, 0, 0)), 3)
+        cv.drawContours(layer, orange_clearings, -1, opaque((0, 122, 255)), 3)
+        cv.drawContours(layer, not_controlled, -1, opaque((0, 122, 0)), 3)
+
+        # the pawns are relative to the clearing rectangles in the analysis space
+        offsets = [cv.boundingRect(cont) for cont in self.contours]
+        op = [cv.boundingRect(self.geometry.to_frame(pawn + [offsets[c_idx][0], offsets[c_idx][1]]))
               for c_idx, clearing in self.orange_pawns.items()
               for pawn in clearing]
-        bp = [cv.boundingRect(pawn + [rects[c_idx][0], rects[c_idx][1]])
+        bp = [cv.boundingRect(self.geometry.to_frame(pawn + [offsets[c_idx][0], offsets[c_idx][1]]))
               for c_idx, clearing in self.blue_pawns.items()
               for pawn in clearing]
 
         for pawns, color in ((op, StaticObject.ORANGE_COLOR), (bp, StaticObject.BLUE_COLOR)):
             for rect in pawns:
-                frame = draw_bbox(frame, rect, color)
-
-        return frame
+                draw_bbox(layer, rect, opaque(color))
+
+    def snapshot(self) -> dict:
+        # the pawns are kept in the analysis space, relative to their clearing rectangles
+        return {faction: {str(c_idx): [pawn.tolist() for pawn in clearing] for c_idx, clearing in pawns.items()}
+                for faction, pawns in (("orange", self.orange_pawns), ("blue", self.blue_pawns))}
+
+    def restore(self, frame, snapshot):
+        # the clearings follow the restored board
+        if self.board_version != self.board.version and self.board.m is not None:
+            self.re_detect(frame)
+
+        if snapshot is not None:
+            self.orange_pawns, self.blue_pawns = [{int(c_idx): [np.array(pawn, np.int32) for pawn in clearing]
+                                                   for c_idx, clearing in snapshot[faction].items()}
+                                                  for faction in ("orange", "blue")]
+            self.orange_clearings, self.blue_clearings = calculate_current_clearing_control(self.orange_pawns,
+                                                                                            self.blue_pawns)
+            self.state_version += 1
 
     def _get_average_count(self) -> tuple[int, int]:
         return (np.mean([count[0] for count in self.counts], axis=0, dtype=int),
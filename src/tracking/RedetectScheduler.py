@@ -0,0 +1,143 @@
+class RedetectScheduler:
+    """
+    Decides on which frames the objects are re-detected. Every object is re-detected once per its refresh rate,
+    at a phase offset of its own, so that the expensive re-detections do not all fall on the same frames.
+    An object is never re-detected on a frame before the objects it depends on, and with a time budget
+    the re-detections exceeding the budget of a frame are deferred to the following frames.
+
+    Without staggering and budget, the objects are re-detected on the multiples of their refresh rates
+
+    :var stagger: Whether the objects get distinct phase offsets
+    :type stagger: bool
+    :var spacing: Number of frames between the phase offsets of consecutive objects
+    :type spacing: int
+    :var budget: Time budget of the re-detections of a single frame in seconds, None for no limit
+    :type budget: float | None
+    :var costs: Moving average of the re-detection time of each object in seconds
+    :type costs: dict[int, float]
+    """
+    def __init__(self, stagger=False, spacing=6, budget: float | None = None, smoothing=0.2):
+        """
+        Initializes the scheduler
+
+        :param stagger: Whether the objects get distinct phase offsets, defaults to False
+        :type stagger: bool, optional
+        :param spacing: Number of frames between the phase offsets of consecutive objects, defaults to 6
+        :type spacing: int, optional
+        :param budget: Time budget of the re-detections of a single frame in seconds, defaults to None
+        :type budget: float | None, optional
+        :param smoothing: Weight of the latest measurement in the cost averages, defaults to 0.2
+        :type smoothing: float, optional
+        """
+        self.stagger = stagger
+        self.spacing = spacing
+        self.budget = budget
+        self.smoothing = smoothing
+        self.costs: dict[int, float] = {}
+
+        self._offsets: dict[int, int] = {}
+        self._dependencies: dict[int, list] = {}
+        self._pending: list = []
+
+    def register(self, obj, depends_on=(), offset: int | None = None) -> None:
+        """
+        Registers the object, the objects are staggered in the order of registration.
+        An object that would be due before its dependencies, e.g. with a dependency due at an offset
+        past its own refresh rate, is rejected with a ValueError
+
+        :param obj: Object with a refresh rate
+        :type obj: TrackedObject | StaticObject
+        :param depends_on: Objects that must be re-detected before the object, defaults to ()
+        :type depends_on: Iterable[TrackedObject | StaticObject], optional
+        :param offset: Phase offset of the re-detections, defaults to the next free offset
+        :type offset: int | None, optional
+        """
+        dependencies = list(depends_on)
+        dependency_offsets = [self._offsets.get(id(dep), 0) for dep in dependencies]
+
+        if offset is None:
+            offset = len(self._offsets) * self.spacing if self.stagger else 0
+
+            # the dependencies are due at the same time or earlier, so the offset wrapped around the refresh rate
+            # is raised back to the latest offset of the dependencies
+            offset = max([offset % obj.refresh_rate, *dependency_offsets])
+
+        # an offset of the dependencies at or past the refresh rate of the object wraps it around before them
+        if offset % obj.refresh_rate < max(dependency_offsets, default=0):
+            raise ValueError(f"{obj.name} would be re-detected at offset {offset % obj.refresh_rate}, before its "
+                             f"dependencies at offset {max(dependency_offsets)}")
+
+        self._offsets[id(obj)] = offset % obj.refresh_rate
+        self._dependencies[id(obj)] = dependencies
+
+    def last_due(self, obj, frame_id: int) -> int:
+        """
+        Returns the last frame up to the given one where the object is due in a run from the start of the clip,
+        without the deferrals of the budget. Everything is re-detected on the first frame of such a run
+
+        :param obj: Registered object
+        :type obj: TrackedObject | StaticObject
+        :param frame_id: Index of the frame in the video
+        :type frame_id: int
+        :return: Index of the last frame where the object is due
+        :rtype: int
+        """
+        offset = self._offsets.get(id(obj), 0)
+        return max(0, (frame_id - offset) // obj.refresh_rate * obj.refresh_rate + offset)
+
+    def plan(self, frame_id: int, objects: list, first=False) -> set[int]:
+        """
+        Returns the objects to be re-detected on the frame, the objects must then be re-detected
+        in the order of the list, every dependency before its dependents
+
+        :param frame_id: Index of the frame in the video
+        :type frame_id: int
+        :param objects: All objects in the order they are updated
+        :type objects: list[TrackedObject | StaticObject]
+        :param first: Whether the frame is the first one analyzed, everything is re-detected on it, defaults to False
+        :type first: bool, optional
+        :return: Ids of the objects to be re-detected
+        :rtype: set[int]
+        """
+        if first:
+            self._pending = []
+            return {id(obj) for obj in objects}
+
+        pending = {id(obj) for obj in self._pending}
+        due = [obj for obj in objects
+               if id(obj) in pending or (frame_id - self._offsets.get(id(obj), 0)) % obj.refresh_rate == 0]
+
+        if self.budget is None:
+            self._pending = []
+            return {id(obj) for obj in due}
+
+        # the deferred objects are the first to be re-detected
+        due.sort(key=lambda obj: id(obj) not in pending)
+        planned, deferred, spent = set(), [], 0.0
+
+        for obj in due:
+            cost = self.costs.get(id(obj), 0.0)
+            blocked = any(id(dep) in {id(d) for d in deferred} for dep in self._dependencies.get(id(obj), ()))
+
+            # at least one object is re-detected on every frame, so the deferred ones always catch up
+            if blocked or (planned and spent + cost > self.budget):
+                deferred.append(obj)
+                continue
+
+            planned.add(id(obj))
+            spent += cost
+
+        self._pending = deferred
+        return planned
+
+    def report(self, obj, seconds: float) -> None:
+        """
+        Records the time the re-detection of the object took
+
+        :param obj: Re-detected object
+        :type obj: TrackedObject | StaticObject
+        :param seconds: Duration of the re-detection in seconds
+        :type seconds: float
+        """
+        last = self.costs.get(id(obj))
+        self.costs[id(obj)] = seconds if last is None else last + self.smoothing * (seconds - last)
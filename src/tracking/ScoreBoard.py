@@ -5,41 +5,80 @@ from src.tracking.StaticObject import StaticObject
 from src.tracking.Board import Board
 from src.detection.game import calculate_current_score
 from src.detection.elements import detect_score_board
-from src.utils.contours import warp_contour
+from src.tracking.BoardGeometry import BoardGeometry
+from src.utils.context import FrameContext
+from src.viz.overlay import OverlayLayer, opaque
 
 
 class ScoreBoard(StaticObject):
-    def __init__(self, name, board: Board, mask: np.ndarray):
+    def __init__(self, name, board: Board, mask: np.ndarray, exact=False, geometry: BoardGeometry | None = None,
+                 precomputed: tuple[list[np.ndarray], np.ndarray] | None = None):
         super().__init__(name)
         self.mask = mask
         self.board = board
+        self.board_version = None
         self.cell_contours = None
-        self.static_contours, score_ref = detect_score_board(self.board.ref, self.mask)
+        self.exact = exact
+        self.cell_labels = None
+        # the score board of the reference may come precomputed from the asset bundle
+        self.static_contours, score_ref = precomputed if precomputed is not None else \
+            detect_score_board(self.board.ref, self.mask)
         score_x, score_y, _, _ = cv.boundingRect(score_ref)
         self.score_offset = [score_x, score_y]
 
+        self.geometry = geometry if geometry is not None else BoardGeometry(board)
+        self.geometry.register("score", [c + self.score_offset for c in self.static_contours], layer=1)
+
         self.current_score = None
         self.scores = []
+        self.overlay = OverlayLayer()
+
+    def re_detect(self, frame, ctx=None):
+        self.board_version = self.board.version
+        self.geometry.refresh(frame.shape)
+        self.cell_contours = self.geometry.contours["score"]
 
-    def re_detect(self, frame):
-        self.cell_contours = list(map(lambda c: warp_contour(c, self.board.m),
-                                      [c + self.score_offset for c in self.static_contours]))
+        if self.exact:
+            self.cell_labels = self.geometry.group("score")
 
     def draw(self, frame, color=(0, 122, 0)):
         if self.cell_contours is None:
             return frame
 
-        frame = cv.drawContours(frame, self.cell_contours, -1, color, 2)
-        frame = cv.drawContours(frame, [self.cell_contours[self.current_score[1]]], -1, StaticObject.BLUE_COLOR, 3)
-        frame = cv.drawContours(frame, [self.cell_contours[self.current_score[0]]], -1, StaticObject.ORANGE_COLOR, 3)
-        return frame
+        # the cells are only drawn again when the board moves or the score changes
+        key = self.geometry.frame_version, color, int(self.current_score[0]), int(self.current_score[1])
+        return self.overlay.draw(frame, key, lambda layer: self._draw_layer(layer, color))
+
+    def _draw_layer(self, layer: np.ndarray, color: tuple[int, int, int]) -> None:
+        cell_contours = self.geometry.frame_contours("score")
+        cv.drawContours(layer, cell_contours, -1, opaque(color), 2)
+        cv.drawContours(layer, [cell_contours[self.current_score[1]]], -1, opaque(StaticObject.BLUE_COLOR), 3)
+        cv.drawContours(layer, [cell_contours[self.current_score[0]]], -1, opaque(StaticObject.ORANGE_COLOR), 3)
+
+    def snapshot(self) -> dict:
+        return {"score": [int(s) for s in self.current_score] if self.current_score is not None else None}
 
-    def detect_events(self, frame: np.ndarray):
+    def restore(self, frame, snapshot):
+        # the cells follow the restored board
+        if self.board_version != self.board.version and self.board.m is not None:
+            self.re_detect(frame)
+
+        if snapshot is not None:
+            self.current_score = tuple(snapshot["score"]) if snapshot["score"] is not None else None
+
+    def detect_events(self, frame: np.ndarray, ctx=None):
         self.event.update()
 
-        new_score = calculate_current_score(frame, self.cell_contours,
+        # the board homography was updated in between re-detections
+        if self.board_version != self.board.version:
+            self.re_detect(frame, ctx)
+
+        ctx = ctx if ctx is not None else FrameContext(frame)
+        board_ctx = self.geometry.context(ctx)
+        new_score = calculate_current_score(board_ctx.frame, self.cell_contours,
                                             (StaticObject.LOWER_ORANGE, StaticObject.UPPER_ORANGE),
-                                            (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE))
+                                            (StaticObject.LOWER_DARK_BLUE, StaticObject.UPPER_DARK_BLUE),
+                                            board_ctx, self.cell_labels)
 
         self.scores.append(new_score)
 
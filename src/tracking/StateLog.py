@@ -0,0 +1,182 @@
+import json
+from typing import Iterator, TextIO
+
+import numpy as np
+
+from src.tracking.StaticObject import StaticObject
+from src.tracking.TrackedObject import TrackedObject
+
+
+class StateLog:
+    """
+    Per-frame log of the state drawn on the frames: the snapshots of the objects (board homography, tracker boxes,
+    scores, building ownership, pawns per clearing), the trackers lost on the frame and the displayed events.
+    It holds everything the overlays are drawn from, so a recorded analysis can be drawn again without analyzing:
+    the log read back is restored into newly built objects frame by frame, which then draw themselves as usual.
+
+    Written as JSON lines, the first line is the header, then every frame where something changed gets a line
+    holding only the changes since the previous frame:
+
+    {"header": {"fps": 30.0, "size": [1920, 1080], "rectify_scale": null}}
+    {"frame": 0, "objects": {"board": {"m": [...], "contour": [...]}, "card": {"bbox": [...]}, ...},
+     "lost": [], "events": [["score", "Score - Orange: 5 Blue: 9"], ...]}
+    {"frame": 1, "objects": {"card": {"bbox": [...]}}}
+
+    The events are listed in the order they are displayed
+
+    :var header: Description of the analysis, e.g. the frame rate and the rectify scale
+    :type header: dict
+    :var stream: Stream the lines are written to
+    :type stream: TextIO | None
+    """
+    def __init__(self, stream: TextIO | None = None, header: dict | None = None):
+        """
+        Initializes the empty log, the header is written right away
+
+        :param stream: Stream to write the lines to, defaults to None
+        :type stream: TextIO | None, optional
+        :param header: Description of the analysis, defaults to None
+        :type header: dict | None, optional
+        """
+        self.header = header if header is not None else {}
+        self.stream = stream
+        # state of the last collected or restored frame, changes of the skipped frames not restored yet
+        self._last: dict = {"objects": {}}
+        self._pending: dict = {}
+
+        if self.stream is not None:
+            self.stream.write(json.dumps({"header": self.header}) + "\n")
+
+    def collect(self, frame_id: int, tracked: list[TrackedObject], statics: list[StaticObject],
+                found: list[bool]) -> dict | None:
+        """
+        Records the state of the frame, must be called after the events of the frame are detected
+
+        :param frame_id: Index of the frame in the video
+        :type frame_id: int
+        :param tracked: Tracked objects
+        :type tracked: list[TrackedObject]
+        :param statics: Static objects
+        :type statics: list[StaticObject]
+        :param found: Whether each tracked object was found in the frame
+        :type found: list[bool]
+        :return: Changes written for the frame, None if nothing changed
+        :rtype: dict | None
+        """
+        objects = tracked + statics
+        state = {"objects": {obj.name: obj.snapshot() for obj in objects},
+                 "lost": [obj.name for obj, ok in zip(tracked, found) if not ok],
+                 "events": [[obj.name, obj.event.msg] for obj in
+                            sorted([obj for obj in objects if obj.event.get() != ""], key=lambda o: o.event.timer)]}
+
+        delta = {key: value for key, value in state.items() if key != "objects" and value != self._last.get(key)}
+        changed = {name: snapshot for name, snapshot in state["objects"].items()
+                   if snapshot != self._last["objects"].get(name)}
+        self._last = state
+
+        if changed:
+            delta["objects"] = changed
+        if not delta:
+            return None
+
+        delta = {"frame": frame_id, **delta}
+        if self.stream is not None:
+            self.stream.write(json.dumps(delta) + "\n")
+
+        return delta
+
+    @staticmethod
+    def read_header(path: str) -> dict:
+        """
+        Reads the header of the log
+
+        :param path: Path of the log
+        :type path: str
+        :return: Header
+        :rtype: dict
+        """
+        with open(path) as f:
+            return json.loads(f.readline())["header"]
+
+    @staticmethod
+    def read(path: str) -> Iterator[dict]:
+        """
+        Reads the changes of the frames lazily, so logs of long games are never loaded whole
+
+        :param path: Path of the log
+        :type path: str
+        :return: Changes of the frames in the order of the frames
+        :rtype: Iterator[dict]
+        """
+        with open(path) as f:
+            f.readline()
+
+            for line in f:
+                yield json.loads(line)
+
+    @staticmethod
+    def combine(deltas: list[dict], frame_id: int) -> dict:
+        """
+        Combines the changes of consecutive frames into the changes of a single frame, e.g. the changes since
+        the start of the analysis into the full state of the frame
+
+        :param deltas: Changes of the frames in the order of the frames
+        :type deltas: list[dict]
+        :param frame_id: Index of the frame of the combined changes
+        :type frame_id: int
+        :return: Combined changes
+        :rtype: dict
+        """
+        combined = {}
+        for delta in deltas:
+            StateLog._merge(combined, delta)
+
+        return {"frame": frame_id, **combined}
+
+    def skip(self, delta: dict) -> None:
+        """
+        Skips the frame without drawing it, its changes are restored with the next drawn frame
+
+        :param delta: Changes of the frame
+        :type delta: dict
+        """
+        self._merge(self._pending, delta)
+
+    def restore(self, frame: np.ndarray, delta: dict | None, tracked: list[TrackedObject],
+                statics: list[StaticObject]) -> list[bool]:
+        """
+        Restores the objects to the state of the frame, must be called on every drawn frame in order
+
+        :param frame: Frame the state is drawn on
+        :type frame: np.ndarray
+        :param delta: Changes of the frame, None if nothing changed
+        :type delta: dict | None
+        :param tracked: Tracked objects
+        :type tracked: list[TrackedObject]
+        :param statics: Static objects
+        :type statics: list[StaticObject]
+        :return: Whether each tracked object was found in the frame
+        :rtype: list[bool]
+        """
+        changes = self._merge(self._pending, delta) if delta is not None else self._pending
+        self._pending = {}
+        snapshots = changes.get("objects", {})
+
+        for obj in statics + tracked:
+            obj.restore(frame, snapshots.get(obj.name))
+
+        # the displayed events are ordered by their timers, the other events are expired
+        if "events" in changes:
+            order = {name: (i, msg) for i, (name, msg) in enumerate(changes["events"])}
+
+            for obj in tracked + statics:
+                obj.event.timer, obj.event.msg = order.get(obj.name, (obj.event.limit, obj.event.msg))
+
+        self._merge(self._last, changes)
+        return [obj.name not in self._last.get("lost", []) for obj in tracked]
+
+    @staticmethod
+    def _merge(state: dict, delta: dict) -> dict:
+        state.setdefault("objects", {}).update(delta.get("objects", {}))
+        state.update({key: value for key, value in delta.items() if key not in ("frame", "objects")})
+        return state
@@ -1,6 +1,7 @@
 import numpy as np
 from abc import ABC, abstractmethod
 from src.tracking.Event import Event
+from src.utils.context import FrameContext
 
 
 class StaticObject(ABC):
@@ -50,12 +51,14 @@ class StaticObject(ABC):
         self.event = Event(event_timer_limit)
 
     @abstractmethod
-    def re_detect(self, frame: np.ndarray) -> None:
+    def re_detect(self, frame: np.ndarray, ctx: FrameContext | None = None) -> None:
         """
         Re-detects the object in the frame
 
         :param frame: Frame to detect the object in
         :type frame: np.ndarray
+        :param ctx: Context of the frame shared by all objects, defaults to None
+        :type ctx: FrameContext | None, optional
         """
         return
 
@@ -72,11 +75,45 @@ class StaticObject(ABC):
         """
         return frame
 
-    def detect_events(self, frame: np.ndarray) -> None:
+    def update(self, frame: np.ndarray, ctx: FrameContext | None = None) -> None:
+        """
+        Updates the object with the next frame, called on every frame before the events are detected
+
+        :param frame: Frame to update the object with
+        :type frame: np.ndarray
+        :param ctx: Context of the frame shared by all objects, defaults to None
+        :type ctx: FrameContext | None, optional
+        """
+        return
+
+    def detect_events(self, frame: np.ndarray, ctx: FrameContext | None = None) -> None:
         """
         Detects events in the frame
 
         :param frame: Frame to detect events in
         :type frame: np.ndarray
+        :param ctx: Context of the frame shared by all objects, defaults to None
+        :type ctx: FrameContext | None, optional
         """
         self.event.update()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the state of the object drawn on the frame
+
+        :return: State serializable as JSON
+        :rtype: dict
+        """
+        return {}
+
+    def restore(self, frame: np.ndarray, snapshot: dict | None) -> None:
+        """
+        Restores the state of the object drawn on the frame, used to draw a recorded analysis without analyzing.
+        Called on every drawn frame, so the objects can follow the restored objects they depend on, e.g. the board
+
+        :param frame: Frame the state is drawn on
+        :type frame: np.ndarray
+        :param snapshot: State returned by snapshot, None if it did not change since the previous frame
+        :type snapshot: dict | None
+        """
+        return
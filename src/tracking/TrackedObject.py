@@ -5,6 +5,7 @@ from abc import ABC, abstractmethod
 from src.tracking.Event import Event
 from src.viz.images import draw_bbox
 from src.utils.helpers import create_tracker
+from src.utils.context import FrameContext
 
 
 class TrackedObject(ABC):
@@ -67,12 +68,14 @@ class TrackedObject(ABC):
         """
         return
 
-    def detect_events(self, frame: np.ndarray):
+    def detect_events(self, frame: np.ndarray, ctx: FrameContext | None = None):
         """
         Detects events in the frame
 
         :param frame: Frame to detect events in
         :type frame: np.ndarray
+        :param ctx: Context of the frame shared by all objects, defaults to None
+        :type ctx: FrameContext | None, optional
         """
         self.event.update()
 
@@ -177,6 +180,27 @@ class TrackedObject(ABC):
 
         return cv.putText(frame, msg, (x + w//2 - 10, y - 10), cv.FONT_HERSHEY_SIMPLEX, 1, color, 2, cv.LINE_AA)
 
+    def snapshot(self) -> dict:
+        """
+        Returns the state of the object drawn on the frame
+
+        :return: State serializable as JSON
+        :rtype: dict
+        """
+        return {"bbox": np.asarray(self.last_bbox).tolist() if self.last_bbox is not None else None}
+
+    def restore(self, frame: np.ndarray, snapshot: dict | None) -> None:
+        """
+        Restores the state of the object drawn on the frame, used to draw a recorded analysis without analyzing
+
+        :param frame: Frame the state is drawn on
+        :type frame: np.ndarray
+        :param snapshot: State returned by snapshot, None if it did not change since the previous frame
+        :type snapshot: dict | None
+        """
+        if snapshot is not None:
+            self.last_bbox = tuple(snapshot["bbox"]) if snapshot["bbox"] is not None else None
+
     def _update_velocity(self, bbox):
         """
         Updates the velocity of the object
@@ -0,0 +1,99 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.tracking.RedetectScheduler import RedetectScheduler
+from src.tracking.TrackedObject import TrackedObject
+from src.utils.profiling import Profiler
+
+
+class TrackingExecutor:
+    """
+    Runs the tracker updates of all tracked objects of a frame concurrently.
+    The objects are independent of each other and OpenCV releases the GIL inside the trackers,
+    so the updates scale with the number of cores. Each object is only ever updated by a single task per frame,
+    so the results are the same as in the serial mode
+
+    :var workers: Number of worker threads, 0 to update the objects serially in the calling thread
+    :type workers: int
+    """
+    def __init__(self, workers=0):
+        """
+        Initializes the executor, the thread pool is created lazily
+
+        :param workers: Number of worker threads, 0 to update the objects serially, defaults to 0
+        :type workers: int, optional
+        """
+        self.workers = workers
+        self._pool = None
+
+    def update(self, tracked: list[TrackedObject], frame: np.ndarray, re_detect: list[bool] | None = None,
+               profiler: Profiler | None = None, scheduler: RedetectScheduler | None = None) -> list[bool]:
+        """
+        Re-detects the given objects and updates the trackers of all objects with the frame,
+        returns once all objects are updated
+
+        :param tracked: Tracked objects
+        :type tracked: list[TrackedObject]
+        :param frame: Frame to update the trackers with
+        :type frame: np.ndarray
+        :param re_detect: Whether to re-detect each object before the update, defaults to None
+        :type re_detect: list[bool] | None, optional
+        :param profiler: Profiler timing the re-detections and updates, defaults to None
+        :type profiler: Profiler | None, optional
+        :param scheduler: Scheduler the re-detection times are reported to, defaults to None
+        :type scheduler: RedetectScheduler | None, optional
+        :return: Whether each object was found, in the order of the objects
+        :rtype: list[bool]
+        """
+        re_detect = re_detect if re_detect is not None else [False] * len(tracked)
+
+        if self.workers <= 0 or len(tracked) <= 1:
+            return [self._update(obj, frame, r, profiler, scheduler) for obj, r in zip(tracked, re_detect)]
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="tracking")
+
+        futures = [self._pool.submit(self._update, obj, frame, r, profiler, scheduler)
+                   for obj, r in zip(tracked, re_detect)]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker threads
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> "TrackingExecutor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+    @staticmethod
+    def _update(obj: TrackedObject, frame: np.ndarray, re_detect: bool, profiler: Profiler | None,
+                scheduler: RedetectScheduler | None) -> bool:
+        profiled = profiler is not None and profiler.enabled
+        name = type(obj).__name__
+
+        if re_detect:
+            re_detect_start = time.perf_counter()
+            obj.re_detect(frame)
+            re_detect_time = time.perf_counter() - re_detect_start
+
+            # the tracker re-initializations count against the budget like the static re-detections
+            if scheduler is not None:
+                scheduler.report(obj, re_detect_time)
+
+            if profiled:
+                profiler.add("re_detect", name, re_detect_time)
+                profiler.count("re_detections")
+
+        if not profiled:
+            return obj.update(frame)
+
+        with profiler.time("update", name):
+            return obj.update(frame)
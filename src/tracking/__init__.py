@@ -1,9 +1,15 @@
 from .Board import Board
+from .BoardGeometry import BoardGeometry
+from .BoardRectifier import BoardRectifier
 from .Buildings import Buildings
 from .Card import Card, CardPile
 from .Dice import Dice, DiceTray
 from .Event import Event
+from .EventLog import EventLog
 from .Pawns import Pawns
+from .RedetectScheduler import RedetectScheduler
 from .ScoreBoard import ScoreBoard
+from .StateLog import StateLog
 from .StaticObject import StaticObject
 from .TrackedObject import TrackedObject
+from .TrackingExecutor import TrackingExecutor
@@ -0,0 +1,185 @@
+import glob
+import hashlib
+import os
+import shutil
+
+import cv2 as cv
+import numpy as np
+
+from src.detection.elements import detect_clearings_and_buildings, detect_score_board
+from src.detection.reference import ReferenceMatcher
+from src.utils.data import get_pdf_page
+
+# increased whenever the content of the bundle changes, so the stale bundles are recompiled
+ASSET_VERSION = 2
+
+
+class AssetBundle:
+    """
+    Static game assets compiled once from the source files: the reference rasters, the board mask,
+    the score cells, the clearings and buildings, and the reference SIFT features.
+    The bundle is a directory named by the hash of the sources holding one .npy file per array,
+    the arrays are memory-mapped, so loading the bundle takes milliseconds and the worker processes share the pages
+
+    :var path: Directory of the bundle
+    :type path: str
+    :var board_ref: Reference image of the board
+    :type board_ref: np.ndarray
+    :var card_ref: Reference image of the card back
+    :type card_ref: np.ndarray
+    :var mask: Board mask, clearings in the first channel and the score board in the third
+    :type mask: np.ndarray
+    :var score_board: Result of detect_score_board on the board reference (cell contours, score board contour)
+    :type score_board: tuple[list[np.ndarray], np.ndarray]
+    :var clearings: Result of detect_clearings_and_buildings on the clearing mask (clearings, buildings by clearing)
+    :type clearings: tuple[list[np.ndarray], dict[int, list[np.ndarray]]]
+    """
+    def __init__(self, path: str):
+        """
+        Loads the bundle
+
+        :param path: Directory of the bundle
+        :type path: str
+        """
+        self.path = path
+        self._arrays = {os.path.basename(file)[:-4]: np.load(file, mmap_mode="r")
+                        for file in glob.glob(f"{path}/*.npy")}
+
+        self.board_ref = self._arrays["board_ref"]
+        self.card_ref = self._arrays["card_ref"]
+        self.mask = self._arrays["mask"]
+        self.score_board = (_unpack_contours(self._arrays["score_cells"], self._arrays["score_cell_offsets"]),
+                            np.asarray(self._arrays["score_board"]))
+
+        clearings = _unpack_contours(self._arrays["clearings"], self._arrays["clearing_offsets"])
+        buildings = iter(_unpack_contours(self._arrays["buildings"], self._arrays["building_offsets"]))
+        self.clearings = (clearings, {i: [next(buildings) for _ in range(count)]
+                                      for i, count in enumerate(self._arrays["buildings_per_clearing"])})
+
+    def matcher(self, name: str) -> ReferenceMatcher:
+        """
+        Returns a matcher of the reference with the precomputed features
+
+        :param name: Name of the reference, "board" or "card"
+        :type name: str
+        :return: Reference matcher
+        :rtype: ReferenceMatcher
+        """
+        features = self._arrays[f"{name}_kp"], np.asarray(self._arrays[f"{name}_desc"], np.float32)
+        return ReferenceMatcher(self._arrays[f"{name}_ref"], features)
+
+
+def hash_sources(paths: list[str]) -> str:
+    """
+    Hashes the content of the source files together with the bundle and OpenCV versions
+
+    :param paths: Paths of the source files
+    :type paths: list[str]
+    :return: Hexadecimal digest
+    :rtype: str
+    """
+    digest = hashlib.sha256(f"{ASSET_VERSION}:{cv.__version__}".encode())
+
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def compile_assets(board_path: str, card_path: str, mask_path: str, path: str) -> None:
+    """
+    Derives the static assets from the source files and writes them into the bundle
+
+    :param board_path: Path of the board pdf
+    :type board_path: str
+    :param card_path: Path of the card back pdf
+    :type card_path: str
+    :param mask_path: Path of the board mask
+    :type mask_path: str
+    :param path: Directory of the bundle
+    :type path: str
+    """
+    board_ref = get_pdf_page(board_path)
+    card_ref = get_pdf_page(card_path)
+    mask = cv.imread(mask_path)
+
+    cells, score_board = detect_score_board(board_ref, mask[:, :, 2])
+    clearings, buildings = detect_clearings_and_buildings(mask[:, :, 0])
+
+    arrays = {"board_ref": board_ref, "card_ref": card_ref, "mask": mask, "score_board": score_board,
+              "buildings_per_clearing": np.array([len(buildings[i]) for i in range(len(clearings))])}
+    arrays["score_cells"], arrays["score_cell_offsets"] = _pack_contours(cells)
+    arrays["clearings"], arrays["clearing_offsets"] = _pack_contours(clearings)
+    arrays["buildings"], arrays["building_offsets"] = _pack_contours(
+        [building for i in range(len(clearings)) for building in buildings[i]])
+
+    # the bundle is moved into place at once, so the processes loading it concurrently never see it half written
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+
+    for name, ref in (("board", board_ref), ("card", card_ref)):
+        matcher = ReferenceMatcher(ref)
+        # the SIFT descriptors are whole numbers below 256
+        arrays[f"{name}_kp"], arrays[f"{name}_desc"] = matcher.keypoints, matcher.desc.astype(np.uint8)
+
+    for name, array in arrays.items():
+        np.save(f"{tmp_path}/{name}.npy", np.ascontiguousarray(array))
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process compiled the same bundle first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_assets(board_path: str, card_path: str, mask_path: str, cache_dir: str) -> AssetBundle:
+    """
+    Loads the bundle of the source files, compiles it first if the sources changed
+
+    :param board_path: Path of the board pdf
+    :type board_path: str
+    :param card_path: Path of the card back pdf
+    :type card_path: str
+    :param mask_path: Path of the board mask
+    :type mask_path: str
+    :param cache_dir: Directory of the bundles
+    :type cache_dir: str
+    :return: Asset bundle
+    :rtype: AssetBundle
+    """
+    path = f"{cache_dir}/assets_{hash_sources([board_path, card_path, mask_path])[:16]}"
+
+    if not os.path.isdir(path):
+        print(f"Compiling the game assets into {path}")
+        os.makedirs(cache_dir, exist_ok=True)
+        compile_assets(board_path, card_path, mask_path, path)
+        prune_assets(cache_dir, path)
+
+    return AssetBundle(path)
+
+
+def prune_assets(cache_dir: str, keep: str) -> None:
+    """
+    Removes the stale bundles of older sources or versions, the bundles being compiled are left alone
+
+    :param cache_dir: Directory of the bundles
+    :type cache_dir: str
+    :param keep: Directory of the current bundle
+    :type keep: str
+    """
+    for path in glob.glob(f"{cache_dir}/assets_*"):
+        # the processes still mapping a removed bundle keep reading it until they exit
+        if os.path.isdir(path) and not path.endswith(".tmp") and os.path.basename(path) != os.path.basename(keep):
+            print(f"Removing the stale game assets {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _pack_contours(contours: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    points = np.concatenate(contours) if contours else np.zeros((0, 1, 2), np.int32)
+    return points, np.cumsum([0] + [len(contour) for contour in contours])
+
+
+def _unpack_contours(points: np.ndarray, offsets: np.ndarray) -> list[np.ndarray]:
+    # the contours are small, they are copied out of the mapped file
+    return [np.array(points[start:stop]) for start, stop in zip(offsets[:-1], offsets[1:])]
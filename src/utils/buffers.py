@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class BufferPool:
+    """
+    Hands out preallocated arrays by name, so the per-frame images are written into the same memory every frame
+    instead of being allocated anew. A name may have several slots used in turn, for the buffers that are still
+    read elsewhere while the next frame is written, e.g. the frames queued for encoding.
+    A buffer is reallocated only when the requested shape or type changes. The pool is not thread-safe,
+    every thread needs a pool of its own
+
+    :var slots: Number of slots of each name, the names not listed have a single slot
+    :type slots: dict[str, int]
+    """
+    def __init__(self, slots: dict[str, int] | None = None):
+        """
+        Initializes the empty pool
+
+        :param slots: Number of slots of each name, defaults to a single slot for every name
+        :type slots: dict[str, int] | None, optional
+        """
+        self.slots = dict(slots) if slots is not None else {}
+        self._buffers: dict = {}
+        self._turns: dict = {}
+        self._scopes: dict = {}
+
+    def get(self, name, shape: tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """
+        Returns the next slot of the buffer, its content is undefined
+
+        :param name: Name of the buffer, any hashable
+        :type name: Hashable
+        :param shape: Shape of the buffer
+        :type shape: tuple[int, ...]
+        :param dtype: Type of the buffer, defaults to np.uint8
+        :type dtype: np.dtype, optional
+        :return: Buffer
+        :rtype: np.ndarray
+        """
+        slots = self._buffers.setdefault(name, [None] * self.slots.get(name, 1))
+        turn = self._turns.get(name, 0)
+        self._turns[name] = (turn + 1) % len(slots)
+
+        buffer = slots[turn]
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = slots[turn] = np.empty(shape, dtype)
+
+        return buffer
+
+    def copy(self, name, array: np.ndarray) -> np.ndarray:
+        """
+        Copies the array into the next slot of the buffer
+
+        :param name: Name of the buffer
+        :type name: Hashable
+        :param array: Array to copy
+        :type array: np.ndarray
+        :return: Buffer holding the copy
+        :rtype: np.ndarray
+        """
+        buffer = self.get(name, array.shape, array.dtype)
+        np.copyto(buffer, array)
+        return buffer
+
+    def scope(self, name) -> "BufferPool":
+        """
+        Returns a pool of its own for the buffers of the same names used for another image, e.g. the rectified board
+
+        :param name: Name of the scope
+        :type name: Hashable
+        :return: Pool of the scope
+        :rtype: BufferPool
+        """
+        if name not in self._scopes:
+            self._scopes[name] = BufferPool(self.slots)
+
+        return self._scopes[name]
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory held by the pool
+
+        :return: Number of bytes of all buffers, the scopes included
+        :rtype: int
+        """
+        own = sum(buffer.nbytes for slots in self._buffers.values() for buffer in slots if buffer is not None)
+        return own + sum(scope.nbytes() for scope in self._scopes.values())
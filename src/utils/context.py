@@ -0,0 +1,135 @@
+import cv2 as cv
+import numpy as np
+
+from src.utils.buffers import BufferPool
+
+
+class FrameContext:
+    """
+    Holds a single frame and lazily computes the conversions shared by the analyzers.
+    Every conversion and color mask is computed at most once per frame, no matter how many analyzers ask for it.
+    With a buffer pool the conversions are written into the buffers of the pool, so they are only valid
+    until the context of the next frame computes them
+
+    :var frame: Frame in the BGR color space
+    :type frame: np.ndarray
+    :var frame_id: Index of the frame in the video
+    :type frame_id: int | None
+    :var pool: Pool of the conversion and scratch buffers, None to allocate them
+    :type pool: BufferPool | None
+    """
+    def __init__(self, frame: np.ndarray, frame_id: int | None = None, pool: BufferPool | None = None):
+        """
+        Initializes the context of the frame
+
+        :param frame: Frame in the BGR color space
+        :type frame: np.ndarray
+        :param frame_id: Index of the frame in the video, defaults to None
+        :type frame_id: int | None, optional
+        :param pool: Pool of the conversion and scratch buffers, defaults to None
+        :type pool: BufferPool | None, optional
+        """
+        self.frame = frame
+        self.frame_id = frame_id
+        self.pool = pool
+        self._hsv = None
+        self._gray = None
+        self._masks = {}
+        self._integrals = {}
+        self._rectified = {}
+
+    @property
+    def hsv(self) -> np.ndarray:
+        """
+        Frame in the HSV color space
+
+        :rtype: np.ndarray
+        """
+        if self._hsv is None:
+            self._hsv = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV, dst=self.scratch("hsv", self.frame.shape))
+        return self._hsv
+
+    @property
+    def gray(self) -> np.ndarray:
+        """
+        Frame in grayscale
+
+        :rtype: np.ndarray
+        """
+        # not pooled, the board keeps the gray frame to track the next one against
+        if self._gray is None:
+            self._gray = cv.cvtColor(self.frame, cv.COLOR_BGR2GRAY)
+        return self._gray
+
+    def in_range(self, lower_color: np.ndarray, upper_color: np.ndarray) -> np.ndarray:
+        """
+        Returns the binary mask of the HSV frame pixels in the specified color range
+
+        :param lower_color: Lower bound of the color range
+        :type lower_color: np.ndarray
+        :param upper_color: Upper bound of the color range
+        :type upper_color: np.ndarray
+        :return: Binary mask of the color range
+        :rtype: np.ndarray
+        """
+        key = (tuple(np.ravel(lower_color)), tuple(np.ravel(upper_color)))
+
+        if key not in self._masks:
+            self._masks[key] = cv.inRange(self.hsv, lower_color, upper_color,
+                                          dst=self.scratch(("mask", key), self.frame.shape[:2]))
+
+        return self._masks[key]
+
+    def integral(self, lower_color: np.ndarray, upper_color: np.ndarray) -> np.ndarray:
+        """
+        Returns the summed-area table of the color mask, counting every pixel in the color range as 1
+
+        :param lower_color: Lower bound of the color range
+        :type lower_color: np.ndarray
+        :param upper_color: Upper bound of the color range
+        :type upper_color: np.ndarray
+        :return: Summed-area table of the color mask, one row and column larger than the frame
+        :rtype: np.ndarray
+        """
+        key = (tuple(np.ravel(lower_color)), tuple(np.ravel(upper_color)))
+
+        if key not in self._integrals:
+            # 0/1 values keep the sums of large frames within int32
+            height, width = self.frame.shape[:2]
+            _, binary = cv.threshold(self.in_range(lower_color, upper_color), 0, 1, cv.THRESH_BINARY,
+                                     dst=self.scratch("binary", (height, width)))
+            self._integrals[key] = cv.integral(binary, sum=self.scratch(("integral", key), (height + 1, width + 1),
+                                                                        np.int32), sdepth=cv.CV_32S)
+
+        return self._integrals[key]
+
+    def rectified(self, rectifier) -> "FrameContext":
+        """
+        Returns the context of the frame warped by the rectifier, the frame is warped only once
+
+        :param rectifier: Rectifier providing the warp, usually a BoardRectifier
+        :return: Context of the rectified frame
+        :rtype: FrameContext
+        """
+        if id(rectifier) not in self._rectified:
+            # the rectified frame has its own buffers, as it is analyzed alongside the frame
+            pool = self.pool.scope(("rectified", id(rectifier))) if self.pool is not None else None
+            dst = pool.get("frame", rectifier.shape + self.frame.shape[2:]) if pool is not None else None
+            self._rectified[id(rectifier)] = FrameContext(rectifier.rectify(self.frame, dst), self.frame_id, pool)
+
+        return self._rectified[id(rectifier)]
+
+    def scratch(self, name, shape: tuple[int, ...], dtype=np.uint8) -> np.ndarray | None:
+        """
+        Returns a scratch buffer of the pool to write a per-frame image into
+
+        :param name: Name of the buffer
+        :type name: Hashable
+        :param shape: Shape of the buffer
+        :type shape: tuple[int, ...]
+        :param dtype: Type of the buffer, defaults to np.uint8
+        :type dtype: np.dtype, optional
+        :return: Buffer of the pool, None without a pool, so the OpenCV functions allocate the output
+        :rtype: np.ndarray | None
+        """
+        return self.pool.get(name, shape, dtype) if self.pool is not None else None
@@ -0,0 +1,201 @@
+import cv2 as cv
+import numpy as np
+
+
+def contour_rects(contours: list[np.ndarray]) -> np.ndarray:
+    """
+    Returns the bounding rectangles of the contours as a single array
+
+    :param contours: Contours to be bounded
+    :type contours: list[np.ndarray]
+    :return: Bounding rectangles (x, y, w, h), one row per contour
+    :rtype: np.ndarray
+    """
+    return np.array([cv.boundingRect(c) for c in contours], dtype=np.int64).reshape(-1, 4)
+
+
+def rect_coverage(integral: np.ndarray, rects: np.ndarray) -> np.ndarray:
+    """
+    Calculates the mask coverage of every rectangle with four lookups in the summed-area table of the mask
+
+    :param integral: Summed-area table of the binary (0 or 1) mask, as returned by cv.integral
+    :type integral: np.ndarray
+    :param rects: Rectangles (x, y, w, h), one row per rectangle
+    :type rects: np.ndarray
+    :return: Coverage of the mask inside each rectangle clipped to the image
+    :rtype: np.ndarray
+    """
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    x0 = np.clip(rects[:, 0], 0, width)
+    y0 = np.clip(rects[:, 1], 0, height)
+    x1 = np.clip(rects[:, 0] + rects[:, 2], 0, width)
+    y1 = np.clip(rects[:, 1] + rects[:, 3], 0, height)
+
+    hits = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    areas = (x1 - x0) * (y1 - y0)
+
+    return np.divide(hits, areas, out=np.zeros(len(rects)), where=areas != 0)
+
+
+class LabelMap:
+    """
+    Contours rasterized into a single label image, where the pixels of contour i are labeled i + 1 and the background 0.
+    The label image only spans the bounding window of all contours clipped to the image
+
+    :var n: Number of rasterized contours
+    :type n: int
+    :var labels: Label image of the window
+    :type labels: np.ndarray
+    :var counts: Number of pixels of each label, background included
+    :type counts: np.ndarray
+    :var window: Window of the image covered by the labels (x0, y0, x1, y1)
+    :type window: tuple[int, int, int, int]
+    """
+    def __init__(self, contours: list[np.ndarray], shape: tuple[int, ...]):
+        """
+        Rasterizes the contours, later contours are painted over the earlier ones
+
+        :param contours: Contours to be rasterized
+        :type contours: list[np.ndarray]
+        :param shape: Shape of the image the contours are in
+        :type shape: tuple[int, ...]
+        """
+        self.n = len(contours)
+
+        if self.n > 0:
+            rects = contour_rects(contours)
+            x0, y0 = max(int(rects[:, 0].min()), 0), max(int(rects[:, 1].min()), 0)
+            x1 = min(int((rects[:, 0] + rects[:, 2]).max()), shape[1])
+            y1 = min(int((rects[:, 1] + rects[:, 3]).max()), shape[0])
+        else:
+            x0 = y0 = x1 = y1 = 0
+
+        self.window = (x0, y0, max(x0, x1), max(y0, y1))
+        self.labels = np.zeros((self.window[3] - y0, self.window[2] - x0), dtype=np.int16)
+
+        for i, contour in enumerate(contours):
+            cv.drawContours(self.labels, [contour], -1, i + 1, -1, offset=(-x0, -y0))
+
+        self.counts = np.bincount(self.labels.ravel(), minlength=self.n + 1)
+        self._mask = None
+        self._frame_id = None
+        self._coverage = None
+
+    def crop(self, img: np.ndarray) -> np.ndarray:
+        """
+        Crops the image to the window of the labels
+
+        :param img: Image to be cropped
+        :type img: np.ndarray
+        :return: Cropped image
+        :rtype: np.ndarray
+        """
+        x0, y0, x1, y1 = self.window
+        return img[y0:y1, x0:x1]
+
+    def coverage(self, mask: np.ndarray, frame_id: int | None = None) -> np.ndarray:
+        """
+        Calculates the exact mask coverage of every contour with a single pass over the window.
+        The result for the last mask of the frame is kept. The masks of a buffer pool are written into the same
+        array on every frame, so they are told apart by the frame, a mask without a frame must not be modified
+        in place between calls
+
+        :param mask: Binary mask of the image
+        :type mask: np.ndarray
+        :param frame_id: Index of the frame of the mask, defaults to None
+        :type frame_id: int | None, optional
+        :return: Coverage of the mask inside each contour
+        :rtype: np.ndarray
+        """
+        if mask is not self._mask or frame_id != self._frame_id:
+            hits = np.bincount(self.labels[self.crop(mask) > 0], minlength=self.n + 1)
+            self._coverage = np.divide(hits[1:], self.counts[1:], out=np.zeros(self.n), where=self.counts[1:] != 0)
+            self._mask = mask
+            self._frame_id = frame_id
+
+        return self._coverage
+
+    def group(self, start: int, stop: int) -> "LabelGroup":
+        """
+        Returns the view of the contours with indices in [start, stop)
+
+        :param start: Index of the first contour
+        :type start: int
+        :param stop: Index after the last contour
+        :type stop: int
+        :return: View of the contours
+        :rtype: LabelGroup
+        """
+        return LabelGroup(self, start, stop)
+
+
+class LabelGroup:
+    """
+    View of a consecutive range of contours of a shared LabelMap
+
+    :var label_map: Shared label map
+    :type label_map: LabelMap
+    :var start: Index of the first contour
+    :type start: int
+    :var stop: Index after the last contour
+    :type stop: int
+    """
+    def __init__(self, label_map: LabelMap, start: int, stop: int):
+        self.label_map = label_map
+        self.start = start
+        self.stop = stop
+        self._indices = None
+        self._window_mask = None
+
+    def coverage(self, mask: np.ndarray, frame_id: int | None = None) -> np.ndarray:
+        """
+        Calculates the exact mask coverage of the contours in the group
+
+        :param mask: Binary mask of the image
+        :type mask: np.ndarray
+        :param frame_id: Index of the frame of the mask, defaults to None
+        :type frame_id: int | None, optional
+        :return: Coverage of the mask inside each contour of the group
+        :rtype: np.ndarray
+        """
+        return self.label_map.coverage(mask, frame_id)[self.start:self.stop]
+
+    def indices(self) -> np.ndarray:
+        """
+        Returns the index of the group contour of every pixel of the label window, -1 outside the group
+
+        :return: Contour indices of the window
+        :rtype: np.ndarray
+        """
+        if self._indices is None:
+            indices = self.label_map.labels.astype(np.int32) - (self.start + 1)
+            indices[(indices < 0) | (indices >= self.stop - self.start)] = -1
+            self._indices = indices
+
+        return self._indices
+
+    def window_mask(self) -> np.ndarray:
+        """
+        Returns the binary mask of the group pixels of the label window
+
+        :return: Binary mask of the window
+        :rtype: np.ndarray
+        """
+        if self._window_mask is None:
+            self._window_mask = (self.indices() >= 0).astype(np.uint8) * 255
+
+        return self._window_mask
+
+    def mask(self, shape: tuple[int, ...]) -> np.ndarray:
+        """
+        Returns the binary mask of the pixels labeled with the contours of the group
+
+        :param shape: Shape of the image
+        :type shape: tuple[int, ...]
+        :return: Binary mask of the group
+        :rtype: np.ndarray
+        """
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        labels = self.label_map.labels
+        self.label_map.crop(mask)[(labels > self.start) & (labels <= self.stop)] = 255
+        return mask
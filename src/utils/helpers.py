@@ -75,3 +75,58 @@ def get_children(i: int, hierarchy: np.ndarray) -> list[int]:
     :rtype: list[int]
     """
     return [j for j, node in enumerate(hierarchy[0]) if node[3] == i]
+
+
+class HierarchyIndex:
+    """
+    Index of the contour hierarchy returned by cv.findContours, built once so that the parent and children queries
+    do not scan the whole hierarchy
+
+    :var parents: Index of the parent of each contour, -1 for the highest hierarchy contours
+    :type parents: np.ndarray
+    :var roots: Indices of the highest hierarchy contours (parentless)
+    :type roots: np.ndarray
+    :var leaves: Indices of the lowest hierarchy contours (childless)
+    :type leaves: np.ndarray
+    """
+    def __init__(self, hierarchy: np.ndarray | None):
+        """
+        Groups the contours by their parents
+
+        :param hierarchy: Hierarchical representation of contours, None if no contours were found
+        :type hierarchy: np.ndarray | None
+        """
+        nodes = hierarchy[0] if hierarchy is not None else np.empty((0, 4), dtype=np.int32)
+        self.parents = nodes[:, 3]
+        self.roots = np.flatnonzero(self.parents == -1)
+        self.leaves = np.flatnonzero(nodes[:, 2] == -1)
+
+        # children sorted by parent, the roots are grouped under the parent -1 at the front
+        self._children = np.argsort(self.parents, kind="stable")
+        counts = np.bincount(self.parents + 1, minlength=len(nodes) + 1)
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def parent(self, i: int) -> int:
+        """
+        Returns the index of the parent of the contour with index i
+
+        :param i: Index of the contour
+        :type i: int
+        :return: Index of the parent, -1 if the contour is parentless
+        :rtype: int
+        """
+        return int(self.parents[i])
+
+    def children(self, i: int) -> np.ndarray:
+        """
+        Returns the indices of the children of the contour with index i in ascending order
+
+        :param i: Index of the contour
+        :type i: int
+        :return: Indices of the children
+        :rtype: np.ndarray
+        """
+        return self._children[self._offsets[i + 1]:self._offsets[i + 2]]
@@ -74,7 +74,18 @@ def calculate_color_coverage(img: np.ndarray, lower_color: np.ndarray, upper_col
     # Create a binary mask for the specified color range
     color_mask = cv.inRange(hsv_image, lower_color, upper_color)
 
-    # Calculate the percentage of non-zero pixels in the mask
-    total_pixels = np.prod(color_mask.shape)
-    colored_pixels = np.count_nonzero(color_mask)
-    return colored_pixels / total_pixels
+    return calculate_mask_coverage(color_mask)
+
+
+def calculate_mask_coverage(mask: np.ndarray) -> float:
+    """
+    Calculates the coverage of the binary mask
+
+    :param mask: Binary mask to be analyzed
+    :type mask: np.ndarray
+    :return: Percentage of non-zero pixels in the mask
+    :rtype: float
+    """
+    total_pixels = np.prod(mask.shape)
+    colored_pixels = np.count_nonzero(mask)
+    return colored_pixels / total_pixels if total_pixels != 0 else 0
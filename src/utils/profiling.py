@@ -0,0 +1,169 @@
+import csv
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+
+class Profiler:
+    """
+    Collects the durations of the stages of the analysis per key (usually the object class) and event counters.
+    A disabled profiler hands out a shared no-op context, so the instrumented code pays a single attribute lookup
+
+    :var enabled: Whether the durations are collected
+    :type enabled: bool
+    :var durations: Durations in seconds of each key of each stage
+    :type durations: dict[str, dict[str, list[float]]]
+    :var counters: Event counters
+    :type counters: dict[str, int]
+    """
+    def __init__(self, enabled=True, summary_every: float | None = None):
+        """
+        Initializes the empty profiler
+
+        :param enabled: Whether the durations are collected, defaults to True
+        :type enabled: bool, optional
+        :param summary_every: Seconds between the printed summary lines, defaults to None
+        :type summary_every: float | None, optional
+        """
+        self.enabled = enabled
+        self.summary_every = summary_every
+        self.durations: dict[str, dict[str, list[float]]] = {}
+        self.counters: dict[str, int] = {}
+
+        self._null = nullcontext()
+        self._lock = threading.Lock()
+        self._last_summary = time.perf_counter()
+
+    def time(self, stage: str, key: str):
+        """
+        Returns the context measuring the duration of its body
+
+        :param stage: Stage of the analysis, e.g. "re_detect"
+        :type stage: str
+        :param key: Key within the stage, e.g. the class of the object
+        :type key: str
+        :return: Context manager
+        """
+        if not self.enabled:
+            return self._null
+
+        return _Timer(self, stage, key)
+
+    def add(self, stage: str, key: str, seconds: float) -> None:
+        """
+        Records a duration
+
+        :param stage: Stage of the analysis
+        :type stage: str
+        :param key: Key within the stage
+        :type key: str
+        :param seconds: Duration in seconds
+        :type seconds: float
+        """
+        if self.enabled:
+            self.durations.setdefault(stage, {}).setdefault(key, []).append(seconds)
+
+    def count(self, name: str, n=1) -> None:
+        """
+        Increments the counter
+
+        :param name: Name of the counter
+        :type name: str
+        :param n: Increment, defaults to 1
+        :type n: int, optional
+        """
+        if self.enabled:
+            # the trackers are counted from the worker threads
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def frame_done(self) -> None:
+        """
+        Marks the end of a frame, prints the summary line when it is due
+        """
+        if not self.enabled or self.summary_every is None:
+            return
+
+        now = time.perf_counter()
+        if now - self._last_summary >= self.summary_every:
+            self._last_summary = now
+            print(self.summary())
+
+    def summary(self) -> str:
+        """
+        Returns a single line summary of the frame times and counters
+
+        :return: Summary line
+        :rtype: str
+        """
+        frames = self.durations.get("frame", {}).get("total", [])
+        line = f"frames: {len(frames)}"
+
+        if frames:
+            p50, p99 = np.percentile(frames, [50, 99]) * 1000
+            line += f" | frame p50: {p50:.1f} ms p99: {p99:.1f} ms"
+
+        return " | ".join([line] + [f"{name}: {value}" for name, value in self.counters.items()])
+
+    def report(self) -> dict:
+        """
+        Aggregates the durations into histograms
+
+        :return: Count, total, p50, p95, p99 and max in milliseconds of each key of each stage, and the counters
+        :rtype: dict
+        """
+        stages = {}
+
+        for stage, keys in self.durations.items():
+            stages[stage] = {}
+
+            for key, values in keys.items():
+                ms = np.array(values) * 1000
+                p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+                stages[stage][key] = {"count": len(ms), "total": float(ms.sum()), "p50": float(p50),
+                                      "p95": float(p95), "p99": float(p99), "max": float(ms.max())}
+
+        return {"stages": stages, "counters": dict(self.counters)}
+
+    def save(self, path: str) -> None:
+        """
+        Saves the report as JSON, or as CSV with one row per key if the path ends with .csv
+
+        :param path: Path of the report
+        :type path: str
+        """
+        report = self.report()
+
+        if not path.endswith(".csv"):
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            return
+
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage", "key", "count", "total", "p50", "p95", "p99", "max"])
+
+            for stage, keys in report["stages"].items():
+                for key, stats in keys.items():
+                    writer.writerow([stage, key, *stats.values()])
+
+            for name, value in report["counters"].items():
+                writer.writerow(["counter", name, value, "", "", "", "", ""])
+
+
+class _Timer:
+    def __init__(self, profiler: Profiler, stage: str, key: str):
+        self.profiler = profiler
+        self.stage = stage
+        self.key = key
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.stage, self.key, time.perf_counter() - self.start)
@@ -0,0 +1,343 @@
+import cv2 as cv
+import numpy as np
+
+from src.detection.elements import detect_clearings_and_buildings, detect_score_board
+from src.utils.truth import GroundTruth
+
+ORANGE = (0, 120, 255)
+BLUE = (140, 40, 20)
+
+# layout of a clip of the base size, scaled with the frame width
+BASE_SIZE = (1280, 960)
+BASE_BOARD = np.array([[0.45, 0.03, 250], [-0.02, 0.45, 120], [0, 0, 1]])
+BASE_TRAY = (30, 600, 200, 250)
+BASE_DICE = ((60, 650), (140, 760))
+BASE_DIE = 40
+BASE_PILE = (1100, 120)
+BASE_CARD = (140, 200)
+
+
+def make_reference_board(board: np.ndarray, mask: np.ndarray, cells=21) -> np.ndarray:
+    """
+    Makes the reference board of the synthetic clips, the board image is resized to the mask
+    and the score track is drawn into the score board mask, as the board image does not show it
+
+    :param board: Image of the board
+    :type board: np.ndarray
+    :param mask: Board mask, clearings in the first channel and the score board in the third
+    :type mask: np.ndarray
+    :param cells: Number of the score cells, defaults to 21
+    :type cells: int, optional
+    :return: Reference board of the mask size
+    :rtype: np.ndarray
+    """
+    ref = cv.resize(board, (mask.shape[1], mask.shape[0]), interpolation=cv.INTER_AREA)
+
+    contours, _ = cv.findContours(mask[:, :, 2], cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    x, y, w, h = cv.boundingRect(contours[0])
+
+    cv.rectangle(ref, (x, y), (x + w - 1, y + h - 1), (235, 235, 235), -1)
+    cv.rectangle(ref, (x + 3, y + 3), (x + w - 4, y + h - 4), (20, 20, 20), 4)
+
+    for i in range(1, cells):
+        cell_x = x + 3 + int(i * (w - 6) / cells)
+        cv.line(ref, (cell_x, y + 3), (cell_x, y + h - 4), (20, 20, 20), 4)
+
+    return ref
+
+
+def make_card_back(size=(280, 400), seed=0) -> np.ndarray:
+    """
+    Makes a card back sprite with enough texture to be matched by its features
+
+    :param size: Size of the sprite (width, height), defaults to (280, 400)
+    :type size: tuple[int, int], optional
+    :param seed: Seed of the pattern, defaults to 0
+    :type seed: int, optional
+    :return: Card back sprite
+    :rtype: np.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    w, h = size
+    card = np.full((h, w, 3), (40, 70, 30), np.uint8)
+
+    for _ in range(60):
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        axes = (int(rng.integers(4, w // 6)), int(rng.integers(4, h // 6)))
+        color = tuple(int(c) for c in rng.integers(60, 230, 3))
+        cv.ellipse(card, center, axes, float(rng.uniform(0, 180)), 0, 360, color, int(rng.choice([-1, 2, 3])))
+
+    cv.rectangle(card, (6, 6), (w - 7, h - 7), (200, 220, 230), 6)
+    return card
+
+
+class SyntheticClip:
+    """
+    Renders a synthetic clip of a game: the reference board under a jittering homography with the pawns,
+    buildings and score markers drawn on it, a dark dice tray with two white dice and a pile of cards.
+    The first die rolls and a card is drawn from the pile once during the clip, the score, the pawns
+    and the buildings change at scheduled frames. Every frame is rendered deterministically from the seed,
+    so the ground truth of any frame is known, see state and ground_truth
+
+    :var size: Size of the frames (width, height)
+    :type size: tuple[int, int]
+    :var frames: Number of frames
+    :type frames: int
+    :var fps: Frame rate
+    :type fps: float
+    :var jitter: Amplitude of the board corner jitter in pixels of the base size
+    :type jitter: float
+    :var ref: Reference board
+    :type ref: np.ndarray
+    :var card: Card back sprite
+    :type card: np.ndarray
+    :var scores: Scores (orange, blue) valid from the frame, sorted by the frame
+    :type scores: list[tuple[int, int, int]]
+    :var pawns: Pawns (frame of placement, faction, clearing, center in the reference)
+    :type pawns: list[tuple[int, str, int, tuple[int, int]]]
+    :var buildings: Buildings (frame of placement, faction, index of the building)
+    :type buildings: list[tuple[int, str, int]]
+    :var roll: First and last frame of the die roll
+    :type roll: tuple[int, int]
+    :var draw: First and last frame of the card draw
+    :type draw: tuple[int, int]
+    """
+    def __init__(self, ref: np.ndarray, mask: np.ndarray, card: np.ndarray, size=BASE_SIZE, frames=240, fps=24.0,
+                 jitter=2.0, pawns=8, buildings=3, pawn_radius=18, seed=0):
+        """
+        Lays out the game
+
+        :param ref: Reference board, see make_reference_board
+        :type ref: np.ndarray
+        :param mask: Board mask of the reference size
+        :type mask: np.ndarray
+        :param card: Card back sprite, see make_card_back
+        :type card: np.ndarray
+        :param size: Size of the frames (width, height), defaults to (1280, 960)
+        :type size: tuple[int, int], optional
+        :param frames: Number of frames, defaults to 240
+        :type frames: int, optional
+        :param fps: Frame rate, defaults to 24.0
+        :type fps: float, optional
+        :param jitter: Amplitude of the board corner jitter in pixels of the base size, defaults to 2.0
+        :type jitter: float, optional
+        :param pawns: Number of pawns placed at the start, one more is placed during the clip, defaults to 8
+        :type pawns: int, optional
+        :param buildings: Number of buildings placed at the start, defaults to 3
+        :type buildings: int, optional
+        :param pawn_radius: Radius of the pawns in pixels of the reference, defaults to 18
+        :type pawn_radius: int, optional
+        :param seed: Seed of the layout and the jitter, defaults to 0
+        :type seed: int, optional
+        """
+        self.size = size
+        self.frames = frames
+        self.fps = fps
+        self.jitter = jitter
+        self.ref = ref
+        self.card = card
+
+        rng = np.random.default_rng(seed)
+        self.clearings, buildings_by_clearing = detect_clearings_and_buildings(mask[:, :, 0])
+        self.building_contours = [b for clearing in buildings_by_clearing.values() for b in clearing]
+
+        cells, score_board = detect_score_board(ref, mask[:, :, 2])
+        offset = cv.boundingRect(score_board)[:2]
+        self.cells = [cell + offset for cell in cells]
+
+        orange_score, blue_score = (int(s) for s in rng.choice(len(self.cells) // 2, 2, replace=False))
+        self.scores = [(0, orange_score, blue_score), (frames // 2, orange_score + 2, blue_score)]
+
+        factions = ["orange", "blue"]
+        self.pawn_radius = pawn_radius
+        self.pawns = []
+
+        for i in range(pawns + 1):
+            faction, frame = (factions[i % 2], 0) if i < pawns else ("blue", frames * 3 // 4)
+            self.pawns.append((frame, faction, *self._place_pawn(rng, mask)))
+
+        chosen = rng.choice(len(self.building_contours), buildings, replace=False)
+        self.buildings = [(0, factions[i % 2], int(b)) for i, b in enumerate(chosen)]
+
+        self.roll = (frames // 4, frames // 4 + int(fps))
+        self.draw = (frames * 2 // 3, frames * 2 // 3 + int(fps // 2))
+
+        self._phases = rng.uniform(0, 2 * np.pi, (4, 2))
+        self._periods = rng.uniform(2 * fps, 6 * fps, (4, 2))
+        self._scale = size[0] / BASE_SIZE[0]
+        self._card = cv.resize(card, (int(BASE_CARD[0] * self._scale), int(BASE_CARD[1] * self._scale)),
+                               interpolation=cv.INTER_AREA)
+        self._boards: dict[tuple, np.ndarray] = {}
+
+    def state(self, frame_id: int) -> dict:
+        """
+        Returns the ground truth of the frame
+
+        :param frame_id: Index of the frame
+        :type frame_id: int
+        :return: Score (orange, blue), pawn counts of each clearing per faction, ownership of each building
+            per faction, whether the die rolls and whether the card is being drawn
+        :rtype: dict
+        """
+        score = [(orange, blue) for frame, orange, blue in self.scores if frame <= frame_id][-1]
+        pawns = {faction: [0] * len(self.clearings) for faction in ("orange", "blue")}
+        buildings = {faction: [False] * len(self.building_contours) for faction in ("orange", "blue")}
+
+        for frame, faction, clearing, _ in self.pawns:
+            if frame <= frame_id:
+                pawns[faction][clearing] += 1
+
+        for frame, faction, building in self.buildings:
+            if frame <= frame_id:
+                buildings[faction][building] = True
+
+        return {"score": score, "pawns": pawns, "buildings": buildings,
+                "rolling": self.roll[0] <= frame_id < self.roll[1], "drawing": self.draw[0] <= frame_id < self.draw[1]}
+
+    def ground_truth(self) -> GroundTruth:
+        """
+        Returns the ground truth of the whole clip
+
+        :return: Ground truth
+        :rtype: GroundTruth
+        """
+        changes = sorted({frame for frame, *_ in self.scores + self.pawns + self.buildings})
+        states = []
+
+        for frame in changes:
+            state = self.state(frame)
+            states.append({"frame": frame, "score": list(state["score"]), "buildings": state["buildings"],
+                           "pawns": state["pawns"]})
+
+        events = [{"object": "dice", "start": self.roll[0], "stop": self.roll[1]},
+                  {"object": "card", "start": self.draw[0], "stop": self.draw[1]}]
+
+        return GroundTruth(states, events, self.fps, self.frames)
+
+    def homography(self, frame_id: int) -> np.ndarray:
+        """
+        Returns the homography from the reference into the frame, the board corners drift smoothly
+        around their base positions
+
+        :param frame_id: Index of the frame
+        :type frame_id: int
+        :return: Homography matrix
+        :rtype: np.ndarray
+        """
+        h, w = self.ref.shape[:2]
+        corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        placed = cv.perspectiveTransform(corners, BASE_BOARD)[:, 0]
+        placed += self.jitter * np.sin(2 * np.pi * frame_id / self._periods + self._phases)
+
+        return cv.getPerspectiveTransform(corners[:, 0], np.float32(placed * self._scale))
+
+    def render(self, frame_id: int) -> np.ndarray:
+        """
+        Renders the frame
+
+        :param frame_id: Index of the frame
+        :type frame_id: int
+        :return: Frame in the BGR color space
+        :rtype: np.ndarray
+        """
+        frame = np.full((self.size[1], self.size[0], 3), 90, np.uint8)
+        cv.warpPerspective(self._board(frame_id), self.homography(frame_id), self.size, frame,
+                           borderMode=cv.BORDER_TRANSPARENT)
+
+        s = self._scale
+        x, y, w, h = BASE_TRAY
+        cv.rectangle(frame, (int(x * s), int(y * s)), (int((x + w) * s), int((y + h) * s)), (15, 15, 15), -1)
+
+        for i, (die_x, die_y) in enumerate(BASE_DICE):
+            if i == 0 and self.roll[0] <= frame_id < self.roll[1]:
+                # the die bounces around its resting place while rolling
+                t = (frame_id - self.roll[0]) / self.fps * 2 * np.pi
+                die_x, die_y = die_x + 50 * (1 + np.sin(3 * t)) / 2, die_y + 60 * (1 - np.cos(2 * t)) / 2
+
+            cv.rectangle(frame, (int(die_x * s), int(die_y * s)),
+                         (int((die_x + BASE_DIE) * s), int((die_y + BASE_DIE) * s)), (255, 255, 255), -1)
+
+        pile_x, pile_y = int(BASE_PILE[0] * s), int(BASE_PILE[1] * s)
+        self._blit(frame, self._card, pile_x, pile_y)
+
+        # the drawn card slides off the pile towards the orange player and is then taken into the hand
+        if self.draw[0] <= frame_id < self.draw[1]:
+            progress = (frame_id - self.draw[0] + 1) / (self.draw[1] - self.draw[0])
+            self._blit(frame, self._card, pile_x, pile_y + int(progress * 1.5 * self._card.shape[0]))
+
+        return frame
+
+    def write(self, path: str, fourcc="mp4v") -> None:
+        """
+        Renders the whole clip into a video file
+
+        :param path: Path of the video
+        :type path: str
+        :param fourcc: Codec of the video, defaults to "mp4v"
+        :type fourcc: str, optional
+        """
+        writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*fourcc), self.fps, self.size)
+
+        try:
+            for frame_id in range(self.frames):
+                writer.write(self.render(frame_id))
+        finally:
+            writer.release()
+
+    def _board(self, frame_id: int) -> np.ndarray:
+        # the board only changes at the scheduled frames, so each distinct state is drawn once
+        key = tuple(frame <= frame_id for frame, *_ in self.scores + self.pawns + self.buildings)
+
+        if key not in self._boards:
+            state = self.state(frame_id)
+            board = self.ref.copy()
+
+            # the markers share the cell when the scores are equal
+            orange, blue = state["score"]
+            shared = orange == blue
+
+            for cell, color, (top, bottom) in ((orange, ORANGE, (0.0, 0.5 if shared else 1.0)),
+                                               (blue, BLUE, (0.5 if shared else 0.0, 1.0))):
+                x, y, w, h = cv.boundingRect(self.cells[cell])
+                cv.rectangle(board, (x + 4, y + int(h * top) + 4), (x + w - 5, y + int(h * bottom) - 5), color, -1)
+
+            for frame, faction, building in self.buildings:
+                if frame <= frame_id:
+                    cv.drawContours(board, [self.building_contours[building]], -1,
+                                    ORANGE if faction == "orange" else BLUE, -1)
+
+            for frame, faction, _, center in self.pawns:
+                if frame <= frame_id:
+                    cv.circle(board, center, self.pawn_radius, ORANGE if faction == "orange" else BLUE, -1)
+
+            self._boards[key] = board
+
+        return self._boards[key]
+
+    def _place_pawn(self, rng: np.random.Generator, mask: np.ndarray) -> tuple[int, tuple[int, int]]:
+        # the pawn lies entirely inside the clearing, off the buildings and apart from the other pawns
+        radius = self.pawn_radius
+        free = (mask[:, :, 0] > 0).astype(np.uint8)
+
+        for _, _, _, (x, y) in self.pawns:
+            cv.circle(free, (x, y), 3 * radius, 0, -1)
+
+        distance = cv.distanceTransform(free, cv.DIST_L2, 3)
+
+        while True:
+            clearing = int(rng.integers(len(self.clearings)))
+            inside = np.zeros_like(free)
+            cv.drawContours(inside, [self.clearings[clearing]], -1, 1, -1)
+            candidates = np.argwhere((inside > 0) & (distance > radius + 4))
+
+            if len(candidates):
+                y, x = candidates[rng.integers(len(candidates))]
+                return clearing, (int(x), int(y))
+
+    @staticmethod
+    def _blit(frame: np.ndarray, sprite: np.ndarray, x: int, y: int) -> None:
+        h, w = sprite.shape[:2]
+        h, w = min(h, frame.shape[0] - y), min(w, frame.shape[1] - x)
+
+        if h > 0 and w > 0:
+            frame[y:y + h, x:x + w] = sprite[:h, :w]
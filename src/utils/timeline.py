@@ -0,0 +1,308 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+META_FILE = "timeline.json"
+
+
+class TimelineWriter:
+    """
+    Writes the per-frame state of a game into a timeline: a directory holding one raw binary file per column
+    of fixed type and shape, and the frame index of every row. The rows are collected in preallocated chunks
+    and appended to the files a chunk at a time, so a Timeline can map the files while they are still written.
+
+    Every column also gets a change index, the frames where its value differs from the previous row
+
+    :var path: Directory of the timeline
+    :type path: str
+    :var columns: Type and labels of every axis of each column, the labels give the shape of the column
+    :type columns: dict[str, tuple[str, list[list[str]]]]
+    :var fps: Frame rate of the video
+    :type fps: float | None
+    :var chunk_size: Number of rows appended at once
+    :type chunk_size: int
+    :var length: Number of rows written to the files
+    :type length: int
+    """
+    def __init__(self, path: str, columns: dict[str, tuple[str, list[list[str]]]], fps: float | None = None,
+                 chunk_size=1024):
+        """
+        Creates the empty timeline, an existing timeline in the directory is replaced
+
+        :param path: Directory of the timeline
+        :type path: str
+        :param columns: Type and labels of every axis of each column, e.g. {"score": ("int16", [["orange", "blue"]])}
+        :type columns: dict[str, tuple[str, list[list[str]]]]
+        :param fps: Frame rate of the video, defaults to None
+        :type fps: float | None, optional
+        :param chunk_size: Number of rows appended at once, defaults to 1024
+        :type chunk_size: int, optional
+        """
+        self.path = path
+        self.columns = columns
+        self.fps = fps
+        self.chunk_size = chunk_size
+        self.length = 0
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        with open(f"{path}/{META_FILE}", "w") as f:
+            json.dump({"fps": fps, "columns": {name: {"dtype": dtype, "labels": labels}
+                                               for name, (dtype, labels) in columns.items()}}, f, indent=2)
+
+        self._chunks = {"frame": np.empty(chunk_size, np.int64)}
+        self._chunks.update({name: np.empty((chunk_size, *[len(axis) for axis in labels]), dtype)
+                             for name, (dtype, labels) in columns.items()})
+        self._size = 0
+        self._last: dict[str, np.ndarray] = {}
+
+        self._files = {name: open(f"{path}/{name}.bin", "ab") for name in self._chunks}
+        self._change_files = {name: open(f"{path}/{name}.changes", "ab") for name in columns}
+
+    def append(self, frame_id: int, values: dict) -> None:
+        """
+        Appends the state of the frame, the frames must be appended in ascending order
+
+        :param frame_id: Index of the frame in the video
+        :type frame_id: int
+        :param values: Value of every column
+        :type values: dict
+        """
+        self._chunks["frame"][self._size] = frame_id
+
+        for name in self.columns:
+            self._chunks[name][self._size] = values[name]
+
+        self._size += 1
+
+        if self._size == self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Appends the collected rows to the files
+        """
+        n = self._size
+        if n == 0:
+            return
+
+        frames = self._chunks["frame"][:n]
+
+        # the columns go first, so a reader never sees a frame whose columns are not written yet
+        for name in self.columns:
+            chunk = self._chunks[name][:n]
+            rows = chunk.reshape(n, -1)
+            previous = np.concatenate([self._last[name][None] if name in self._last else rows[:1], rows[:-1]])
+
+            changed = _differs(rows, previous)
+            if name not in self._last:
+                changed[0] = True
+
+            self._files[name].write(chunk.tobytes())
+            self._change_files[name].write(frames[changed].tobytes())
+            self._last[name] = rows[-1].copy()
+
+        self._files["frame"].write(frames.tobytes())
+
+        for f in list(self._files.values()) + list(self._change_files.values()):
+            f.flush()
+
+        self.length += n
+        self._size = 0
+
+    def close(self) -> None:
+        """
+        Appends the remaining rows and closes the files
+        """
+        self.flush()
+
+        for f in list(self._files.values()) + list(self._change_files.values()):
+            f.close()
+
+    def __enter__(self) -> "TimelineWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class Timeline:
+    """
+    Timeline written by a TimelineWriter. The columns are memory-mapped, so the state of any frame of a long game
+    is read without loading the rest, the rows written so far are visible while the timeline is still written
+
+    :var path: Directory of the timeline
+    :type path: str
+    :var fps: Frame rate of the video
+    :type fps: float | None
+    :var labels: Labels of every axis of each column
+    :type labels: dict[str, list[list[str]]]
+    :var frames: Frame index of every row, ascending
+    :type frames: np.ndarray
+    :var columns: Memory-mapped columns, the first axis are the rows
+    :type columns: dict[str, np.ndarray]
+    """
+    def __init__(self, path: str):
+        """
+        Maps the timeline
+
+        :param path: Directory of the timeline
+        :type path: str
+        """
+        self.path = path
+
+        with open(f"{path}/{META_FILE}") as f:
+            meta = json.load(f)
+
+        self.fps = meta["fps"]
+        self.labels = {name: column["labels"] for name, column in meta["columns"].items()}
+
+        types = {"frame": (np.dtype(np.int64), ())}
+        types.update({name: (np.dtype(column["dtype"]), tuple(len(axis) for axis in column["labels"]))
+                      for name, column in meta["columns"].items()})
+
+        # a chunk may be partially written, only the rows present in every file are mapped
+        length = min(os.path.getsize(f"{path}/{name}.bin") // (dtype.itemsize * int(np.prod(shape)))
+                     for name, (dtype, shape) in types.items())
+        mapped = {name: _map(f"{path}/{name}.bin", dtype, (length, *shape)) for name, (dtype, shape) in types.items()}
+
+        self.frames = mapped.pop("frame")
+        self.columns = mapped
+        self._changes = {name: _map(f"{path}/{name}.changes", np.dtype(np.int64)) for name in self.columns}
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def row(self, frame_id: int) -> int | None:
+        """
+        Returns the row holding the state of the frame, the last row at or before it
+
+        :param frame_id: Index of the frame
+        :type frame_id: int
+        :return: Index of the row, None before the first row
+        :rtype: int | None
+        """
+        i = int(np.searchsorted(self.frames, frame_id, side="right")) - 1
+        return i if i >= 0 else None
+
+    def state(self, frame_id: int | None = None, time: float | None = None) -> dict | None:
+        """
+        Returns the state of the game on the frame or at the time
+
+        :param frame_id: Index of the frame, defaults to None
+        :type frame_id: int | None, optional
+        :param time: Time in seconds, used if no frame is given, defaults to None
+        :type time: float | None, optional
+        :return: Frame and value of every column, None before the first row
+        :rtype: dict | None
+        """
+        if frame_id is None:
+            frame_id = int(time * self.fps)
+
+        i = self.row(frame_id)
+        if i is None:
+            return None
+
+        return {"frame": int(self.frames[i]), **{name: np.array(column[i]) for name, column in self.columns.items()}}
+
+    def changes(self, name: str, index: tuple[int, ...] | None = None) -> np.ndarray:
+        """
+        Returns the frames where the column changed, the first row counts as a change
+
+        :param name: Name of the column
+        :type name: str
+        :param index: Index of a single value of the column, e.g. (0, 5) for the orange pawns in the clearing 5
+            of the pawns column, defaults to the whole column
+        :type index: tuple[int, ...] | None, optional
+        :return: Frames where the column or the value changed
+        :rtype: np.ndarray
+        """
+        # the change index may be ahead of the mapped rows if the timeline is still written
+        frames = np.asarray(self._changes[name])
+        frames = frames[frames <= self.frames[-1]] if len(self) else frames[:0]
+
+        if index is None or len(frames) == 0:
+            return frames
+
+        # a value can only change where its column did, so only those rows are read
+        rows = np.searchsorted(self.frames, frames)
+        column = self.columns[name]
+        values = column[rows][(slice(None), *index)].reshape(len(rows), -1)
+        previous = column[np.maximum(rows - 1, 0)][(slice(None), *index)].reshape(len(rows), -1)
+
+        changed = _differs(values, previous)
+        changed[rows == 0] = True
+        return frames[changed]
+
+    def to_dataframe(self, start=0, stop: int | None = None):
+        """
+        Returns the rows as a data frame with a column per value, named by the labels, e.g. pawns_orange_5
+
+        :param start: First row, defaults to 0
+        :type start: int, optional
+        :param stop: Row after the last, defaults to the end
+        :type stop: int | None, optional
+        :return: Data frame indexed by the frame, with the time in seconds
+        :rtype: pd.DataFrame
+        """
+        # pandas is only needed for the export, it is slow to import
+        import pandas as pd
+
+        frames = np.asarray(self.frames[start:stop])
+        data = {"time": frames / self.fps if self.fps else np.full(len(frames), np.nan)}
+
+        for name, column in self.columns.items():
+            values = np.asarray(column[start:stop])
+            labels = self.labels[name]
+
+            for index in np.ndindex(*values.shape[1:]):
+                label = "_".join([name] + [labels[axis][i].replace(" ", "_") for axis, i in enumerate(index)])
+                data[label] = values[(slice(None), *index)]
+
+        return pd.DataFrame(data, index=pd.Index(frames, name="frame"))
+
+    def to_parquet(self, path: str, rows=100_000) -> list[str]:
+        """
+        Exports the timeline as a Parquet dataset, a directory with a file per part of the rows, which pandas reads
+        back whole with pd.read_parquet(path). An existing dataset in the directory is replaced. Uses pyarrow
+
+        :param path: Directory of the dataset
+        :type path: str
+        :param rows: Number of rows per file, only that many rows are loaded at once, defaults to 100000
+        :type rows: int, optional
+        :return: Paths of the files
+        :rtype: list[str]
+        """
+        # the parts of an earlier export would be read back along with the new ones
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        paths = []
+
+        for part, start in enumerate(range(0, len(self), rows)):
+            paths.append(f"{path}/part-{part:05d}.parquet")
+            self.to_dataframe(start, start + rows).to_parquet(paths[-1])
+
+        return paths
+
+
+def _map(path: str, dtype: np.dtype, shape: tuple[int, ...] | None = None) -> np.ndarray:
+    # an empty file can not be mapped
+    if shape is None:
+        shape = (os.path.getsize(path) // dtype.itemsize,)
+
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype)
+
+    return np.memmap(path, dtype, "r", shape=shape)
+
+
+def _differs(rows: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    # the missing values are equal to each other
+    differs = rows != previous
+    if np.issubdtype(rows.dtype, np.floating):
+        differs &= ~(np.isnan(rows) & np.isnan(previous))
+
+    return differs.any(axis=1)
@@ -0,0 +1,94 @@
+import bisect
+import json
+
+
+class GroundTruth:
+    """
+    Ground truth of a clip. The state of the game is stored as a list of changes, every change holds the whole
+    state valid from its frame until the next change, and the dice rolls and card draws as frame intervals.
+    Saved as JSON, so it can be written by hand for the real clips:
+
+    {"fps": 24.0, "frames": 240,
+     "states": [{"frame": 0, "score": [7, 6], "buildings": {"orange": [false, ...], "blue": [...]},
+                 "pawns": {"orange": [1, 0, ...], "blue": [...]}}, ...],
+     "events": [{"object": "dice", "start": 60, "stop": 84}, {"object": "card", "start": 160, "stop": 172}]}
+
+    The buildings are listed in the order of the Buildings analyzer, the pawns are counted per clearing.
+    An event matches the detected events of the objects whose name starts with its object
+
+    :var fps: Frame rate of the clip
+    :type fps: float | None
+    :var frames: Number of frames of the clip
+    :type frames: int | None
+    :var states: State changes sorted by the frame
+    :type states: list[dict]
+    :var events: Events as {"object", "start", "stop"}, the stop frame is exclusive
+    :type events: list[dict]
+    """
+    def __init__(self, states: list[dict], events: list[dict], fps: float | None = None, frames: int | None = None):
+        """
+        Initializes the ground truth
+
+        :param states: State changes, each with the frame it is valid from
+        :type states: list[dict]
+        :param events: Events as {"object", "start", "stop"}
+        :type events: list[dict]
+        :param fps: Frame rate of the clip, defaults to None
+        :type fps: float | None, optional
+        :param frames: Number of frames of the clip, defaults to None
+        :type frames: int | None, optional
+        """
+        self.states = sorted(states, key=lambda state: state["frame"])
+        self.events = events
+        self.fps = fps
+        self.frames = frames
+        self._frames = [state["frame"] for state in self.states]
+
+    @classmethod
+    def load(cls, path: str) -> "GroundTruth":
+        """
+        Loads the ground truth from the JSON file
+
+        :param path: Path of the ground truth
+        :type path: str
+        :return: Ground truth
+        :rtype: GroundTruth
+        """
+        with open(path) as f:
+            data = json.load(f)
+
+        return cls(data["states"], data.get("events", []), data.get("fps"), data.get("frames"))
+
+    def save(self, path: str) -> None:
+        """
+        Saves the ground truth as JSON
+
+        :param path: Path of the ground truth
+        :type path: str
+        """
+        with open(path, "w") as f:
+            json.dump({"fps": self.fps, "frames": self.frames, "states": self.states, "events": self.events}, f)
+
+    def state(self, frame_id: int) -> dict | None:
+        """
+        Returns the state of the game on the frame
+
+        :param frame_id: Index of the frame
+        :type frame_id: int
+        :return: State valid on the frame, None before the first change
+        :rtype: dict | None
+        """
+        i = bisect.bisect_right(self._frames, frame_id) - 1
+        return self.states[i] if i >= 0 else None
+
+    def frames_since_change(self, frame_id: int) -> int | None:
+        """
+        Returns the number of frames since the state last changed
+
+        :param frame_id: Index of the frame
+        :type frame_id: int
+        :return: Number of frames, None before the first change
+        :rtype: int | None
+        """
+        state = self.state(frame_id)
+        return frame_id - state["frame"] if state is not None else None
@@ -0,0 +1,409 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.utils.buffers import BufferPool
+
+
+class ThreadedReader:
+    """
+    Decodes the frames of a video capture on a background thread ahead of the consumer.
+    The decoded frames are kept in a bounded queue, so the decoder blocks once it is the given number
+    of frames ahead. Can be used in place of the wrapped cv.VideoCapture.
+
+    The frames are decoded into a ring of reused buffers, a frame stays valid until the consumer
+    reads the next one
+
+    :var reader: Wrapped video capture
+    :type reader: cv.VideoCapture
+    :var depth: Maximum number of decoded frames waiting to be read
+    :type depth: int
+    """
+    def __init__(self, reader: cv.VideoCapture, depth=8):
+        """
+        Wraps the video capture, the decoder thread is started by the first read,
+        so the capture can still be positioned before
+
+        :param reader: Video capture to decode the frames with
+        :type reader: cv.VideoCapture
+        :param depth: Maximum number of decoded frames waiting to be read, defaults to 8
+        :type depth: int, optional
+        """
+        self.reader = reader
+        self.depth = depth
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+        # the queued frames, the one being read by the consumer and the one being decoded
+        self._pool = BufferPool({"frame": depth + 2})
+
+    def isOpened(self) -> bool:
+        return self.reader.isOpened()
+
+    def get(self, prop_id: int) -> float:
+        return self.reader.get(prop_id)
+
+    def set(self, prop_id: int, value: float) -> bool:
+        if self._thread is not None:
+            raise RuntimeError("The reader can not be positioned once the decoding started")
+
+        return self.reader.set(prop_id, value)
+
+    def read(self) -> tuple[bool, np.ndarray | None]:
+        """
+        Returns the next decoded frame, blocks until it is available
+
+        :return: Whether the frame was read, the frame
+        :rtype: tuple[bool, np.ndarray | None]
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._decode, name="decoder", daemon=True)
+            self._thread.start()
+
+        ret, frame = self._queue.get()
+
+        # the end of the stream is put back so that the following reads fail as well
+        if not ret:
+            self._queue.put((False, None))
+
+        return ret, frame
+
+    def release(self) -> None:
+        """
+        Stops the decoder thread and releases the wrapped capture
+        """
+        self._stop.set()
+
+        if self._thread is not None:
+            # unblock the decoder waiting for a free slot
+            while self._thread.is_alive():
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._thread.join(0.01)
+
+        self.reader.release()
+
+    def _decode(self) -> None:
+        ret, frame = True, None
+
+        while ret and not self._stop.is_set():
+            buffer = self._pool.get("frame", frame.shape) if frame is not None else None
+            ret, frame = self.reader.read(buffer)
+            item = (ret, frame if ret else None)
+
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+
+class ThreadedWriter:
+    """
+    Encodes the frames with a video writer on a background thread.
+    The frames waiting to be encoded are kept in a bounded queue, so the producer blocks once the encoder
+    is the given number of frames behind. Can be used in place of the wrapped writer
+
+    :var writer: Wrapped video writer
+    :type writer: cv.VideoWriter
+    :var depth: Maximum number of frames waiting to be encoded
+    :type depth: int
+    """
+    def __init__(self, writer: cv.VideoWriter, depth=8):
+        """
+        Wraps the video writer and starts the encoder thread
+
+        :param writer: Video writer to encode the frames with
+        :type writer: cv.VideoWriter
+        :param depth: Maximum number of frames waiting to be encoded, defaults to 8
+        :type depth: int, optional
+        """
+        self.writer = writer
+        self.depth = depth
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._discard = threading.Event()
+        self._thread = threading.Thread(target=self._encode, name="encoder", daemon=True)
+        self._thread.start()
+
+    def isOpened(self) -> bool:
+        return self.writer.isOpened()
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Queues the frame for encoding, the frame must not be modified afterwards
+
+        :param frame: Frame to be encoded
+        :type frame: np.ndarray
+        """
+        self._raise_error()
+        self._queue.put(frame)
+
+    def release(self) -> None:
+        """
+        Encodes the remaining frames, stops the encoder thread and releases the wrapped writer.
+        Raises the error of the encoder if it failed, the output of a failed encoder is discarded
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+        if self._error is not None:
+            self._discard_writer()
+            raise self._error
+
+        self.writer.release()
+
+    def discard(self) -> None:
+        """
+        Drops the frames waiting to be encoded, stops the encoder thread and discards the output of the wrapped
+        writer if it supports it, otherwise only releases it. Never raises the error of the encoder
+        """
+        self._discard.set()
+
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+        self._discard_writer()
+
+    def _encode(self) -> None:
+        while (frame := self._queue.get()) is not None:
+            if self._error is not None or self._discard.is_set():
+                continue
+
+            try:
+                self.writer.write(frame)
+            except Exception as e:
+                # the error is raised in the producer, the remaining frames are only drained
+                self._error = e
+
+    def _raise_error(self) -> None:
+        # the writer stays failed, the frames queued after the error are never encoded
+        if self._error is not None:
+            raise self._error
+
+    def _discard_writer(self) -> None:
+        if hasattr(self.writer, "discard"):
+            self.writer.discard()
+        else:
+            self.writer.release()
+
+
+class FFmpegWriter:
+    """
+    Encodes the frames directly into an H.264 MP4 by streaming them as raw video into a single ffmpeg process.
+    The video is encoded into a partial file, renamed to the output path once the encoding is released
+    and removed if it is discarded, so an interrupted encoding never leaves a playable but short output.
+    Can be used in place of cv.VideoWriter
+
+    :var path: Path of the output video
+    :type path: str
+    :var partial_path: Path of the video while it is encoded
+    :type partial_path: str
+    :var fps: Frame rate of the output video
+    :type fps: float
+    :var size: Size of the written frames (width, height)
+    :type size: tuple[int, int]
+    :var output_size: Size of the output video (width, height)
+    :type output_size: tuple[int, int]
+    """
+    def __init__(self, path: str, fps: float, size: tuple[int, int], preset="fast", crf=23, scale: float | None = None,
+                 ffmpeg="ffmpeg"):
+        """
+        Starts the ffmpeg process, the writer is not opened if ffmpeg can not be started
+
+        :param path: Path of the output video
+        :type path: str
+        :param fps: Frame rate of the output video
+        :type fps: float
+        :param size: Size of the written frames (width, height)
+        :type size: tuple[int, int]
+        :param preset: x264 preset, defaults to "fast"
+        :type preset: str, optional
+        :param crf: x264 constant rate factor, defaults to 23
+        :type crf: int, optional
+        :param scale: Factor the output is downscaled by while encoding, defaults to None
+        :type scale: float | None, optional
+        :param ffmpeg: Path of the ffmpeg executable, defaults to "ffmpeg"
+        :type ffmpeg: str, optional
+        """
+        self.path = path
+        self.partial_path = f"{path}.part"
+        self.fps = fps
+        self.size = size
+
+        # yuv420p needs even dimensions
+        if scale is not None:
+            self.output_size = (int(size[0] * scale) // 2 * 2, int(size[1] * scale) // 2 * 2)
+        else:
+            self.output_size = size
+
+        command = [ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+                   "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"]
+
+        if self.output_size != size:
+            command += ["-vf", f"scale={self.output_size[0]}:{self.output_size[1]}"]
+
+        # the container is given explicitly, it can not be guessed from the extension of the partial file
+        command += ["-movflags", "+faststart", "-f", "mp4", self.partial_path]
+
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except OSError:
+            self._process = None
+
+    def isOpened(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Streams the frame into ffmpeg
+
+        :param frame: Frame of the written size in the BGR color space
+        :type frame: np.ndarray
+        """
+        if frame.shape[1::-1] != self.size:
+            raise ValueError(f"Expected a frame of size {self.size}, got {frame.shape[1::-1]}")
+
+        self._process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+
+    def release(self) -> None:
+        """
+        Finishes the encoding, waits for ffmpeg to exit and moves the video to the output path
+        """
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
+        process.stdin.close()
+
+        if process.wait() != 0:
+            self._remove_partial()
+            raise RuntimeError(f"ffmpeg failed to encode {self.path} (exit code {process.returncode})")
+
+        os.replace(self.partial_path, self.path)
+
+    def discard(self) -> None:
+        """
+        Stops ffmpeg without finishing the encoding and removes the partial video
+        """
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
+        process.kill()
+        process.wait()
+
+        # the pipe may have broken already when ffmpeg was killed
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+
+        self._remove_partial()
+
+    def _remove_partial(self) -> None:
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+class LiveSource:
+    """
+    Captures the frames of a live source on a background thread and only keeps the freshest one.
+    A consumer slower than the source never falls behind, the frames it had no time for are dropped.
+    Video files are replayed at their native frame rate as a stand-in for a camera
+
+    :var capture: Captured source
+    :type capture: cv.VideoCapture
+    :var fps: Frame rate of the source
+    :type fps: float
+    :var dropped: Number of captured frames that were never read
+    :type dropped: int
+    """
+    def __init__(self, capture: cv.VideoCapture, realtime=True):
+        """
+        Starts capturing the source
+
+        :param capture: Source to capture, a camera or a video file
+        :type capture: cv.VideoCapture
+        :param realtime: Whether to pace the capture at the frame rate of the source, needed for video files,
+            defaults to True
+        :type realtime: bool, optional
+        """
+        self.capture = capture
+        self.fps = capture.get(cv.CAP_PROP_FPS) or 30.0
+        self.realtime = realtime
+        self.dropped = 0
+
+        self._latest = None
+        self._ended = False
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._capture, name="capture", daemon=True)
+        self._thread.start()
+
+    def read(self) -> tuple[bool, np.ndarray | None, int, float]:
+        """
+        Returns the freshest frame not read yet, blocks until there is one
+
+        :return: Whether the frame was read, the frame, its index in the source and the time it was captured
+            (time.perf_counter)
+        :rtype: tuple[bool, np.ndarray | None, int, float]
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._latest is not None or self._ended)
+
+            if self._latest is None:
+                return False, None, -1, 0.0
+
+            (frame, frame_id, captured), self._latest = self._latest, None
+            return True, frame, frame_id, captured
+
+    def release(self) -> None:
+        """
+        Stops the capture and releases the source
+        """
+        self._stop.set()
+        self._thread.join()
+        self.capture.release()
+
+    def _capture(self) -> None:
+        frame_id = 0
+        started = time.perf_counter()
+
+        while not self._stop.is_set():
+            if self.realtime:
+                delay = started + frame_id / self.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            ret, frame = self.capture.read()
+
+            with self._condition:
+                if not ret:
+                    self._ended = True
+                    self._condition.notify_all()
+                    return
+
+                if self._latest is not None:
+                    self.dropped += 1
+
+                self._latest = (frame, frame_id, time.perf_counter())
+                self._condition.notify_all()
+
+            frame_id += 1
+
+        with self._condition:
+            self._ended = True
+            self._condition.notify_all()
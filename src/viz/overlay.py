@@ -0,0 +1,90 @@
+from typing import Callable, Hashable
+
+import cv2 as cv
+import numpy as np
+
+
+def opaque(color: tuple[int, int, int]) -> tuple[int, int, int, int]:
+    """
+    Returns the BGRA color of the BGR color drawn into a layer
+
+    :param color: BGR color
+    :type color: tuple[int, int, int]
+    :return: Opaque BGRA color
+    :rtype: tuple[int, int, int, int]
+    """
+    return *color, 255
+
+
+class OverlayLayer:
+    """
+    Cached layer of the annotations that only change with the board geometry or the analyzed state.
+    The annotations are drawn into a transparent BGRA layer once per key, every frame the drawn pixels are copied
+    into the frame with a single masked copy of their bounding rectangle, so the cost per frame does not depend on
+    the number of the annotated contours. The annotations must be drawn without anti-aliasing,
+    as the alpha channel is only used as a mask
+
+    :var key: Key of the cached layer, e.g. the versions of the geometry and the state
+    :type key: Hashable
+    :var image: BGRA layer, opaque where drawn
+    :type image: np.ndarray | None
+    :var rect: Bounding rectangle of the drawn pixels
+    :type rect: tuple[int, int, int, int]
+    """
+    def __init__(self):
+        """
+        Initializes the empty layer
+        """
+        self.key = None
+        self.image = None
+        self.rect = (0, 0, 0, 0)
+
+        self._color = None
+        self._mask = None
+
+    def draw(self, frame: np.ndarray, key: Hashable, render: Callable[[np.ndarray], None]) -> np.ndarray:
+        """
+        Draws the layer on the frame, the layer is rendered anew if the key or the frame shape changed
+
+        :param frame: Frame to draw the layer on
+        :type frame: np.ndarray
+        :param key: Key of the annotations, equal keys must render equal annotations
+        :type key: Hashable
+        :param render: Draws the annotations into the given BGRA layer with opaque colors
+        :type render: Callable[[np.ndarray], None]
+        :return: Frame with the layer drawn on it
+        :rtype: np.ndarray
+        """
+        if self.image is None or self.image.shape[:2] != frame.shape[:2] or self.key != key:
+            self.render(frame.shape, key, render)
+
+        x, y, w, h = self.rect
+        if w > 0 and h > 0:
+            cv.copyTo(self._color, self._mask, frame[y:y + h, x:x + w])
+
+        return frame
+
+    def render(self, shape: tuple[int, ...], key: Hashable, render: Callable[[np.ndarray], None]) -> None:
+        """
+        Renders the layer
+
+        :param shape: Shape of the frames
+        :type shape: tuple[int, ...]
+        :param key: Key of the annotations
+        :type key: Hashable
+        :param render: Draws the annotations into the given BGRA layer with opaque colors
+        :type render: Callable[[np.ndarray], None]
+        """
+        if self.image is None or self.image.shape[:2] != shape[:2]:
+            self.image = np.zeros((*shape[:2], 4), np.uint8)
+        else:
+            self.image.fill(0)
+
+        render(self.image)
+
+        # only the drawn part of the layer is kept for the copy
+        alpha = np.ascontiguousarray(self.image[:, :, 3])
+        x, y, w, h = self.rect = cv.boundingRect(alpha)
+        self._color = np.ascontiguousarray(self.image[y:y + h, x:x + w, :3])
+        self._mask = alpha[y:y + h, x:x + w].copy()
+        self.key = key